@@ -1,8 +1,25 @@
-from nomeroff_net.pipes.number_plate_text_readers.text_detector import TextDetector
-from nomeroff_net.pipes.number_plate_classificators.options_detector import OptionsDetector
-from nomeroff_net.pipes.number_plate_localizators.yolo_kp_detector import Detector
+import importlib
 
-from nomeroff_net.pipelines import pipeline
+# heavy modules (torch, pytorch_lightning, ultralytics, ...) are imported on the first attribute access (PEP 562)
+_lazy_attributes = {
+    "TextDetector": "nomeroff_net.pipes.number_plate_text_readers.text_detector",
+    "OptionsDetector": "nomeroff_net.pipes.number_plate_classificators.options_detector",
+    "Detector": "nomeroff_net.pipes.number_plate_localizators.yolo_kp_detector",
+    "pipeline": "nomeroff_net.pipelines",
+}
+
+
+def __getattr__(name):
+    module_name = _lazy_attributes.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
 
 
 __version__ = "4.0.0"
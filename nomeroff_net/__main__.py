@@ -0,0 +1,49 @@
+"""
+Nomeroff Net command line
+
+    $ python3 -m nomeroff_net bundle build ./data/nomeroff_net.bundle --ocr_presets eu_efficientnet_b2
+    $ python3 -m nomeroff_net bundle load ./data/nomeroff_net.bundle
+"""
+import json
+import argparse
+
+
+def parse_args(args=None):
+    ap = argparse.ArgumentParser(prog="nomeroff_net")
+    commands = ap.add_subparsers(dest="command", required=True)
+
+    bundle = commands.add_parser("bundle", help="Single-file model bundle for offline deployment")
+    bundle_commands = bundle.add_subparsers(dest="bundle_command", required=True)
+
+    build = bundle_commands.add_parser("build", help="Download models and pack them into one file")
+    build.add_argument("path", type=str, help="Bundle path")
+    build.add_argument("--detector", default="yolov11x", type=str, help="Detector model name")
+    build.add_argument("--options", default="numberplate_options", type=str,
+                       help="Options classifier model name, empty to skip")
+    build.add_argument("--ocr_presets", default=None, type=str,
+                       help="Comma separated OCR presets, all default presets if not set")
+
+    load = bundle_commands.add_parser("load", help="Load the bundle and print its models")
+    load.add_argument("path", type=str, help="Bundle path")
+    load.add_argument("--cache_dir", default=None, type=str, help="Directory for packed detector weights")
+    return ap.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.command == "bundle":
+        from nomeroff_net.tools.bundle import build_bundle, load_bundle
+
+        if args.bundle_command == "build":
+            build_bundle(args.path,
+                         detector=args.detector,
+                         options=args.options or None,
+                         ocr_presets=args.ocr_presets.split(",") if args.ocr_presets else None)
+        bundle = load_bundle(args.path, cache_dir=getattr(args, "cache_dir", None))
+        for name in bundle.models:
+            bundle.get_model_path(name)
+        print(json.dumps(bundle.get_stat(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
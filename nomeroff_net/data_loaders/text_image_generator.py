@@ -11,8 +11,6 @@ from torchvision import transforms
 from nomeroff_net.tools.mcm import get_device_torch
 from nomeroff_net.tools.ocr_tools import is_valid_str
 
-device_torch = get_device_torch()
-
 
 class TextImageGenerator(object):
     def __init__(self,
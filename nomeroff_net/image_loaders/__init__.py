@@ -1,4 +1,4 @@
-from .base import BaseImageLoader
+from .base import BaseImageLoader, ScaledImage
 from .opencv_loader import OpencvImageLoader
 from .pillow_loader import PillowImageLoader
 from .turbo_loader import TurboImageLoader
@@ -1,15 +1,235 @@
 """
-python3 nomeroff_net/image_loaders/base.py
+python3 -m nomeroff_net.image_loaders.base -f nomeroff_net/image_loaders/base.py
 """
+import os
+import mmap
+import time
+import threading
+import numpy as np
 from abc import abstractmethod
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from nomeroff_net.tools.errors import ImageLoaderError
+from nomeroff_net.tools.pipeline_tools import get_executor
+
+# encoded images in memory, decoded by load_bytes
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+
+def describe_item(item: Any) -> str:
+    if isinstance(item, (str, os.PathLike)):
+        return os.fspath(item)
+    if isinstance(item, BUFFER_TYPES):
+        return f"<{type(item).__name__} of {len(item)} bytes>"
+    return f"<{type(item).__name__}>"
 
 
 class BaseImageLoader(object):
+    # guards only the creation of the per-loader stat, see init_stat
+    _stat_init_lock = threading.Lock()
+
+    def __init__(self):
+        self.init_stat()
+
+    def init_stat(self) -> None:
+        """
+        Decode stat of load_batch, created on the first use for loaders that do not call BaseImageLoader.__init__
+        """
+        if "_stat_lock" in self.__dict__:
+            return
+        with BaseImageLoader._stat_init_lock:
+            if "_stat_lock" not in self.__dict__:
+                self.stat = Counter()
+                self.last_errors = deque(maxlen=10)
+                self._stat_lock = threading.Lock()
 
     @abstractmethod
     def load(self, **kwargs):
         raise NotImplementedError("load not implemented")
 
+    def load_bytes(self, data) -> np.ndarray:
+        """
+        Decode the encoded image (jpeg, png, ...) from bytes, bytearray, memoryview, mmap
+        or any other buffer without copying it, RGB result
+        """
+        import cv2
+
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Can not decode the image buffer")
+        return img[..., ::-1]
+
+    def load_any(self, item: Any) -> Any:
+        """
+        Dispatch on the input type: decoded numpy images are returned as is, buffers go to load_bytes,
+        file-like objects are read (io.BytesIO through its buffer, without a copy), paths go to load
+        """
+        if isinstance(item, np.ndarray):
+            return item
+        if isinstance(item, BUFFER_TYPES):
+            return self.load_bytes(item)
+        if hasattr(item, "getbuffer"):
+            with item.getbuffer() as data:
+                return self.load_bytes(data)
+        if hasattr(item, "read"):
+            return self.load_bytes(item.read())
+        return self.load(item)
+
+    @staticmethod
+    def readahead(items: Iterable) -> None:
+        """
+        Ask the kernel to read files of the paths in the background (posix_fadvise WILLNEED, Linux only)
+        """
+        if not hasattr(os, "posix_fadvise"):
+            return
+        for item in items:
+            if not isinstance(item, (str, os.PathLike)):
+                continue
+            try:
+                fd = os.open(item, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+
+    def _load_timed(self, item: Any) -> Tuple:
+        start_time = time.perf_counter()
+        try:
+            image, error = self.load_any(item), None
+        except Exception as e:
+            image, error = None, e
+        size = 0
+        if isinstance(item, BUFFER_TYPES):
+            size = len(item)
+        elif isinstance(item, (str, os.PathLike)) and error is None:
+            try:
+                size = os.path.getsize(item)
+            except OSError:
+                pass
+        return image, error, time.perf_counter() - start_time, size
+
+    def load_batch(self, items: Iterable, max_workers: int = 1, readahead: bool = False,
+                   on_error: str = "raise") -> List:
+        """
+        Decode the batch in the persistent thread pool of max_workers threads,
+        cv2, turbojpeg and pillow release the GIL while decoding
+        Args:
+            items (): paths, buffers, file-like objects or numpy images (see load_any)
+            max_workers (): decode threads, 1 decodes in the calling thread
+            readahead (): read the files of the batch ahead of decoding, see readahead
+            on_error (): "raise" ImageLoaderError of the first failed item when the batch is decoded,
+                         "none" puts None for failed items, errors are kept in get_stat()["last_errors"]
+        """
+        if on_error not in ("raise", "none"):
+            raise ValueError(f"on_error must by in ['raise', 'none'], got {on_error}")
+        items = list(items)
+        start_time = time.perf_counter()
+        if readahead:
+            self.readahead(items)
+        if max_workers > 1 and len(items) > 1:
+            outputs = list(get_executor("thread", max_workers, name="image_loader").map(self._load_timed, items))
+        else:
+            outputs = [self._load_timed(item) for item in items]
+        wall_time = time.perf_counter() - start_time
+
+        errors = [(item, error) for item, (_, error, _, _) in zip(items, outputs) if error is not None]
+        self.init_stat()
+        with self._stat_lock:
+            self.stat["batches"] += 1
+            self.stat["images"] += len(items)
+            self.stat["errors"] += len(errors)
+            self.stat["bytes"] += sum(output[3] for output in outputs)
+            self.stat["decode_time"] += sum(output[2] for output in outputs)
+            self.stat["wall_time"] += wall_time
+            self.last_errors.extend((describe_item(item), repr(error)) for item, error in errors)
+        if errors and on_error == "raise":
+            item, error = errors[0]
+            raise ImageLoaderError(f"Can not load {describe_item(item)}: {error!r}") from error
+        return [image for image, _, _, _ in outputs]
+
+    def get_stat(self) -> Dict:
+        """
+        Decode throughput of load_batch: images and MB per second of wall time,
+        mean decode time of one image and parallelism (decode time / wall time)
+        """
+        self.init_stat()
+        with self._stat_lock:
+            stat = Counter(self.stat)
+            last_errors = list(self.last_errors)
+        wall_time = stat["wall_time"] or float("inf")
+        return {
+            "batches": stat["batches"],
+            "images": stat["images"],
+            "errors": stat["errors"],
+            "images_per_sec": stat["images"] / wall_time,
+            "mb_per_sec": stat["bytes"] / 2 ** 20 / wall_time,
+            "mean_decode_ms": stat["decode_time"] / (stat["images"] or 1) * 1000,
+            "parallelism": stat["decode_time"] / wall_time,
+            "last_errors": last_errors,
+        }
+
+    def clear_stat(self) -> None:
+        self.init_stat()
+        with self._stat_lock:
+            self.stat.clear()
+            self.last_errors.clear()
+
+
+class ScaledImage(np.ndarray):
+    """
+    Image decoded at reduced resolution:
+    scale (sx, sy) maps its coordinates to the full resolution image of full_shape,
+    crop() reads regions of the full resolution image.
+    Views and copies of it are plain reduced images (scale is None).
+    """
+
+    def __new__(cls, image: np.ndarray, scale: Tuple[float, float], full_shape: Tuple,
+                roi_loader: Callable[[int, int, int, int], np.ndarray]):
+        obj = np.asarray(image).view(cls)
+        obj.scale = scale
+        obj.full_shape = full_shape
+        obj.roi_loader = roi_loader
+        return obj
+
+    def __array_finalize__(self, obj):
+        self.scale = None
+        self.full_shape = None
+        self.roi_loader = None
+
+    def crop(self, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+        """
+        Full resolution region [y1:y2, x1:x2]
+        """
+        height, width = self.full_shape[:2]
+        x1, x2 = max(0, min(x1, width)), max(0, min(x2, width))
+        y1, y2 = max(0, min(y1, height)), max(0, min(y2, height))
+        if x2 <= x1 or y2 <= y1:
+            return np.zeros((max(y2 - y1, 0), max(x2 - x1, 0), *self.full_shape[2:]), dtype=self.dtype)
+        return self.roi_loader(x1, y1, x2, y2)
+
 
 if __name__ == "__main__":
     base_image_loader = BaseImageLoader()
+    full_image = np.arange(40 * 60 * 3, dtype=np.uint8).reshape((40, 60, 3))
+    scaled_image = ScaledImage(full_image[::2, ::2], (2., 2.), full_image.shape,
+                               lambda x1, y1, x2, y2: full_image[y1:y2, x1:x2])
+    assert scaled_image.shape == (20, 30, 3) and scaled_image[:10].scale is None
+    assert np.array_equal(scaled_image.crop(10, 4, 70, 8), full_image[4:8, 10:60])
+    assert base_image_loader.load_any(full_image) is full_image
+    images = base_image_loader.load_batch([full_image, b"not an image", full_image], max_workers=2, on_error="none")
+    assert images[0] is full_image and images[1] is None
+    assert base_image_loader.get_stat()["errors"] == 1
+
+    # custom loaders that do not call BaseImageLoader.__init__ keep working
+    class CustomImageLoader(BaseImageLoader):
+        def __init__(self):
+            self.images = {"a": full_image}
+
+        def load(self, img_path):
+            return self.images[img_path]
+
+    custom_image_loader = CustomImageLoader()
+    assert custom_image_loader.load_batch(["a", "a"], max_workers=2)[1] is full_image
+    assert custom_image_loader.get_stat()["images"] == 2
@@ -6,6 +6,9 @@ from .base import BaseImageLoader
 
 
 class DumpyImageLoader(BaseImageLoader):
+    """
+    Inputs are decoded images, encoded buffers are decoded by opencv (see BaseImageLoader.load_any)
+    """
 
     def load(self, img):
         return img
@@ -3,6 +3,7 @@ python3 -m nomeroff_net.image_loaders.opencv_loader
 """
 import os
 import cv2
+import numpy as np
 from .base import BaseImageLoader
 
 
@@ -19,3 +20,5 @@ if __name__ == "__main__":
 
     image_loader = OpencvImageLoader()
     loaded_img = image_loader.load(img_file)
+    with open(img_file, "rb") as f:
+        assert np.array_equal(image_loader.load_any(memoryview(f.read())), loaded_img)
@@ -1,6 +1,7 @@
 """
 python3 -m nomeroff_net.image_loaders.pillow_loader
 """
+import io
 import os
 import numpy as np
 from PIL import Image
@@ -13,6 +14,12 @@ class PillowImageLoader(BaseImageLoader):
         img = np.asarray(im)
         return img
 
+    def load_bytes(self, data):
+        # io.BytesIO shares bytes objects, other buffers are copied once
+        im = Image.open(io.BytesIO(data))
+        img = np.asarray(im)
+        return img
+
 
 if __name__ == "__main__":
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -20,3 +27,5 @@ if __name__ == "__main__":
 
     image_loader = PillowImageLoader()
     loaded_img = image_loader.load(img_file)
+    with open(img_file, "rb") as f:
+        assert np.array_equal(image_loader.load_any(f), loaded_img)
@@ -2,19 +2,78 @@
 python3 -m nomeroff_net.image_loaders.turbo_loader
 """
 import os
+import math
+import numpy as np
 from turbojpeg import TurboJPEG
 from turbojpeg import TJPF_RGB
-from .base import BaseImageLoader
+from .base import BaseImageLoader, ScaledImage
+
+# libjpeg-turbo DCT scaling factors, from the smallest image
+SCALING_FACTORS = ((1, 8), (1, 4), (1, 2), (1, 1))
+
+# MCU block size by TJSAMP_* chroma subsampling, crops must start on the MCU boundary
+MCU_WIDTH = (8, 16, 16, 8, 8, 32, 8)
+MCU_HEIGHT = (8, 8, 16, 8, 16, 8, 32)
 
 
 class TurboImageLoader(BaseImageLoader):
-    def __init__(self, **kwargs):
+    def __init__(self, decode_size: int = None, **kwargs):
+        """
+        Args:
+            decode_size (): detector input size (640 for yolo), JPEGs are decoded with DCT scaling (1/2, 1/4, 1/8)
+                            to the smallest size with the longest side at or above it, as ScaledImage:
+                            bboxes are mapped back by its scale and plate regions are re-decoded
+                            at full resolution. Images in results stay reduced (ScaledImage with scale),
+                            while bboxes and keypoints are of the full image: map them to the returned image
+                            with nomeroff_net.tools.unscale_points(points, image.scale). None decodes full images.
+        """
+        super().__init__()
         self.jpeg = TurboJPEG(**kwargs)
+        self.decode_size = decode_size
+
+    def get_scaling_factor(self, width: int, height: int) -> tuple:
+        """
+        Smallest DCT scaling factor that keeps the longest side at or above decode_size
+        """
+        for num, denom in SCALING_FACTORS:
+            if math.ceil(max(width, height) * num / denom) >= self.decode_size:
+                return num, denom
+        return 1, 1
+
+    def load_roi(self, data: bytes, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+        """
+        Decode only the region [y1:y2, x1:x2] of the JPEG at full resolution
+        (lossless crop from the MCU boundary), the full image is decoded if the crop is not possible
+        """
+        _, _, jpeg_subsample, _ = self.jpeg.decode_header(data)
+        mcu_width, mcu_height = MCU_WIDTH[jpeg_subsample], MCU_HEIGHT[jpeg_subsample]
+        x0, y0 = x1 // mcu_width * mcu_width, y1 // mcu_height * mcu_height
+        try:
+            roi = self.jpeg.decode(self.jpeg.crop(data, x0, y0, x2 - x0, y2 - y0), TJPF_RGB)
+        except (OSError, ValueError):
+            x0, y0 = 0, 0
+            roi = self.jpeg.decode(data, TJPF_RGB)
+        return roi[y1 - y0:y2 - y0, x1 - x0:x2 - x0]
 
     def load(self, img_path):
         with open(img_path, 'rb') as in_file:
-            img = self.jpeg.decode(in_file.read(), TJPF_RGB)
-        return img
+            data = in_file.read()
+        return self.load_bytes(data)
+
+    def load_bytes(self, data):
+        if self.decode_size is None:
+            return self.jpeg.decode(data, TJPF_RGB)
+        width, height, _, _ = self.jpeg.decode_header(data)
+        scaling_factor = self.get_scaling_factor(width, height)
+        if scaling_factor == (1, 1):
+            return self.jpeg.decode(data, TJPF_RGB)
+        img = self.jpeg.decode(data, TJPF_RGB, scaling_factor=scaling_factor)
+        # plate regions are decoded later, the buffer of the caller may be reused by then
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        scale = (width / img.shape[1], height / img.shape[0])
+        return ScaledImage(img, scale, (height, width, img.shape[2]),
+                           lambda x1, y1, x2, y2: self.load_roi(data, x1, y1, x2, y2))
 
 
 if __name__ == "__main__":
@@ -23,3 +82,14 @@ if __name__ == "__main__":
 
     image_loader = TurboImageLoader()
     loaded_img = image_loader.load(img_file)
+    with open(img_file, "rb") as f:
+        assert np.array_equal(image_loader.load_any(memoryview(f.read())), loaded_img)
+
+    image_loader = TurboImageLoader(decode_size=256)
+    scaled_img = image_loader.load(img_file)
+    if isinstance(scaled_img, ScaledImage):
+        assert max(scaled_img.shape[:2]) >= 256 and scaled_img.full_shape == loaded_img.shape
+        x1, y1 = loaded_img.shape[1] // 3, loaded_img.shape[0] // 3
+        roi = scaled_img.crop(x1, y1, x1 + 100, y1 + 30)
+        assert roi.shape == (30, 100, 3)
+        assert np.abs(roi.astype(int) - loaded_img[y1:y1 + 30, x1:x1 + 100]).mean() < 2
@@ -4,7 +4,7 @@ python3 -m nomeroff_net.nnmodels.ocr_model -f nomeroff_net/nnmodels/ocr_model.py
 """
 import torch
 import torch.nn as nn
-from typing import List, Any
+from typing import List, Any, Tuple
 import pytorch_lightning as pl
 from torchvision.models import resnet18
 
@@ -12,6 +12,10 @@ from nomeroff_net.tools.ocr_tools import plot_loss, print_prediction
 from nomeroff_net.tools.mcm import get_device_torch
 
 
+# (backbone name, color_channels, height, width) -> (c, h, w) of the backbone output
+_backbone_shapes = {}
+
+
 def weights_init(m):
     classname = m.__class__.__name__
     if classname.find('Conv') != -1:
@@ -63,7 +67,14 @@ class NPOcrNet(pl.LightningModule):
                  clip_norm: int = 5,
                  hidden_size=32,
                  linear_size=512,
-                 backbone=None):
+                 backbone=None,
+                 pretrained_backbone: bool = True,
+                 backbone_shape: Tuple[int, int, int] = None):
+        """
+        Args:
+            pretrained_backbone (): init backbone with ImageNet weights, not needed when weights are loaded after
+            backbone_shape (): (c, h, w) of the backbone output, computed with a dummy forward if None
+        """
         super().__init__()
         self.save_hyperparameters()
 
@@ -87,7 +98,7 @@ class NPOcrNet(pl.LightningModule):
         # convolutions
         if backbone is None:
             backbone = resnet18
-        conv_nn = backbone(pretrained=True)
+        conv_nn = backbone(pretrained=pretrained_backbone)
         if 'resnet' in str(backbone):
             conv_modules = list(conv_nn.children())[:-3]
         elif 'efficientnet' in str(backbone):
@@ -97,7 +108,15 @@ class NPOcrNet(pl.LightningModule):
         else:
             raise NotImplementedError(backbone)
         self.conv_nn = nn.Sequential(*conv_modules)
-        _, backbone_c, backbone_h, backbone_w = self.conv_nn(torch.rand((1, color_channels, height, width))).shape
+        shape_key = (backbone.__name__, color_channels, height, width)
+        if backbone_shape is None:
+            backbone_shape = _backbone_shapes.get(shape_key)
+        if backbone_shape is None:
+            with torch.no_grad():
+                backbone_shape = tuple(self.conv_nn(torch.rand((1, color_channels, height, width))).shape[1:])
+        backbone_c, backbone_h, backbone_w = _backbone_shapes[shape_key] = tuple(backbone_shape)
+        # saved to checkpoint hyper parameters
+        self.hparams.backbone_shape = (backbone_c, backbone_h, backbone_w)
 
         assert backbone_w > max_text_len
 
@@ -12,46 +12,62 @@ Examples:
 The module contains the following functions:
 
 - `check_task(task)` - Returns task options if task supported? else raise KeyError.
-- `pipeline(task, image_loader, pipeline_kwargs, **kwargs)` - Returns Pipeline task object.
+  Task implementation is imported from "impl_path" on the first use.
+- `pipeline(task, image_loader, pipeline_kwargs, bundle, **kwargs)` - Returns Pipeline task object.
 """
-from typing import Any, Dict, Optional, Union
-
-from nomeroff_net.pipelines.base \
-    import Pipeline
-from nomeroff_net.image_loaders \
-    import BaseImageLoader
-from nomeroff_net.pipelines.number_plate_localization \
-    import NumberPlateLocalization
-from nomeroff_net.pipelines.number_plate_filling \
-    import NumberPlateFilling
-from nomeroff_net.pipelines.number_plate_classification \
-    import NumberPlateClassification
-from nomeroff_net.pipelines.number_plate_text_reading \
-    import NumberPlateTextReading
-from nomeroff_net.pipelines.number_plate_detection_and_reading \
-    import NumberPlateDetectionAndReading
-from nomeroff_net.pipelines.number_plate_detection_and_reading_runtime \
-    import NumberPlateDetectionAndReadingRuntime
+import inspect
+import importlib
+from typing import Any, Dict, Optional, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from nomeroff_net.pipelines.base import Pipeline
+    from nomeroff_net.image_loaders import BaseImageLoader
+
+# pipeline classes are imported on the first use (PEP 562), so `import nomeroff_net` is fast
+_lazy_attributes = {
+    "Pipeline": "nomeroff_net.pipelines.base",
+    "NumberPlateLocalization": "nomeroff_net.pipelines.number_plate_localization",
+    "NumberPlateFilling": "nomeroff_net.pipelines.number_plate_filling",
+    "NumberPlateClassification": "nomeroff_net.pipelines.number_plate_classification",
+    "NumberPlateTextReading": "nomeroff_net.pipelines.number_plate_text_reading",
+    "NumberPlateDetectionAndReading": "nomeroff_net.pipelines.number_plate_detection_and_reading",
+    "NumberPlateDetectionAndReadingRuntime": "nomeroff_net.pipelines.number_plate_detection_and_reading_runtime",
+    "ProcessPoolPipeline": "nomeroff_net.pipelines.process_pool",
+}
+
+
+def __getattr__(name):
+    module_name = _lazy_attributes.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
 
 
 SUPPORTED_TASKS = {
     "number_plate_localization": {
-        "impl": NumberPlateLocalization,
+        "impl_path": "nomeroff_net.pipelines.number_plate_localization.NumberPlateLocalization",
     },
     "number_plate_filling": {
-        "impl": NumberPlateFilling
+        "impl_path": "nomeroff_net.pipelines.number_plate_filling.NumberPlateFilling",
     },
     "number_plate_classification": {
-        "impl": NumberPlateClassification
+        "impl_path": "nomeroff_net.pipelines.number_plate_classification.NumberPlateClassification",
     },
     "number_plate_text_reading": {
-        "impl": NumberPlateTextReading
+        "impl_path": "nomeroff_net.pipelines.number_plate_text_reading.NumberPlateTextReading",
     },
     "number_plate_detection_and_reading": {
-        "impl": NumberPlateDetectionAndReading
+        "impl_path": "nomeroff_net.pipelines.number_plate_detection_and_reading.NumberPlateDetectionAndReading",
     },
     "number_plate_detection_and_reading_runtime": {
-        "impl": NumberPlateDetectionAndReadingRuntime
+        "impl_path": "nomeroff_net.pipelines.number_plate_detection_and_reading_runtime."
+                     "NumberPlateDetectionAndReadingRuntime",
     },
 }
 
@@ -67,6 +83,9 @@ def check_task(task: str) -> Dict:
     """
     if task in SUPPORTED_TASKS:
         targeted_task = SUPPORTED_TASKS[task]
+        if "impl" not in targeted_task:
+            module_name, class_name = targeted_task["impl_path"].rsplit(".", 1)
+            targeted_task["impl"] = getattr(importlib.import_module(module_name), class_name)
         return targeted_task
 
     raise KeyError(f"Unknown task {task}, available tasks are {SUPPORTED_TASKS.keys()}")
@@ -74,15 +93,18 @@ def check_task(task: str) -> Dict:
 
 def pipeline(
     task: str = None,
-    image_loader: Optional[Union[str, BaseImageLoader]] = None,
+    image_loader: Optional[Union[str, "BaseImageLoader"]] = None,
     pipeline_kwargs: Dict[str, Any] = None,
+    bundle: str = None,
     **kwargs,
-) -> Pipeline:
+) -> "Pipeline":
     """
     Args:
         task (): pipelines name.
         image_loader (): image loader name
         pipeline_kwargs (): pipeline kwargs
+        bundle (): model bundle path (see nomeroff_net.tools.bundle), "latest" models of the process
+                   are loaded from it without network, OCR presets default to the presets of the bundle
         kwargs (): kwargs
 
     Returns:
@@ -125,4 +147,11 @@ def pipeline(
     targeted_task = check_task(task)
     pipeline_class = targeted_task["impl"]
 
+    if bundle is not None:
+        from nomeroff_net.tools.bundle import use_bundle
+        model_bundle = use_bundle(bundle)
+        if ("presets" in inspect.signature(pipeline_class.__init__).parameters
+                and "presets" not in kwargs and "presets" not in pipeline_kwargs):
+            kwargs["presets"] = model_bundle.presets
+
     return pipeline_class(task, image_loader, **pipeline_kwargs, **kwargs)
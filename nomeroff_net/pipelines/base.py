@@ -10,16 +10,25 @@ The module contains the following classes:
 """
 import os
 import time
+import asyncio
+import tempfile
 import ujson
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 from termcolor import colored
 from abc import abstractmethod
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 from collections import Counter
 from nomeroff_net.tools import promise_all
+from nomeroff_net.tools import executor_all
+from nomeroff_net.tools import split_iterable
 from nomeroff_net.tools import chunked_iterable
+from nomeroff_net.tools import achunked_iterable
+from nomeroff_net.tools import get_executor
+from nomeroff_net.tools.profiler import StageProfiler, profile
+from nomeroff_net.tools.model_registry import model_registry
+from nomeroff_net.tools import run_stages
+from nomeroff_net.tools import unscale_points
 from nomeroff_net.image_loaders import BaseImageLoader, DumpyImageLoader, image_loaders_map
 
 
@@ -55,6 +64,8 @@ class AccuracyTestPipeline(object):
         """
         TODO: write description
         """
+        if matplotlib_show:
+            import matplotlib.pyplot as plt
         n_good = 0
         n_bad = 0
         for predicted_image_texts, \
@@ -89,14 +100,17 @@ class AccuracyTestPipeline(object):
                     print("[INFO] image_points", image_points)
 
                 if matplotlib_show:
+                    # coordinates are of the full image, images decoded at reduced resolution have scale
+                    scale = getattr(image, "scale", None)
                     image = image.astype(np.uint8)
                     for cntr in image_points:
-                        cntr = np.array(cntr, dtype=np.int32)
+                        cntr = np.array(unscale_points(cntr, scale), dtype=np.int32)
                         cv2.drawContours(image, [cntr], -1, (0, 0, 255), 2)
                     for target_box in image_bboxs:
+                        (x1, y1), (x2, y2) = unscale_points(np.reshape(target_box[:4], (2, 2)), scale)
                         cv2.rectangle(image,
-                                      (int(target_box[0]), int(target_box[1])),
-                                      (int(target_box[2]), int(target_box[3])),
+                                      (int(x1), int(y1)),
+                                      (int(x2), int(y2)),
                                       (0, 255, 0),
                                       1)
                     plt.imshow(image)
@@ -157,6 +171,15 @@ class Pipeline(AccuracyTestPipeline):
 
     default_input_names = None
 
+    # size of the thread pool used by acall/astream for the blocking chunks
+    async_max_workers = 4
+
+    # StageProfiler for sub-stages timings, set by RuntimePipeline
+    profiler = None
+
+    # readiness flag, set by warmup
+    warmed_up = False
+
     def __init__(
         self,
         task: str = "",
@@ -168,9 +191,48 @@ class Pipeline(AccuracyTestPipeline):
         """
         self.task = task
         self.image_loader = self._init_image_loader(image_loader)
+        model_registry.subscribe(self.on_model_swap)
 
         self._preprocess_params, self._forward_params, self._postprocess_params = self.sanitize_parameters(**kwargs)
 
+    def on_model_swap(self, old, new):
+        """
+        Take the new shared model after model_registry.reload
+        """
+        if getattr(self, "detector", None) is old:
+            self.detector = new
+            key = model_registry.get_key(new)
+            if key is not None and hasattr(self, "model_key"):
+                self.model_key = key
+                self.path_to_model = key[1]
+
+    @staticmethod
+    def make_random_images(image_size, batch_size: int = 1) -> List[np.ndarray]:
+        height, width = image_size
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(batch_size)]
+
+    def close(self):
+        """
+        Release shared models of the pipeline and its sub-pipelines (see nomeroff_net.tools.model_registry)
+        """
+        if getattr(self, "_closed", False):
+            return
+        self._closed = True
+        for pipeline in getattr(self, "pipelines", []):
+            pipeline.close()
+        detector = getattr(self, "detector", None)
+        if hasattr(detector, "close"):
+            detector.close()
+        elif detector is not None:
+            model_registry.release(detector)
+
+    def profile(self, stage: str, batch_size: int = None):
+        """
+        Context manager that records stage time to the pipeline profiler (if it is set)
+        """
+        return profile(self.profiler, stage, batch_size)
+
     @staticmethod
     def _init_image_loader(image_loader):
         """
@@ -182,6 +244,9 @@ class Pipeline(AccuracyTestPipeline):
             image_loader_class = image_loaders_map.get(image_loader, None)
             if image_loader is None:
                 raise ValueError(f"{image_loader} not in {image_loaders_map.keys()}.")
+        elif isinstance(image_loader, BaseImageLoader):
+            # configured instance, for example TurboImageLoader(decode_size=640)
+            return image_loader
         elif issubclass(image_loader, BaseImageLoader):
             image_loader_class = image_loader
         else:
@@ -237,77 +302,260 @@ class Pipeline(AccuracyTestPipeline):
         """
         return self.call(inputs, **kwargs)
 
-    def call(self, inputs, batch_size=1, num_workers=1, **kwargs):
+    def make_warmup_inputs(self, image_size, batch_size: int, tmp_dir: str) -> List:
+        """
+        Random images of image_size (height, width), saved to jpeg files in tmp_dir
+        if the image loader of the pipeline reads files
+        """
+        height, width = image_size
+        images = self.make_random_images(image_size, batch_size)
+        if isinstance(self.image_loader, DumpyImageLoader):
+            return images
+        paths = []
+        for i, image in enumerate(images):
+            paths.append(os.path.join(tmp_dir, f"warmup_{height}x{width}_{i}.jpeg"))
+            cv2.imwrite(paths[-1], image)
+        return paths
+
+    def warmup(self, image_sizes: List = ((1080, 1920),), batch_sizes: List[int] = (1,), **kwargs) -> Dict:
+        """
+        Run the pipeline on random images of every (height, width) of image_sizes and every batch size,
+        so that allocator growth, kernel selection and lazy model setup happen before serving.
+        warmed_up is set to True when warm-up is done.
+        Returns:
+            :Dict: warm-up time of stages in seconds
+        """
+        self.warmed_up = False
+        stat = Counter()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for image_size in image_sizes:
+                for batch_size in batch_sizes:
+                    inputs = self.make_warmup_inputs(image_size, batch_size, tmp_dir)
+                    ts = time.perf_counter()
+                    self(inputs, batch_size=batch_size, **kwargs)
+                    stat[self.task or self.__class__.__name__] += time.perf_counter() - ts
+        self.warmed_up = True
+        return dict(stat)
+
+    def call(self, inputs, batch_size=1, num_workers=1, executor="thread", pipelined=False, queue_size=1, **kwargs):
         """
         TODO: write description
         """
+        preprocess_params, forward_params, postprocess_params = self.fuse_call_parameters(batch_size,
+                                                                                          num_workers,
+                                                                                          executor,
+                                                                                          **kwargs)
+        outputs = self.run_multi(inputs, batch_size, num_workers,
+                                 preprocess_params, forward_params, postprocess_params,
+                                 executor=executor, pipelined=pipelined, queue_size=queue_size)
+        return outputs
+
+    def stream(self, inputs, batch_size=1, num_workers=1, executor="thread", pipelined=False, queue_size=1,
+               **kwargs):
+        """
+        Lazy version of `call`: accepts any iterable (list, generator, ...) and yields
+        results per input as soon as the chunk containing it is processed.
+        Only one chunk of `batch_size` inputs is kept in memory at a time.
+
+        With pipelined=True every stage from `get_stages` works in its own thread,
+        so chunk N+1 is decoded while chunk N is in the model. Stages are connected
+        by queues with max size queue_size, so at most
+        len(stages) * (queue_size + 1) + 1 chunks are in memory.
+
+        Examples:
+            >>> for result in number_plate_detection_and_reading.stream(images_generator, batch_size=8):
+            ...     print(result[-1])
+        """
+        preprocess_params, forward_params, postprocess_params = self.fuse_call_parameters(batch_size,
+                                                                                          num_workers,
+                                                                                          executor,
+                                                                                          **kwargs)
+        return self.run_stream(inputs, batch_size, num_workers,
+                               preprocess_params, forward_params, postprocess_params,
+                               executor=executor, pipelined=pipelined, queue_size=queue_size)
+
+    async def acall(self, inputs, batch_size=1, num_workers=1, executor="thread", loop_executor=None, **kwargs):
+        """
+        Async version of `call`, see `astream`.
+
+        Examples:
+            >>> results = await number_plate_detection_and_reading.acall(images)
+        """
+        preprocess_params, forward_params, postprocess_params = self.fuse_call_parameters(batch_size,
+                                                                                          num_workers,
+                                                                                          executor,
+                                                                                          **kwargs)
+        chunks = [chunk_outputs async for chunk_outputs in self.arun_chunks(inputs, batch_size, num_workers,
+                                                                            preprocess_params, forward_params,
+                                                                            postprocess_params, executor,
+                                                                            loop_executor)]
+        return self.join_chunks(chunks, forward_params)
+
+    async def astream(self, inputs, batch_size=1, num_workers=1, executor="thread", loop_executor=None, **kwargs):
+        """
+        Async version of `stream`: inputs may be an iterable or an async iterable.
+        Every chunk goes through `run_chunks` in loop_executor
+        (by default the pipeline-wide thread pool of `async_max_workers` threads),
+        so the event loop is never blocked and a thread is held only while one chunk runs.
+        Concurrent requests share the models without any locks.
+        If the awaiting task is cancelled (for example client disconnected)
+        the next chunks are not run, the chunk already in loop_executor is finished in its thread.
+        """
+        preprocess_params, forward_params, postprocess_params = self.fuse_call_parameters(batch_size,
+                                                                                          num_workers,
+                                                                                          executor,
+                                                                                          **kwargs)
+        async for chunk_outputs in self.arun_chunks(inputs, batch_size, num_workers,
+                                                    preprocess_params, forward_params, postprocess_params,
+                                                    executor, loop_executor):
+            for output in chunk_outputs:
+                yield output
+
+    async def arun_chunks(self, inputs, batch_size, num_workers, preprocess_params, forward_params,
+                          postprocess_params, executor="thread", loop_executor=None):
+        """
+        Async version of `run_chunks`, every chunk is run by `run_chunks` in loop_executor
+        """
+        if loop_executor is None:
+            loop_executor = get_executor("thread", self.async_max_workers, name="async")
+        loop = asyncio.get_running_loop()
+        if hasattr(inputs, "__aiter__"):
+            chunks = achunked_iterable(inputs, batch_size)
+        else:
+            chunks = self._aiter(chunked_iterable(inputs, batch_size))
+        async for chunk_inputs in chunks:
+            def run_chunk(chunk_inputs=chunk_inputs):
+                return list(self.run_chunks(chunk_inputs, batch_size, num_workers,
+                                            preprocess_params, forward_params, postprocess_params,
+                                            executor=executor))
+            for chunk_outputs in await loop.run_in_executor(loop_executor, run_chunk):
+                yield chunk_outputs
+
+    @staticmethod
+    async def _aiter(iterable):
+        for item in iterable:
+            yield item
+
+    def fuse_call_parameters(self, batch_size=1, num_workers=1, executor="thread", **kwargs):
+        """
+        Fuse __init__ params and __call__ params without modifying the __init__ ones.
+        """
         kwargs["batch_size"] = batch_size
         kwargs["num_workers"] = num_workers
+        kwargs["executor"] = executor
         preprocess_params, forward_params, postprocess_params = self.sanitize_parameters(**kwargs)
 
-        # Fuse __init__ params and __call__ params without modifying the __init__ ones.
         preprocess_params = {**self._preprocess_params, **preprocess_params}
         forward_params = {**self._forward_params, **forward_params}
         postprocess_params = {**self._postprocess_params, **postprocess_params}
 
         if num_workers < 0 or num_workers > batch_size:
             raise ValueError("num_workers must by grater 0 and less or equal batch_size")
-        outputs = self.run_multi(inputs, batch_size, num_workers,
-                                 preprocess_params, forward_params, postprocess_params)
-        return outputs
+        return preprocess_params, forward_params, postprocess_params
 
     @staticmethod
-    def process_worker(func, inputs, params, num_workers=1):
+    def process_worker(func, inputs, params, num_workers=1, executor="thread"):
         """
-        TODO: write description
+        Split inputs into num_workers chunks and run func on every chunk in parallel.
+        executor: "thread" or "process" (persistent pools reused across calls),
+        "gevent" (greenlets, no parallelism for cpu-bound code without monkey-patching)
+        or any concurrent.futures.Executor instance.
+        "process" runs only picklable module-level functions: a bound pipeline method would pickle
+        the whole pipeline with its models on every chunk, use ProcessPoolPipeline for multi-process runs.
         """
         if num_workers == 1:
             return func(inputs, **params)
-        promises_outputs = []
+        if executor == "process" and isinstance(getattr(func, "__self__", None), Pipeline):
+            raise ValueError(f"executor='process' can not run the pipeline method {func.__name__}, "
+                             f"use executor='thread' or nomeroff_net.pipelines.ProcessPoolPipeline")
         promise_all_args = []
-        for chunk_inputs in chunked_iterable(inputs, num_workers):
-            for inp in chunked_iterable(chunk_inputs, 1):
-                promise_all_args.append(
-                    {
-                        "function": func,
-                        "args": [inp],
-                        "kwargs": params
-                    }
-                )
-            # print(f"RUN promise_all {func} functions {len(promise_all_args)}")
+        for chunk_inputs in split_iterable(inputs, num_workers):
+            promise_all_args.append(
+                {
+                    "function": func,
+                    "args": [chunk_inputs],
+                    "kwargs": params
+                }
+            )
+        if executor == "gevent":
             promise_outputs = promise_all(promise_all_args)
-            promises_outputs.append(promise_outputs)
+        else:
+            promise_outputs = executor_all(promise_all_args, executor, num_workers)
 
         outputs = []
-        for promise_output in promises_outputs:
-            for chunk in promise_output:
-                for item in chunk:
-                    outputs.append(item)
+        for chunk in promise_outputs:
+            for item in chunk:
+                outputs.append(item)
         return outputs
 
-    def run_multi(self, inputs, batch_size, num_workers, preprocess_params, forward_params, postprocess_params):
+    def get_stages(self, num_workers, preprocess_params, forward_params, postprocess_params, executor="thread"):
         """
-        TODO: write description
+        Split run_single into the list of functions chunk -> chunk,
+        used by pipelined mode to overlap the stages of the neighbouring chunks.
+        Override it in your pipeline to get more fine-grained stages.
         """
-        outputs = []
-        for chunk_inputs in chunked_iterable(inputs, batch_size):
-            chunk_outputs = self.run_single(chunk_inputs, num_workers,
-                                            preprocess_params, forward_params, postprocess_params)
+        stages = []
+        if not hasattr(self.preprocess, "is_empty") or not self.preprocess.is_empty:
+            stages.append(lambda inputs: self.process_worker(self.preprocess, inputs,
+                                                             preprocess_params, num_workers, executor))
+        if not hasattr(self.forward, "is_empty") or not self.forward.is_empty:
+            stages.append(lambda inputs: self.forward(inputs, **forward_params))
+        if not hasattr(self.postprocess, "is_empty") or not self.postprocess.is_empty:
+            stages.append(lambda inputs: self.process_worker(self.postprocess, inputs,
+                                                             postprocess_params, num_workers, executor))
+        return stages
+
+    def run_chunks(self, inputs, batch_size, num_workers, preprocess_params, forward_params, postprocess_params,
+                   executor="thread", pipelined=False, queue_size=1):
+        """
+        Yield outputs chunk by chunk, inputs are consumed lazily
+        """
+        chunks = chunked_iterable(inputs, batch_size)
+        if pipelined:
+            stages = self.get_stages(num_workers, preprocess_params, forward_params, postprocess_params, executor)
+            for chunk_outputs in run_stages(chunks, stages, queue_size=queue_size):
+                yield chunk_outputs
+            return
+        for chunk_inputs in chunks:
+            yield self.run_single(chunk_inputs, num_workers,
+                                  preprocess_params, forward_params, postprocess_params, executor)
+
+    def run_stream(self, inputs, batch_size, num_workers, preprocess_params, forward_params, postprocess_params,
+                   executor="thread", pipelined=False, queue_size=1):
+        """
+        Yield outputs one by one, inputs are consumed lazily
+        """
+        for chunk_outputs in self.run_chunks(inputs, batch_size, num_workers,
+                                             preprocess_params, forward_params, postprocess_params,
+                                             executor=executor, pipelined=pipelined, queue_size=queue_size):
             for output in chunk_outputs:
-                outputs.append(output)
-        return outputs
+                yield output
 
-    def run_single(self, inputs, num_workers, preprocess_params, forward_params, postprocess_params):
+    def run_multi(self, inputs, batch_size, num_workers, preprocess_params, forward_params, postprocess_params,
+                  executor="thread", pipelined=False, queue_size=1):
         """
-        TODO: write description
+        Run all inputs chunk by chunk and return the result of the call, see join_chunks
+        """
+        return self.join_chunks(list(self.run_chunks(inputs, batch_size, num_workers,
+                                                     preprocess_params, forward_params, postprocess_params,
+                                                     executor=executor, pipelined=pipelined,
+                                                     queue_size=queue_size)),
+                                forward_params)
+
+    def join_chunks(self, chunks: List, forward_params: Dict) -> Any:
+        """
+        Result of call/acall from the outputs of all chunks, the flat list of outputs by default
+        """
+        return [output for chunk_outputs in chunks for output in chunk_outputs]
+
+    def run_single(self, inputs, num_workers, preprocess_params, forward_params, postprocess_params,
+                   executor="thread"):
+        """
+        Run one chunk of inputs through all stages from get_stages
         """
         _inputs = inputs
-        if not hasattr(self.preprocess, "is_empty") or not self.preprocess.is_empty:
-            _inputs = self.process_worker(self.preprocess, _inputs, preprocess_params, num_workers)
-        if not hasattr(self.forward, "is_empty") or not self.forward.is_empty:
-            _inputs = self.forward(_inputs, **forward_params)
-        if not hasattr(self.postprocess, "is_empty") or not self.postprocess.is_empty:
-            _inputs = self.process_worker(self.postprocess, _inputs, postprocess_params, num_workers)
+        for stage in self.get_stages(num_workers, preprocess_params, forward_params, postprocess_params, executor):
+            _inputs = stage(_inputs)
         return _inputs
 
 
@@ -331,6 +579,8 @@ class CompositePipeline(object):
                 forward_parameters["batch_size"] = kwargs["batch_size"]
             if key == "num_workers":
                 forward_parameters["num_workers"] = kwargs["num_workers"]
+            if key == "executor":
+                forward_parameters["executor"] = kwargs["executor"]
         for pipeline in self.pipelines:
             for dict_params in pipeline.sanitize_parameters(**kwargs):
                 forward_parameters.update(dict_params)
@@ -351,22 +601,30 @@ class RuntimePipeline(object):
         self.pipelines = pipelines
         self.time_stat = Counter()
         self.count_stat = Counter()
+        self.profiler = StageProfiler()
 
         self.call = self.timeit(self.__class__.__name__)(self.call)
         for pipeline in self.pipelines:
             pipeline.call = self.timeit(pipeline.__class__.__name__)(pipeline.call)
+            pipeline.profiler = self.profiler
+            if hasattr(getattr(pipeline, "detector", None), "profiler"):
+                pipeline.detector.profiler = self.profiler
 
-    def timeit(self, tag):
+    def timeit(self, tag, name=None):
         """
-        TODO: write description
+        Record time of the method as "<tag>.<name>", name is the method name by default
         """
         def wrapper(method):
+            key = f'{tag}.{name or method.__name__}'
+
             def timed(*args, **kw):
-                ts = time.time()
+                ts = time.perf_counter()
                 result = method(*args, **kw)
-                te = time.time()
-                self.time_stat[f'{tag}.{method.__name__}'] += te - ts
-                self.count_stat[f'{tag}.{method.__name__}'] += 1
+                te = time.perf_counter()
+                self.time_stat[key] += te - ts
+                self.count_stat[key] += 1
+                batch_size = len(args[0]) if args and hasattr(args[0], "__len__") else None
+                self.profiler.record(key, te - ts, batch_size)
                 return result
             return timed
         return wrapper
@@ -377,6 +635,7 @@ class RuntimePipeline(object):
         """
         self.time_stat = Counter()
         self.count_stat = Counter()
+        self.profiler.clear()
 
     def get_timer_stat(self, count_processed_images):
         """
@@ -386,3 +645,10 @@ class RuntimePipeline(object):
         for key in self.count_stat:
             timer_stat[key] = self.time_stat[key] / count_processed_images
         return timer_stat
+
+    def get_latency_stat(self):
+        """
+        p50/p95/p99/max latency per stage and batch size,
+        see nomeroff_net.tools.profiler.StageProfiler.get_stat
+        """
+        return self.profiler.get_stat()
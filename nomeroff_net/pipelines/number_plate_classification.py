@@ -8,6 +8,7 @@ from nomeroff_net.image_loaders import BaseImageLoader
 from nomeroff_net.pipelines.base import Pipeline
 from nomeroff_net.pipes.number_plate_classificators.options_detector import OptionsDetector
 from nomeroff_net.tools import unzip
+from nomeroff_net.tools.model_registry import model_registry
 
 
 class NumberPlateClassification(Pipeline):
@@ -23,8 +24,45 @@ class NumberPlateClassification(Pipeline):
                  class_detector=OptionsDetector,
                  **kwargs):
         super().__init__(task, image_loader, **kwargs)
-        self.detector = class_detector(options=options)
-        self.detector.load(path_to_model, options=options)
+        self.class_detector = class_detector
+        self.path_to_model = path_to_model
+        self.options = options
+        self.model_key = self.make_model_key(path_to_model)
+        self.detector = model_registry.acquire(self.model_key,
+                                               lambda: self.load_detector(class_detector, path_to_model, options))
+
+    def make_model_key(self, path_to_model):
+        return model_registry.make_key(f"{self.class_detector.__module__}.{self.class_detector.__qualname__}",
+                                       path_to_model, options=self.options)
+
+    @staticmethod
+    def validate_detector(detector):
+        """
+        Default reload canary: the new detector runs on a random zone
+        """
+        detector.forward(detector.preprocess(Pipeline.make_random_images((detector.height, detector.width))))
+
+    def reload(self, path_to_model: str = None, validate=None):
+        """
+        Hot reload of the classifier weights (the same path re-downloads "latest"), see model_registry.reload
+        Args:
+            path_to_model (): new path_to_model, current if None
+            validate (): validate(detector) canary, must raise on failure, validate_detector if None
+        """
+        path_to_model = path_to_model or self.path_to_model
+        model_key = self.make_model_key(path_to_model)
+        model_registry.reload(self.model_key,
+                              lambda: self.load_detector(self.class_detector, path_to_model, self.options),
+                              validate=validate or self.validate_detector,
+                              new_key=model_key)
+        self.path_to_model = path_to_model
+        self.model_key = model_key
+
+    @staticmethod
+    def load_detector(class_detector, path_to_model, options):
+        detector = class_detector(options=options)
+        detector.load(path_to_model, options=options)
+        return detector
 
     def sanitize_parameters(self, **kwargs):
         return {}, {}, {}
@@ -33,7 +71,7 @@ class NumberPlateClassification(Pipeline):
         return super().__call__(images, **kwargs)
 
     def preprocess(self, inputs: Any, **preprocess_parameters: Dict) -> Any:
-        images = [self.image_loader.load(item) for item in inputs]
+        images = [self.image_loader.load_any(item) for item in inputs]
         return self.detector.preprocess(images)
 
     @no_grad()
@@ -8,8 +8,47 @@ Examples:
     >>> (images, images_bboxs, images_points, images_zones, region_ids,region_names, count_lines, confidences, texts) = unzip(results)
     >>> print(texts)
     (['AC4921CB'], ['RP70012', 'JJF509'])
+    >>> # all results of the call in one columnar PlateBatchResult
+    >>> result = number_plate_detection_and_reading(['./data/examples/oneline_images/example1.jpeg'], columnar=True)
+    >>> print(result.bboxes.shape, result.texts)
+    (1, 4) ['AC4921CB']
+    >>> # only texts and boxes, decoded images and zone crops are released during the call
+    >>> result = number_plate_detection_and_reading(['./data/examples/oneline_images/example1.jpeg'],
+    ...                                             fields=["bboxs", "confidences", "texts"])
+    >>> # OCR models are loaded when the first plate of their region comes, at most 500 MB are resident
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv",
+    ...                                               ocr_lazy_load=True, ocr_memory_budget_mb=500,
+    ...                                               ocr_preload=["eu_ua_2015", "eu_ua_2004", "eu"])
+    >>> print(number_plate_detection_and_reading.number_plate_text_reading.detector.get_stat())
+    >>> # models are loaded in a thread pool, the pipeline is returned at once
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv",
+    ...                                               parallel_init=True, wait_ready=False)
+    >>> number_plate_detection_and_reading.is_ready("eu_ua_2015")
+    >>> number_plate_detection_and_reading.wait_ready()
+    >>> # run every stage and OCR preset before serving, warmed_up is the readiness flag
+    >>> stat = number_plate_detection_and_reading.warmup(image_sizes=[(1080, 1920)], batch_sizes=[1, 8])
+    >>> number_plate_detection_and_reading.warmed_up
+    True
+    >>> # new weights of one OCR preset are loaded and checked in the background, then swapped
+    >>> future = number_plate_detection_and_reading.reload("eu_ua_2015", "./data/models/ocr_eu_ua_2015.ckpt",
+    ...                                                   wait=False)
+    >>> future.result()
+    >>> # repeated images are answered from the cache until the models are reloaded
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv",
+    ...                                               result_cache="memory")
+    >>> print(number_plate_detection_and_reading.result_cache.get_stat())
+    >>> # images of the batch are decoded by 8 threads, see image_loader.get_stat() for decode throughput
+    >>> results = number_plate_detection_and_reading(['./data/examples/oneline_images/example1.jpeg'] * 64,
+    ...                                              batch_size=64, decode_workers=8, decode_readahead=True)
+    >>> print(number_plate_detection_and_reading.image_loader.get_stat())
 """
+import time
+import tempfile
+import threading
+import numpy as np
+from collections import Counter
 from typing import Any, Dict, Optional, List, Union
+from concurrent.futures import Future
 from nomeroff_net.image_loaders import BaseImageLoader
 from nomeroff_net.pipelines.base import Pipeline, CompositePipeline, empty_method
 from .number_plate_localization import NumberPlateLocalization as DefaultNumberPlateLocalization
@@ -17,9 +56,13 @@ from .number_plate_text_reading import NumberPlateTextReading
 from .number_plate_upscaling import NumberPlateUpscaling
 from .number_plate_classification import NumberPlateClassification
 from nomeroff_net.tools.image_processing import (crop_number_plate_zones_from_images,
-                                                 crop_number_plate_roi_zones_from_images,
-                                                 group_by_image_ids)
+                                                 crop_number_plate_roi_zones_from_images)
 from nomeroff_net.tools import unzip
+from nomeroff_net.tools.pipeline_tools import SyncExecutor, get_executor, chunked_iterable
+from nomeroff_net.tools.model_registry import model_registry
+from nomeroff_net.tools.result_cache import ResultCache
+from nomeroff_net.tools.zone_cache import ZoneCache
+from nomeroff_net.tools.plate_batch_result import PlateBatchResult
 from nomeroff_net.pipes.number_plate_keypoints_detectors.bbox_np_points_tools import (normalize_rect_new,
                                                                                       normalize_rect)
 
@@ -42,6 +85,14 @@ class NumberPlateDetectionAndReading(Pipeline, CompositePipeline):
                  number_plate_localization_class: Pipeline = DefaultNumberPlateLocalization,
                  number_plate_localization_detector=None,
                  upscaling=False,
+                 ocr_lazy_load: bool = False,
+                 ocr_memory_budget_mb: float = None,
+                 ocr_preload: List[str] = None,
+                 parallel_init: bool = False,
+                 init_workers: int = 4,
+                 wait_ready: bool = True,
+                 result_cache: Union[str, ResultCache] = None,
+                 ocr_zone_cache: ZoneCache = None,
                  **kwargs):
         """
         init NumberPlateDetectionAndReading Class
@@ -58,11 +109,29 @@ class NumberPlateDetectionAndReading(Pipeline, CompositePipeline):
             default_lines_count (): default_lines_count
             number_plate_localization_class (): number_plate_localization_class
             number_plate_localization_detector (): number_plate_localization_detector
+            ocr_lazy_load (): load OCR models on demand
+            ocr_memory_budget_mb (): memory budget of resident OCR models with ocr_lazy_load
+            ocr_preload (): OCR presets or regions to load at init with ocr_lazy_load
+            parallel_init (): load localization, classification and OCR models in a thread pool
+            init_workers (): threads of the parallel_init pool
+            wait_ready (): with parallel_init, False returns at once, see init_futures, is_ready and wait_ready
+            result_cache (): ResultCache or its backend name ("memory", "disk") for results of repeated images
+            ocr_zone_cache (): ZoneCache, OCR texts of already seen zones are read from it without the model
 
         """
         self.default_label = default_label
         self.default_lines_count = default_lines_count
-        self.number_plate_localization = number_plate_localization_class(
+        if isinstance(result_cache, str):
+            result_cache = ResultCache(backend=result_cache)
+        self.result_cache = result_cache
+        init_executor = SyncExecutor()
+        if parallel_init:
+            init_executor = get_executor("thread", init_workers, name="init")
+        self._ready_lock = threading.Lock()
+        self.init_futures = {}
+        self.number_plate_localization = None
+        self.init_futures["number_plate_localization"] = init_executor.submit(
+            number_plate_localization_class,
             "number_plate_localization",
             image_loader=None,
             path_to_model=path_to_model,
@@ -74,54 +143,220 @@ class NumberPlateDetectionAndReading(Pipeline, CompositePipeline):
                 "number_plate_localization",
                 image_loader=None)
         self.number_plate_classification = None
-        option_detector_width = 0
-        option_detector_height = 0
         if not off_number_plate_classification:
-            self.number_plate_classification = NumberPlateClassification(
+            self.init_futures["number_plate_classification"] = init_executor.submit(
+                NumberPlateClassification,
                 "number_plate_classification",
                 image_loader=None,
                 path_to_model=path_to_classification_model,
                 options=classification_options)
-            option_detector_width = self.number_plate_classification.detector.width
-            option_detector_height = self.number_plate_classification.detector.height
         self.number_plate_text_reading = NumberPlateTextReading(
             "number_plate_text_reading",
             image_loader=None,
             presets=presets,
-            option_detector_width=option_detector_width,
-            option_detector_height=option_detector_height,
             default_label=default_label,
             default_lines_count=default_lines_count,
             off_number_plate_classification=off_number_plate_classification,
+            lazy_load=ocr_lazy_load,
+            memory_budget_mb=ocr_memory_budget_mb,
+            preload=ocr_preload,
+            load_executor=init_executor if parallel_init else None,
+            zone_cache=ocr_zone_cache,
         )
-        self.pipelines = [
-            self.number_plate_localization,
-            self.number_plate_text_reading,
-        ]
-        if self.number_plate_upscaling is not None:
-            self.pipelines.append(self.number_plate_upscaling)
-        if self.number_plate_classification is not None:
-            self.pipelines.append(self.number_plate_classification)
+        self.pipelines = []
         Pipeline.__init__(self, task, image_loader, **kwargs)
         CompositePipeline.__init__(self, self.pipelines)
+        self.update_pipelines()
+        if wait_ready:
+            self.wait_ready()
+
+    def update_pipelines(self) -> None:
+        """
+        Take loaded sub-pipelines from init_futures, self.pipelines is updated in place
+        """
+        with self._ready_lock:
+            for name, future in self.init_futures.items():
+                if getattr(self, name) is None and future.done() and future.exception() is None:
+                    setattr(self, name, future.result())
+            if self.number_plate_classification is not None:
+                # zones of the classification model size are reused by OCR
+                self.number_plate_text_reading.detector.option_detector_width = \
+                    self.number_plate_classification.detector.width
+                self.number_plate_text_reading.detector.option_detector_height = \
+                    self.number_plate_classification.detector.height
+            self.pipelines[:] = [pipeline for pipeline in [self.number_plate_localization,
+                                                           self.number_plate_text_reading,
+                                                           self.number_plate_upscaling,
+                                                           self.number_plate_classification]
+                                 if pipeline is not None]
+
+    def wait_ready(self, names: List[str] = None, timeout: float = None) -> None:
+        """
+        Wait for sub-pipelines (all or names of init_futures) and all OCR models if names is None,
+        loading errors are raised here
+        """
+        for name, future in self.init_futures.items():
+            if (names is None or name in names) and getattr(self, name) is None:
+                future.result(timeout)
+                self.update_pipelines()
+        if names is None:
+            self.number_plate_text_reading.detector.wait_ready(timeout)
+
+    def is_ready(self, region: str = None, count_lines: int = 1) -> bool:
+        """
+        Localization and classification are loaded and OCR models are loaded (all or only for the region)
+        """
+        return (all(future.done() and future.exception() is None for future in self.init_futures.values())
+                and self.number_plate_text_reading.detector.is_ready(region, count_lines))
+
+    def get_ready_futures(self) -> Dict[str, Future]:
+        """
+        Futures of sub-pipelines and OCR presets (by preset name)
+        """
+        return {**self.init_futures, **self.number_plate_text_reading.detector.get_load_futures()}
+
+    def get_warmup_targets(self, regions: List[str] = None) -> Dict[tuple, str]:
+        """
+        (OCR preset name, count_lines) -> region routed to it, for all loaded presets or presets of regions
+        """
+        detector = self.number_plate_text_reading.detector
+        targets = {}
+        for (count_lines, region), detector_id in detector.detectors_map.items():
+            name = detector.detectors_names[detector_id]
+            if (name, count_lines) in targets:
+                continue
+            if regions is None and detector.detectors[detector_id] is None:
+                continue
+            if regions is not None and region not in [r.replace("-", "_") for r in regions]:
+                continue
+            targets[(name, count_lines)] = region
+        return targets
+
+    def warmup(self, image_sizes: List = ((1080, 1920),), batch_sizes: List[int] = (1,),
+               regions: List[str] = None, **kwargs) -> Dict:
+        """
+        Drive every stage on random images of image_sizes (height, width) and batch_sizes:
+        decode, localization, crop with classification on a synthetic plate in the image center
+        and every loaded OCR preset (or presets of regions).
+        warmed_up is set to True when warm-up is done.
+        Returns:
+            :Dict: warm-up time of stages in seconds, OCR presets as "ocr.<preset name>"
+                   and "ocr.<preset name>.<count lines>" for multiline plates
+        """
+        self.warmed_up = False
+        self.wait_ready()
+        forward_parameters = {**self._forward_params, **kwargs}
+        targets = self.get_warmup_targets(regions)
+        stat = Counter()
+
+        def timeit(stage, func, *args, **kw):
+            ts = time.perf_counter()
+            res = func(*args, **kw)
+            stat[stage] += time.perf_counter() - ts
+            return res
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for image_size in image_sizes:
+                height, width = image_size
+                plate_width = max(width // 4, 52)
+                plate_height = max(plate_width * 112 // 520, 11)
+                x1, y1 = (width - plate_width) / 2, (height - plate_height) / 2
+                x2, y2 = x1 + plate_width, y1 + plate_height
+                plate = [x1, y1, x2, y2, 1., 0, np.array([[x1, y2], [x1, y1], [x2, y1], [x2, y2]], dtype=np.float32)]
+                for batch_size in batch_sizes:
+                    inputs = self.make_warmup_inputs(image_size, batch_size, tmp_dir)
+                    images = timeit("decode", self.preprocess, inputs)
+                    _, images = timeit("localization", self.forward_localization, images, **forward_parameters)
+                    images_bboxs = [[list(plate)] for _ in images]
+                    (_, _, _, confidences, _, zones, image_ids, images_bboxs, images, images_points,
+                     preprocessed_np) = timeit("classification", self.forward_classification,
+                                               images_bboxs, images, **forward_parameters)
+                    for (name, count_lines), region in targets.items():
+                        stage = f"ocr.{name}" if count_lines == 1 else f"ocr.{name}.{count_lines}"
+                        timeit(stage, self.forward_recognition_np,
+                               [-1 for _ in zones], [region for _ in zones], [count_lines for _ in zones],
+                               confidences, list(zones), image_ids, images_bboxs, list(images),
+                               images_points, preprocessed_np, **forward_parameters)
+        self.warmed_up = True
+        return dict(stat)
+
+    def reload(self,
+               name: str,
+               path_to_model: str = None,
+               validate=None,
+               canary_zones: List[np.ndarray] = None,
+               canary_texts: List[str] = None,
+               wait: bool = True) -> Optional[Future]:
+        """
+        Hot reload of one model, calls go on with the old one until the new one is loaded and validated
+        Args:
+            name (): "number_plate_localization", "number_plate_classification" or OCR preset name
+            path_to_model (): new model path, current if None
+            validate (): validate(detector) canary of localization and classification, must raise on failure
+            canary_zones (): OCR canary zones, random zones if None
+            canary_texts (): expected texts of canary_zones
+            wait (): False runs the reload in a background thread and returns its Future
+        """
+        self.wait_ready([name])
+        if name in ("number_plate_localization", "number_plate_classification"):
+            pipeline = getattr(self, name)
+            if pipeline is None:
+                raise ValueError(f"Pipeline {name} is not used")
+            func = lambda: pipeline.reload(path_to_model, validate=validate)
+        else:
+            func = lambda: self.number_plate_text_reading.detector.reload(name, path_to_model,
+                                                                          canary_zones=canary_zones,
+                                                                          canary_texts=canary_texts)
+        if wait:
+            func()
+            return None
+        return get_executor("thread", 1, name="reload").submit(func)
+
+    def close(self):
+        for future in list(self.init_futures.values()):
+            future.exception()
+        self.update_pipelines()
+        super().close()
 
     def __call__(self, images: Any, **kwargs):
         return super().__call__(images, **kwargs)
 
-    def preprocess(self, inputs: Any, **preprocess_parameters: Dict) -> Any:
-        images = [self.image_loader.load(item) for item in inputs]
+    def preprocess(self, inputs: Any, decode_workers: int = 1, decode_readahead: bool = False,
+                   **preprocess_parameters: Dict) -> Any:
+        """
+        decode_workers threads decode the batch, see BaseImageLoader.load_batch
+        """
+        with self.profile("decode", len(inputs)):
+            images = self.image_loader.load_batch(inputs, max_workers=decode_workers, readahead=decode_readahead)
         return images
 
-    def forward_detection_np(self, inputs: Any, **forward_parameters: Dict):
+    def forward_localization(self, inputs: Any, **forward_parameters: Dict):
+        self.wait_ready(["number_plate_localization"])
         images_bboxs, images = unzip(self.number_plate_localization(inputs, **forward_parameters))
+        # list, so that the next stage can release images in place
+        return images_bboxs, list(images)
+
+    def forward_detection_np(self, inputs: Any, **forward_parameters: Dict):
+        images_bboxs, images = self.forward_localization(inputs, **forward_parameters)
+        return self.forward_classification(images_bboxs, images, **forward_parameters)
+
+    def forward_classification(self, images_bboxs, images, **forward_parameters: Dict):
+        self.wait_ready(["number_plate_classification"])
+        fields = self.get_fields(**forward_parameters)
         orig_images_points = [[bbox[-1] for bbox in bboxs] for bboxs in images_bboxs]
         # crop roi
-        zones, image_ids, images_points = crop_number_plate_roi_zones_from_images(images, images_bboxs)
-        images_points = list([normalize_rect_new(image_points) for image_points in images_points])
+        with self.profile("roi_crop", len(images)):
+            zones, image_ids, images_points = crop_number_plate_roi_zones_from_images(images, images_bboxs)
+            images_points = list([normalize_rect_new(image_points) for image_points in images_points])
         # upscaling
         if self.number_plate_upscaling is not None:
-            zones, images_points = unzip(self.number_plate_upscaling(zip(zones, images_points)))
-        zones, image_ids = crop_number_plate_zones_from_images(zones, image_ids, images_points)
+            with self.profile("upscaling", len(zones)):
+                zones, images_points = unzip(self.number_plate_upscaling(zip(zones, images_points)))
+        with self.profile("perspective_warp", len(zones)):
+            zones, image_ids = crop_number_plate_zones_from_images(zones, image_ids, images_points)
+        # zones are warped copies now, decoded images are not needed anymore
+        if "images" not in fields:
+            images.clear()
 
         if self.number_plate_classification is None or not len(zones):
             region_ids = [-1 for _ in zones]
@@ -143,20 +378,26 @@ class NumberPlateDetectionAndReading(Pipeline, CompositePipeline):
                                zones, image_ids,
                                images_bboxs, images,
                                images_points, preprocessed_np, **forward_parameters):
-        number_plate_text_reading_res = unzip(
-            self.number_plate_text_reading(unzip([zones,
-                                                  region_names,
-                                                  count_lines, preprocessed_np]), **forward_parameters))
-        if len(number_plate_text_reading_res):
-            texts, _ = number_plate_text_reading_res
-        else:
-            texts = []
-        (region_ids, region_names, count_lines, confidences, texts, zones) = \
-            group_by_image_ids(image_ids, (region_ids, region_names, count_lines, confidences, texts, zones))
-        return unzip([images, images_bboxs,
-                      images_points, zones,
-                      region_ids, region_names,
-                      count_lines, confidences, texts])
+        fields = self.get_fields(**forward_parameters)
+        texts = None
+        if "texts" in fields:
+            texts = self.number_plate_text_reading.read_texts(zones, region_names, count_lines, preprocessed_np,
+                                                              **forward_parameters)
+        # plates are ordered by image_ids, so image offsets are enough to group them by image
+        with self.profile("group_by_image", len(images_bboxs)):
+            res = PlateBatchResult.from_detections(images_bboxs,
+                                                   region_ids=region_ids,
+                                                   region_names=region_names,
+                                                   count_lines=count_lines,
+                                                   confidences=confidences,
+                                                   texts=texts,
+                                                   zones=zones,
+                                                   images=images,
+                                                   fields=fields)
+        # the caller may still hold the detection outputs, release crops in place
+        if "zones" not in fields and isinstance(zones, list):
+            zones.clear()
+        return res
 
     def forward(self, inputs: Any, **forward_parameters: Dict) -> Any:
         """
@@ -173,6 +414,138 @@ class NumberPlateDetectionAndReading(Pipeline, CompositePipeline):
                                            images_bboxs, images,
                                            images_points, preprocessed_np, **forward_parameters)
 
+    def get_stages(self, num_workers, preprocess_params, forward_params, postprocess_params, executor="thread"):
+        """
+        decode -> localization -> crop and classification -> text reading
+        """
+        def localization_stage(images):
+            return self.forward_localization(images, **forward_params)
+
+        def classification_stage(localization_outputs):
+            return self.forward_classification(*localization_outputs, **forward_params)
+
+        def text_reading_stage(detection_outputs):
+            (region_ids, region_names,
+             count_lines, confidences, predicted,
+             zones, image_ids,
+             images_bboxs, images,
+             images_points, preprocessed_np) = detection_outputs
+            return self.forward_recognition_np(region_ids, region_names,
+                                               count_lines, confidences,
+                                               zones, image_ids,
+                                               images_bboxs, images,
+                                               images_points, preprocessed_np, **forward_params)
+
+        return [
+            lambda inputs: self.process_worker(self.preprocess, inputs, preprocess_params, num_workers, executor),
+            localization_stage,
+            classification_stage,
+            text_reading_stage,
+        ]
+
+    @staticmethod
+    def get_fields(fields: List[str] = None, return_images: bool = True, **_) -> tuple:
+        """
+        Output projection: fields of PlateBatchResult.FIELDS to compute and return,
+        return_images=False drops images and zones
+        """
+        return PlateBatchResult.get_fields(fields, return_images)
+
+    def get_model_versions(self) -> tuple:
+        """
+        Identity of all loaded models, it is changed by every hot reload
+        """
+        self.wait_ready(["number_plate_localization", "number_plate_classification"])
+        versions = [model_registry.instance_id]
+        for pipeline in [self.number_plate_localization, self.number_plate_classification]:
+            detector = getattr(pipeline, "detector", None)
+            versions.append((model_registry.get_key(detector), model_registry.get_version(detector)))
+        versions.append(self.number_plate_text_reading.detector.get_model_versions())
+        return tuple(versions)
+
+    def get_result_cache_context(self, forward_params: Dict) -> tuple:
+        """
+        Everything besides the image that changes the result: model versions and call parameters
+        """
+        params = tuple(sorted((key, repr(value)) for key, value in forward_params.items()
+                              if key not in ("batch_size", "num_workers", "executor", "columnar",
+                                             "decode_workers", "decode_readahead")))
+        return (self.task, self.default_label, self.default_lines_count,
+                self.number_plate_upscaling is not None, self.get_model_versions(), params)
+
+    def run_chunks(self, inputs, batch_size, num_workers, preprocess_params, forward_params, postprocess_params,
+                   executor="thread", pipelined=False, queue_size=1):
+        """
+        With result_cache only images that are not in the cache go to the models,
+        chunk by chunk (pipelined is not used), results are assembled back in the order of inputs.
+        Streams (file-like objects without getbuffer) are not cached, see ResultCache.hash_input
+        """
+        if self.result_cache is None:
+            yield from super().run_chunks(inputs, batch_size, num_workers,
+                                          preprocess_params, forward_params, postprocess_params,
+                                          executor=executor, pipelined=pipelined, queue_size=queue_size)
+            return
+        context = self.get_result_cache_context(forward_params)
+        for chunk_inputs in chunked_iterable(inputs, batch_size):
+            content_hashes = [self.result_cache.hash_input(item) for item in chunk_inputs]
+            keys = [None if content_hash is None else self.result_cache.make_key(content_hash, context)
+                    for content_hash in content_hashes]
+            results = [None if key is None else self.result_cache.get(key) for key in keys]
+            missed = [i for i, result in enumerate(results) if result is None]
+            if missed:
+                missed_results = []
+                for chunk_outputs in super().run_chunks([chunk_inputs[i] for i in missed], batch_size, num_workers,
+                                                        preprocess_params, forward_params, postprocess_params,
+                                                        executor=executor):
+                    missed_results.extend(chunk_outputs.split())
+                for i, result in zip(missed, missed_results):
+                    if keys[i] is not None:
+                        self.result_cache.set(keys[i], result)
+                    results[i] = result
+            yield PlateBatchResult.concat(results)
+
+    def join_chunks(self, chunks: List, forward_params: Dict) -> Any:
+        """
+        columnar=True returns one PlateBatchResult for all inputs instead of the list of tuples
+        """
+        if not forward_params.get("columnar", False):
+            return super().join_chunks(chunks, forward_params)
+        return PlateBatchResult.concat(chunks)
+
     @empty_method
     def postprocess(self, inputs: Any, **postprocess_parameters: Dict) -> Any:
         return inputs
+
+
+if __name__ == "__main__":
+    number_plate_detection_and_reading = NumberPlateDetectionAndReading.__new__(NumberPlateDetectionAndReading)
+    number_plate_detection_and_reading.result_cache = ResultCache()
+    number_plate_detection_and_reading.get_result_cache_context = lambda forward_params: ("test",)
+    cached = PlateBatchResult.from_detections([[]], texts=[])
+    number_plate_detection_and_reading.result_cache.set(
+        ResultCache.make_key(ResultCache.hash_input(b"jpeg"), ("test",)), cached)
+    consumed = []
+
+    def endless_inputs():
+        while True:
+            consumed.append(1)
+            yield b"jpeg"
+
+    # all hits: results come chunk by chunk, inputs are not read ahead
+    chunks = number_plate_detection_and_reading.run_chunks(endless_inputs(), 2, 1, {}, {}, {})
+    assert len(next(chunks)) == 2 and len(consumed) == 2
+    assert len(next(chunks)) == 2 and len(consumed) == 4
+
+    # misses of a chunk with an image without plates are joined with the cached ones
+    def fake_stage(inputs):
+        plates = [[[0, 0, 10, 5, 0.9, 0, np.zeros((4, 2))]] if item == b"plate" else [] for item in inputs]
+        count = sum(map(len, plates))
+        return PlateBatchResult.from_detections(plates, region_ids=[0] * count, region_names=["eu"] * count,
+                                                count_lines=[1] * count, confidences=[[0.9, 0.9]] * count,
+                                                texts=["AC4921CB"] * count)
+
+    number_plate_detection_and_reading.get_stages = lambda *args, **kwargs: [fake_stage]
+    inputs = [b"plate", b"empty", b"plate", b"empty"]
+    first = number_plate_detection_and_reading.run_chunks(inputs, 4, 1, {}, {}, {})
+    second = number_plate_detection_and_reading.run_chunks(inputs, 4, 1, {}, {}, {})
+    assert [r[-1] for r in next(first)] == [r[-1] for r in next(second)] == [["AC4921CB"], [], ["AC4921CB"], []]
@@ -9,4 +9,9 @@ class NumberPlateDetectionAndReadingRuntime(NumberPlateDetectionAndReading, Runt
 
     def __init__(self, *args, **kwargs):
         NumberPlateDetectionAndReading.__init__(self, *args, **kwargs)
+        # sub-pipelines are wrapped with timers, so they must be loaded
+        self.wait_ready()
         RuntimePipeline.__init__(self, self.pipelines)
+        # forward_recognition_np reads texts by columns, they are timed as the text reading call
+        self.number_plate_text_reading.read_texts = self.timeit("NumberPlateTextReading", "call")(
+            self.number_plate_text_reading.read_texts)
@@ -1,6 +1,8 @@
+import threading
 from typing import Dict, Optional, Union
 from nomeroff_net.image_loaders import BaseImageLoader
 from nomeroff_net.pipelines.base import Pipeline, CompositePipeline
+from nomeroff_net.tools.result_cache import ResultCache
 from .number_plate_localization_trt import NumberPlateLocalizationTrt
 from .number_plate_key_points_cropping import NumberPlateKeyPointsDetection
 from .number_plate_text_reading_trt import NumberPlateTextReadingTrt
@@ -24,7 +26,18 @@ class NumberPlateDetectionAndReadingTrt(NumberPlateDetectionAndReading):
                  classification_options: Dict = None,
                  default_label: str = "eu_ua_2015",
                  default_lines_count: int = 1,
+                 result_cache: Union[str, ResultCache] = None,
                  **kwargs):
+        # NumberPlateDetectionAndReading.__init__ is not called, it creates pytorch models,
+        # TensorRT sub-pipelines are created here at once, so there are no init_futures
+        self.default_label = default_label
+        self.default_lines_count = default_lines_count
+        if isinstance(result_cache, str):
+            result_cache = ResultCache(backend=result_cache)
+        self.result_cache = result_cache
+        self._ready_lock = threading.Lock()
+        self.init_futures = {}
+        self.number_plate_upscaling = None
 
         self.number_plate_key_points_detection = NumberPlateKeyPointsDetection(
             "number_plate_key_points_detection",
@@ -48,7 +61,7 @@ class NumberPlateDetectionAndReadingTrt(NumberPlateDetectionAndReading):
             default_label=default_label,
             default_lines_count=default_lines_count,
         )
-       
+
         self.pipelines = [
             self.number_plate_classification,
             self.number_plate_text_reading,
@@ -57,3 +70,8 @@ class NumberPlateDetectionAndReadingTrt(NumberPlateDetectionAndReading):
         ]
         Pipeline.__init__(self, task, image_loader, **kwargs)
         CompositePipeline.__init__(self, self.pipelines)
+
+    def update_pipelines(self) -> None:
+        """
+        Sub-pipelines are created in __init__, self.pipelines (with key points detection) is kept as is
+        """
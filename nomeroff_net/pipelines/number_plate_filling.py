@@ -4,6 +4,7 @@ from typing import Any, Dict, Optional, Union
 from nomeroff_net.image_loaders import BaseImageLoader
 from nomeroff_net.pipelines.base import Pipeline, empty_method
 from nomeroff_net.tools import unzip
+from nomeroff_net.tools.image_processing import unscale_points
 from .number_plate_localization import NumberPlateLocalization
 
 
@@ -45,9 +46,11 @@ class NumberPlateFilling(Pipeline):
 
         filled_images = []
         for bboxs, image in zip(images_bboxs, images):
+            # keypoints are of the full image, images decoded at reduced resolution are filled at their scale
+            scale = getattr(image, "scale", None)
             image = image.astype(np.uint8)
             for bbox in bboxs:
-                cntr = bbox[-1]
+                cntr = unscale_points(bbox[-1], scale)
                 cntr = np.array(cntr, dtype=np.int32)
                 cv2.drawContours(image, [cntr], -1, (0, 0, 0), -1)
             filled_images.append(image)
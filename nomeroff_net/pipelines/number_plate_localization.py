@@ -1,8 +1,11 @@
+import numpy as np
 from torch import no_grad
 from typing import Any, Dict, Optional, Union
-from nomeroff_net.image_loaders import BaseImageLoader
+from nomeroff_net.image_loaders import BaseImageLoader, ScaledImage
 from nomeroff_net.pipelines.base import Pipeline
 from nomeroff_net.tools import unzip
+from nomeroff_net.tools.model_registry import model_registry
+from nomeroff_net.tools.image_processing import scale_bboxes
 from nomeroff_net.pipes.number_plate_localizators.yolo_kp_detector import Detector
 
 
@@ -20,8 +23,42 @@ class NumberPlateLocalization(Pipeline):
         super().__init__(task, image_loader, **kwargs)
         if detector is None:
             detector = Detector
-        self.detector = detector()
-        self.detector.load(path_to_model)
+        self.detector_class = detector
+        self.path_to_model = path_to_model
+        self.model_key = self.make_model_key(path_to_model)
+        self.detector = model_registry.acquire(self.model_key, lambda: self.load_detector(detector, path_to_model))
+
+    def make_model_key(self, path_to_model):
+        return model_registry.make_key(f"{self.detector_class.__module__}.{self.detector_class.__qualname__}",
+                                       path_to_model)
+
+    def validate_detector(self, detector):
+        """
+        Default reload canary: the new detector runs on a random image
+        """
+        detector.predict(self.make_random_images((640, 640)))
+
+    def reload(self, path_to_model: str = None, validate=None):
+        """
+        Hot reload of the detector weights (the same path re-downloads "latest"), see model_registry.reload
+        Args:
+            path_to_model (): new path_to_model, current if None
+            validate (): validate(detector) canary, must raise on failure, validate_detector if None
+        """
+        path_to_model = path_to_model or self.path_to_model
+        model_key = self.make_model_key(path_to_model)
+        model_registry.reload(self.model_key,
+                              lambda: self.load_detector(self.detector_class, path_to_model),
+                              validate=validate or self.validate_detector,
+                              new_key=model_key)
+        self.path_to_model = path_to_model
+        self.model_key = model_key
+
+    @staticmethod
+    def load_detector(detector, path_to_model):
+        detector = detector()
+        detector.load(path_to_model)
+        return detector
 
     def sanitize_parameters(self, img_size=None, stride=None, min_accuracy=None, **kwargs):
         parameters = {}
@@ -38,12 +75,17 @@ class NumberPlateLocalization(Pipeline):
         return super().__call__(images, **kwargs)
 
     def preprocess(self, inputs: Any, **preprocess_parameters: Dict) -> Any:
-        images = [self.image_loader.load(item) for item in inputs]
+        images = [self.image_loader.load_any(item) for item in inputs]
         return images
 
     @no_grad()
     def forward(self, images: Any, **forward_parameters: Dict) -> Any:
-        model_outputs = self.detector.predict(images)
+        # images decoded at reduced resolution (ScaledImage) go to the model as plain arrays,
+        # their bboxes and keypoints are mapped back to the full resolution
+        model_outputs = self.detector.predict([np.asarray(image) if isinstance(image, ScaledImage) else image
+                                               for image in images])
+        model_outputs = [scale_bboxes(bboxes, getattr(image, "scale", None))
+                         for bboxes, image in zip(model_outputs, images)]
         return unzip([model_outputs, images])
 
     def postprocess(self, inputs: Any, **postprocess_parameters: Dict) -> Any:
@@ -1,8 +1,10 @@
 from torch import no_grad
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, Optional, Union, List
+from concurrent.futures import Executor
 from nomeroff_net.image_loaders import BaseImageLoader
 from nomeroff_net.pipelines.base import Pipeline
 from nomeroff_net.tools import unzip
+from nomeroff_net.tools.zone_cache import ZoneCache
 from nomeroff_net.pipes.number_plate_text_readers.text_detector import TextDetector
 
 DEFAULT_PRESETS = {
@@ -97,7 +99,21 @@ class NumberPlateTextReading(Pipeline):
                  option_detector_height=0,
                  off_number_plate_classification=True,
                  multiline_splitter="",
+                 lazy_load: bool = False,
+                 memory_budget_mb: float = None,
+                 preload: List[str] = None,
+                 load_executor: Executor = None,
+                 zone_cache: ZoneCache = None,
                  **kwargs):
+        """
+        Args:
+            lazy_load (): load OCR models on the first zone of their region instead of all presets at init
+            memory_budget_mb (): with lazy_load, evict least recently used OCR models over this budget
+            preload (): with lazy_load, preset names or regions to load at init
+            load_executor (): load OCR presets in this executor, the pipeline is returned at once
+                              and zones of a preset wait for its model (see detector.is_ready)
+            zone_cache (): remember texts of recently seen zones, see nomeroff_net.tools.zone_cache
+        """
         if presets is None:
             presets = DEFAULT_PRESETS
         super().__init__(task, image_loader, **kwargs)
@@ -105,7 +121,12 @@ class NumberPlateTextReading(Pipeline):
                                        option_detector_width=option_detector_width,
                                        option_detector_height=option_detector_height,
                                        off_number_plate_classification=off_number_plate_classification,
-                                       multiline_splitter=multiline_splitter)
+                                       multiline_splitter=multiline_splitter,
+                                       lazy_load=lazy_load,
+                                       memory_budget_mb=memory_budget_mb,
+                                       preload=preload,
+                                       load_executor=load_executor,
+                                       zone_cache=zone_cache)
 
     def sanitize_parameters(self, **kwargs):
         return {}, {}, {}
@@ -115,7 +136,7 @@ class NumberPlateTextReading(Pipeline):
 
     def preprocess(self, inputs: Any, **preprocess_parameters: Dict) -> Any:
         images, labels, lines, preprocessed_np = unzip(inputs)
-        images = [self.image_loader.load(item) for item in images]
+        images = [self.image_loader.load_any(item) for item in images]
         return unzip([images, labels, lines, preprocessed_np])
 
     @no_grad()
@@ -129,3 +150,18 @@ class NumberPlateTextReading(Pipeline):
     def postprocess(self, inputs: Any, **postprocess_parameters: Dict) -> Any:
         images, model_outputs, labels = unzip(inputs)
         return unzip([model_outputs, images])
+
+    @no_grad()
+    def read_texts(self, zones: List, labels: List[str], lines: List[int], preprocessed_np: List,
+                   batch_size: int = 1, **_) -> List[str]:
+        """
+        Texts of the zones given as columns, the same as texts of the call over zipped
+        (zone, label, lines, preprocessed_np) tuples without zipping columns into tuples and back
+        """
+        texts = []
+        for start in range(0, len(zones), max(batch_size, 1)):
+            part = slice(start, start + max(batch_size, 1))
+            images = [self.image_loader.load_any(item) for item in zones[part]]
+            model_inputs = self.detector.preprocess(images, preprocessed_np[part], labels[part], lines[part])
+            texts.extend(self.detector.postprocess(self.detector.forward(model_inputs)))
+        return texts
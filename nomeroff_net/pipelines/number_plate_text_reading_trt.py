@@ -29,3 +29,14 @@ class NumberPlateTextReadingTrt(NumberPlateTextReading):
             model_output = self.detector.postprocess(model_output)
             model_outputs.append(model_output[0])
         return unzip([images, model_outputs, labels])
+
+    def read_texts(self, zones, labels, lines, preprocessed_np=None, **_):
+        """
+        Texts of the zones given as columns, zone by zone as in forward
+        """
+        texts = []
+        for zone, label, line in zip(zones, labels, lines):
+            model_inputs = self.detector.preprocess([zone], [label], [line])
+            model_output = self.detector.forward(model_inputs)
+            texts.append(self.detector.postprocess(model_output)[0])
+        return texts
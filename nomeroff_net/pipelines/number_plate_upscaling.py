@@ -25,7 +25,7 @@ class NumberPlateUpscaling(Pipeline):
         return super().__call__(images, **kwargs)
 
     def preprocess(self, inputs: Any, **preprocess_parameters: Dict) -> Any:
-        images = [self.image_loader.load(item) for item in inputs]
+        images = [self.image_loader.load_any(item) for item in inputs]
         return images
 
     @no_grad()
@@ -0,0 +1,461 @@
+"""
+Multi-process sharded pipeline runner
+
+Every worker process loads the models once, batches of inputs are sharded across workers,
+numpy images are handed over through shared memory and results are merged back in order.
+
+Examples:
+    >>> from nomeroff_net.pipelines.process_pool import ProcessPoolPipeline
+    >>> with ProcessPoolPipeline("number_plate_detection_and_reading", image_loader="opencv",
+    ...                          num_processes=4) as number_plate_detection_and_reading:
+    ...     results = number_plate_detection_and_reading(['./data/examples/oneline_images/example1.jpeg',
+    ...                                                   './data/examples/oneline_images/example2.jpeg'],
+    ...                                                  batch_size=1,
+    ...                                                  fields=["bboxs", "confidences", "texts"])
+    ...     print(number_plate_detection_and_reading.get_stat())
+
+python3 -m nomeroff_net.pipelines.process_pool -f nomeroff_net/pipelines/process_pool.py
+"""
+import os
+import time
+import pickle
+import threading
+import traceback
+import numpy as np
+import multiprocessing as mp
+from queue import Empty
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, List, Union
+
+from nomeroff_net.image_loaders import BaseImageLoader, image_loaders_map
+from nomeroff_net.tools.pipeline_tools import chunked_iterable
+from nomeroff_net.tools.plate_batch_result import PlateBatchResult
+
+
+class _SharedImage(object):
+    """
+    Reference to the image in the shared memory block of the batch
+    """
+
+    def __init__(self, offset, shape, dtype):
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+
+
+class _SharedInput(object):
+    """
+    Marker of the output image that is the input image of the parent process
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+
+def _put_images_to_shared_memory(items):
+    """
+    Copy numpy items to one shared memory block, return the block and items with _SharedImage references
+    """
+    arrays = [item for item in items if isinstance(item, np.ndarray)]
+    if not arrays:
+        return None, items
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(array.nbytes for array in arrays)))
+    refs = []
+    offset = 0
+    for item in items:
+        if not isinstance(item, np.ndarray):
+            refs.append(item)
+            continue
+        view = np.ndarray(item.shape, dtype=item.dtype, buffer=shm.buf, offset=offset)
+        view[...] = item
+        del view
+        refs.append(_SharedImage(offset, item.shape, item.dtype.str))
+        offset += item.nbytes
+    return shm, refs
+
+
+def _release_shared_memory(shm):
+    if shm is None:
+        return
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _map_output_images(outputs, func):
+    """
+    Apply func(index, image) to the image of every output (the first item of tuple outputs)
+    """
+    if isinstance(outputs, PlateBatchResult):
+        if outputs.images is not None:
+            outputs.images = [func(i, image) for i, image in enumerate(outputs.images)]
+        return outputs
+    return [(func(i, output[0]), *output[1:]) if isinstance(output, tuple) and len(output) else output
+            for i, output in enumerate(outputs)]
+
+
+def _init_torch_threads(num_threads):
+    if num_threads is None:
+        return
+    import torch
+    torch.set_num_threads(num_threads)
+
+
+def _worker_main(worker_id, task, image_loader, pipeline_kwargs, kwargs, num_threads, tasks, results):
+    """
+    Worker process: load pipeline once, run batches from tasks queue until None
+    """
+    try:
+        _init_torch_threads(num_threads)
+        start_time = time.perf_counter()
+        if callable(task):
+            pipeline = task(**pipeline_kwargs, **kwargs)
+        else:
+            from nomeroff_net.pipelines import pipeline as create_pipeline
+            pipeline = create_pipeline(task, image_loader=None, pipeline_kwargs=pipeline_kwargs, **kwargs)
+        if isinstance(image_loader, str):
+            image_loader = image_loaders_map[image_loader]()
+        results.put(("ready", worker_id, os.getpid(), time.perf_counter() - start_time))
+    except BaseException:
+        results.put(("failed", worker_id, os.getpid(), traceback.format_exc()))
+        return
+
+    while True:
+        job = tasks.get()
+        if job is None:
+            break
+        batch_id, shm_name, items, call_kwargs = job
+        results.put(("started", worker_id, batch_id, None))
+        start_time = time.perf_counter()
+        shm = None
+        images = []
+        try:
+            if shm_name is not None:
+                shm = shared_memory.SharedMemory(name=shm_name)
+            for item in items:
+                if isinstance(item, _SharedImage):
+                    images.append(np.ndarray(item.shape, dtype=np.dtype(item.dtype),
+                                             buffer=shm.buf, offset=item.offset))
+                elif image_loader is not None:
+                    images.append(image_loader.load_any(item))
+                else:
+                    images.append(item)
+            outputs = pipeline(images, **call_kwargs)
+            if shm is not None:
+                # the parent process has these images, do not send them back
+                shared_ids = {id(image): i for i, (image, item) in enumerate(zip(images, items))
+                              if isinstance(item, _SharedImage)}
+                outputs = _map_output_images(outputs,
+                                             lambda i, image: _SharedInput(shared_ids[id(image)])
+                                             if id(image) in shared_ids else image)
+            # serialize here, shared memory views must be released before the block is closed
+            message = ("done", worker_id, batch_id, (pickle.dumps(outputs, protocol=pickle.HIGHEST_PROTOCOL),
+                                                     len(items), time.perf_counter() - start_time))
+        except BaseException:
+            message = ("error", worker_id, batch_id, (traceback.format_exc(), len(items),
+                                                      time.perf_counter() - start_time))
+        outputs = images = None
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                # some output still references the block, it is closed when the output is collected
+                pass
+        results.put(message)
+
+
+class ProcessPoolPipeline(object):
+    """
+    Pipeline wrapper that runs the pipeline in N worker processes
+    """
+
+    def __init__(self,
+                 task: Union[str, Callable],
+                 image_loader: Union[str, BaseImageLoader] = None,
+                 num_processes: int = 2,
+                 pipeline_kwargs: Dict = None,
+                 num_threads: int = None,
+                 max_inflight: int = None,
+                 start_method: str = "spawn",
+                 wait_ready: bool = True,
+                 **kwargs):
+        """
+        Args:
+            task (): pipeline task name or picklable pipeline factory
+            image_loader (): image loader for path inputs, runs in the worker processes
+            num_processes (): count of worker processes
+            pipeline_kwargs (): pipeline kwargs
+            num_threads (): torch threads per worker, by default cpu_count // num_processes
+            max_inflight (): max count of batches of one stream sent to workers and not yet returned,
+                             by default 2 * num_processes
+            start_method (): multiprocessing start method
+            wait_ready (): wait until all workers load models
+            kwargs (): pipeline kwargs
+        """
+        self.num_processes = num_processes
+        self.max_inflight = max_inflight or 2 * num_processes
+        if num_threads is None:
+            num_threads = max(1, (os.cpu_count() or 1) // num_processes)
+        self._context = mp.get_context(start_method)
+        # every worker has its own tasks queue, so batches of a dead worker are known
+        self._tasks = [self._context.Queue() for _ in range(num_processes)]
+        self._results = self._context.Queue()
+        # held only while one batch is submitted or one message is received, never across yields
+        self._lock = threading.Lock()
+        self._batch_id = 0
+        # batch id -> (chunk, shared memory, done dict of the stream or None if the stream is gone, worker id)
+        self._inflight = {}
+        self._assigned = {worker_id: set() for worker_id in range(num_processes)}
+        self._closed = False
+        self.workers = []
+        self.stat = {}
+        for worker_id in range(num_processes):
+            process = self._context.Process(target=_worker_main,
+                                            args=(worker_id, task, image_loader, pipeline_kwargs or {}, kwargs,
+                                                  num_threads, self._tasks[worker_id], self._results),
+                                            daemon=True)
+            process.start()
+            self.workers.append(process)
+            self.stat[worker_id] = {
+                "pid": process.pid,
+                "state": "starting",
+                "load_time": None,
+                "batches": 0,
+                "images": 0,
+                "errors": 0,
+                "busy_time": 0.,
+                "current_batch": None,
+                "last_seen": time.time(),
+            }
+        self._start_time = time.perf_counter()
+        if wait_ready:
+            self.wait_ready()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def wait_ready(self, timeout: float = None):
+        """
+        Wait until all workers load the pipeline, raise RuntimeError if some worker failed
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            with self._lock:
+                for worker_id, stat in self.stat.items():
+                    if stat["state"] in ("failed", "dead"):
+                        raise RuntimeError(f"ProcessPoolPipeline worker {worker_id} failed to start:\n"
+                                           f"{stat.get('error', stat.get('exitcode'))}")
+                if not any(stat["state"] == "starting" for stat in self.stat.values()):
+                    return
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise TimeoutError("ProcessPoolPipeline workers are not ready")
+                self._receive()
+
+    def _receive(self):
+        """
+        Handle one message from workers (under the lock), the finished batch is put to the done dict of its stream
+        """
+        try:
+            kind, worker_id, batch_id, payload = self._results.get(timeout=0.5)
+        except Empty:
+            self._check_workers()
+            return
+        stat = self.stat[worker_id]
+        stat["last_seen"] = time.time()
+        if kind == "ready":
+            stat["state"] = "ready"
+            stat["load_time"] = payload
+            return
+        if kind == "failed":
+            stat["state"] = "failed"
+            stat["error"] = payload
+            self._fail_batches(worker_id, RuntimeError(f"ProcessPoolPipeline worker {worker_id} "
+                                                       f"failed to start:\n{payload}"))
+            return
+        if kind == "started":
+            stat["current_batch"] = batch_id
+            return
+        data, count_images, busy_time = payload
+        stat["current_batch"] = None
+        stat["busy_time"] += busy_time
+        self._assigned[worker_id].discard(batch_id)
+        if kind == "error":
+            stat["errors"] += 1
+        else:
+            stat["batches"] += 1
+            stat["images"] += count_images
+        chunk, shm, done, _ = self._inflight.pop(batch_id, (None, None, None, None))
+        _release_shared_memory(shm)
+        if done is None:
+            return
+        if kind == "error":
+            done[batch_id] = RuntimeError(f"ProcessPoolPipeline worker {worker_id} failed on batch:\n{data}")
+        else:
+            done[batch_id] = (data, chunk)
+
+    def _fail_batches(self, worker_id, error):
+        """
+        Batches assigned to the worker that will never be returned are failed with error
+        """
+        for batch_id in self._assigned[worker_id]:
+            _, shm, done, _ = self._inflight.pop(batch_id, (None, None, None, None))
+            _release_shared_memory(shm)
+            if done is not None:
+                done[batch_id] = error
+        self._assigned[worker_id].clear()
+
+    def _check_workers(self):
+        for worker_id, process in enumerate(self.workers):
+            if process.is_alive():
+                continue
+            stat = self.stat[worker_id]
+            if stat["state"] not in ("dead", "failed", "stopped"):
+                stat["state"] = "dead"
+                stat["exitcode"] = process.exitcode
+            if self._assigned[worker_id]:
+                self._fail_batches(worker_id, RuntimeError(f"ProcessPoolPipeline worker {worker_id} "
+                                                           f"died with exit code {process.exitcode}"))
+
+    def _submit(self, chunk, call_kwargs, done) -> int:
+        """
+        Send the batch (under the lock) to the live worker with the fewest assigned batches
+        """
+        workers = [worker_id for worker_id, process in enumerate(self.workers)
+                   if process.is_alive() and self.stat[worker_id]["state"] in ("starting", "ready")]
+        if not workers:
+            raise RuntimeError("All ProcessPoolPipeline workers are dead")
+        worker_id = min(workers, key=lambda i: len(self._assigned[i]))
+        batch_id = self._batch_id
+        self._batch_id += 1
+        shm, items = _put_images_to_shared_memory(chunk)
+        self._inflight[batch_id] = (chunk, shm, done, worker_id)
+        self._assigned[worker_id].add(batch_id)
+        self._tasks[worker_id].put((batch_id, None if shm is None else shm.name, items, call_kwargs))
+        return batch_id
+
+    def _next_result(self, batch_ids, done):
+        """
+        Wait for the first batch of the stream, messages of other streams are routed to their done dicts
+        """
+        batch_id = batch_ids[0]
+        while True:
+            with self._lock:
+                if batch_id in done:
+                    batch_ids.popleft()
+                    result = done.pop(batch_id)
+                    break
+                self._receive()
+        if isinstance(result, BaseException):
+            raise result
+        data, chunk = result
+        return _map_output_images(pickle.loads(data),
+                                  lambda i, image: chunk[image.index] if isinstance(image, _SharedInput) else image)
+
+    def _abandon(self, batch_ids):
+        """
+        The stream is stopped or failed: its batches still in workers are dropped when they are returned
+        """
+        with self._lock:
+            for batch_id in batch_ids:
+                if batch_id in self._inflight:
+                    _, shm, _, worker_id = self._inflight[batch_id]
+                    self._inflight[batch_id] = (None, shm, None, worker_id)
+        batch_ids.clear()
+
+    def stream_batches(self, inputs: Iterable, batch_size: int = 1, **call_kwargs):
+        """
+        Yield outputs of the pipeline call for every batch of inputs, in order of inputs,
+        several streams may run at once from different threads
+        """
+        if self._closed:
+            raise RuntimeError("ProcessPoolPipeline is closed")
+        batch_ids = deque()
+        done = {}
+        call_kwargs = dict(call_kwargs, batch_size=batch_size)
+        try:
+            for chunk in chunked_iterable(inputs, batch_size):
+                while len(batch_ids) >= self.max_inflight:
+                    yield self._next_result(batch_ids, done)
+                with self._lock:
+                    batch_ids.append(self._submit(chunk, call_kwargs, done))
+            while batch_ids:
+                yield self._next_result(batch_ids, done)
+        finally:
+            self._abandon(batch_ids)
+
+    def stream(self, inputs: Iterable, batch_size: int = 1, **call_kwargs):
+        """
+        Yield outputs one by one, in order of inputs
+        """
+        for outputs in self.stream_batches(inputs, batch_size=batch_size, **call_kwargs):
+            for output in outputs:
+                yield output
+
+    def __call__(self, inputs: Iterable, batch_size: int = 1, **call_kwargs) -> Union[List, PlateBatchResult]:
+        if call_kwargs.get("columnar", False):
+            return PlateBatchResult.concat(list(self.stream_batches(inputs, batch_size=batch_size, **call_kwargs)))
+        return list(self.stream(inputs, batch_size=batch_size, **call_kwargs))
+
+    def get_stat(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Per worker health and throughput counters
+        """
+        for worker_id, process in enumerate(self.workers):
+            if not process.is_alive() and self.stat[worker_id]["state"] not in ("dead", "failed", "stopped"):
+                self.stat[worker_id]["state"] = "dead"
+                self.stat[worker_id]["exitcode"] = process.exitcode
+        uptime = time.perf_counter() - self._start_time
+        res = {}
+        for worker_id, stat in self.stat.items():
+            busy_time = stat["busy_time"]
+            res[worker_id] = dict(stat,
+                                  alive=self.workers[worker_id].is_alive(),
+                                  assigned_batches=len(self._assigned[worker_id]),
+                                  images_per_second=stat["images"] / uptime if uptime else 0.,
+                                  busy_images_per_second=stat["images"] / busy_time if busy_time else 0.,
+                                  utilization=busy_time / uptime if uptime else 0.)
+        return res
+
+    def close(self, timeout: float = 10):
+        """
+        Stop worker processes
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for tasks in self._tasks:
+            tasks.put(None)
+        for worker_id, process in enumerate(self.workers):
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            self.stat[worker_id]["state"] = "stopped"
+        with self._lock:
+            for _, shm, _, _ in self._inflight.values():
+                _release_shared_memory(shm)
+            self._inflight.clear()
+
+
+if __name__ == "__main__":
+    import cv2
+    from glob import glob
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    image_paths = sorted(glob(os.path.join(current_dir, "../../data/examples/oneline_images/*")))
+
+    with ProcessPoolPipeline("number_plate_detection_and_reading", image_loader="opencv",
+                             num_processes=2) as process_pool_pipeline:
+        # path inputs are decoded in workers, numpy inputs are handed over through shared memory
+        path_texts = [res[-1] for res in process_pool_pipeline(image_paths, batch_size=2)]
+        arrays = [cv2.imread(path)[..., ::-1].copy() for path in image_paths]
+        array_results = process_pool_pipeline(arrays, batch_size=2)
+        assert [res[-1] for res in array_results] == path_texts
+        print(path_texts)
+        print(process_pool_pipeline.get_stat())
@@ -1,6 +1,8 @@
 import os
 import io
 import sys
+import pickle
+import warnings
 from typing import List, Dict, Tuple
 import numpy as np
 
@@ -11,12 +13,11 @@ from pytorch_lightning.callbacks import ModelCheckpoint
 from pytorch_lightning.callbacks import LearningRateMonitor
 
 from nomeroff_net.tools.mcm import (modelhub, get_device_torch)
+from nomeroff_net.tools.checkpoint_tools import load_checkpoint, load_state_dict_from_checkpoint
 from nomeroff_net.data_modules.numberplate_options_data_module import OptionsNetDataModule
 from nomeroff_net.nnmodels.numberplate_options_model import NPOptionsNet
 from nomeroff_net.tools.image_processing import normalize_img, convert_cv_zones_rgb_to_bgr
 
-device_torch = get_device_torch()
-
 CLASS_REGION_ALL = [
     "xx-unknown",
     "eu-ua-2015",
@@ -146,7 +147,7 @@ class OptionsDetector(object):
                                       batch_size=self.batch_size,
                                       train_regions=self.train_regions,
                                       train_count_lines=self.train_count_lines, )
-            self.model = self.model.to(device_torch)
+            self.model = self.model.to(get_device_torch())
         return self.model
 
     def prepare(self,
@@ -278,7 +279,7 @@ class OptionsDetector(object):
                                                        batch_size=self.batch_size,
                                                        train_regions=self.train_regions,
                                                        train_count_lines=self.train_count_lines, )
-        self.model = self.model.to(device_torch)
+        self.model = self.model.to(get_device_torch())
         self.model.eval()
         return self.model
 
@@ -394,11 +395,31 @@ class OptionsDetector(object):
             self.width = model_info.get("width", self.width)
         return path_to_model
 
-    def load(self, path_to_model: str = "latest", options: Dict = None) -> NPOptionsNet:
+    def load_model_fast(self, path_to_model):
+        """
+        Build the model and load the state dict directly, without pytorch-lightning checkpoint round-trip
+        """
+        checkpoint = load_checkpoint(path_to_model)
+        self.model = NPOptionsNet(len(self.class_region),
+                                  len(self.count_lines),
+                                  batch_size=self.batch_size,
+                                  train_regions=self.train_regions,
+                                  train_count_lines=self.train_count_lines, )
+        load_state_dict_from_checkpoint(self.model, checkpoint)
+        self.model = self.model.to(get_device_torch())
+        self.model.eval()
+        return self.model
+
+    def load(self, path_to_model: str = "latest", options: Dict = None, fast_load: bool = True) -> NPOptionsNet:
         """
         TODO: describe method
         """
         path_to_model = self.load_meta(path_to_model, options)
+        if fast_load:
+            try:
+                return self.load_model_fast(path_to_model)
+            except (RuntimeError, KeyError, pickle.UnpicklingError) as e:
+                warnings.warn(f"Fast loading of {path_to_model} failed ({e}), loading with pytorch-lightning")
         self.create_model()
         return self.load_model(path_to_model)
 
@@ -413,7 +434,7 @@ class OptionsDetector(object):
 
     def _predict(self, xs):
         x = torch.tensor(np.moveaxis(np.array(xs), 3, 1))
-        x = x.to(device_torch)
+        x = x.to(get_device_torch())
         predicted = [p.cpu().numpy() for p in self.model(x)]
         return predicted
 
@@ -437,7 +458,7 @@ class OptionsDetector(object):
 
     def forward(self, inputs):
         x = torch.tensor(inputs)
-        x = x.to(device_torch)
+        x = x.to(get_device_torch())
         model_output = self.model(x)
         return model_output
 
@@ -16,8 +16,6 @@ from nomeroff_net.tools.image_processing import normalize_img
 from nomeroff_net.nnmodels.numberplate_region_model import NPRegionNet
 from nomeroff_net.nnmodels.numberplate_count_line_model import NPLineNet, ClassificationNet
 
-device_torch = get_device_torch()
-
 CLASS_REGION_ALL = [
     "xx-unknown",
     "eu-ua-2015",
@@ -138,14 +136,14 @@ class OptionsDetector(object):
         if self.region_model is None:
             self.region_model = NPRegionNet(len(self.class_region), batch_size=self.batch_size,
                                             learning_rate=self.learning_rate, backbone=self.backbone)
-            self.region_model = self.region_model.to(device_torch)
+            self.region_model = self.region_model.to(get_device_torch())
         return self.region_model
 
     def create_line_model(self) -> NPLineNet:
         if self.line_model is None:
             self.line_model = NPLineNet(len(self.count_lines), batch_size=self.batch_size,
                                         learning_rate=self.learning_rate, backbone=self.backbone)
-            self.line_model = self.line_model.to(device_torch)
+            self.line_model = self.line_model.to(get_device_torch())
         return self.line_model
 
     def prepare(self,
@@ -286,7 +284,7 @@ class OptionsDetector(object):
                                                              map_location=torch.device('cpu'),
                                                              region_output_size=len(self.class_region),
                                                              batch_size=self.batch_size,)
-        self.region_model = self.region_model.to(device_torch)
+        self.region_model = self.region_model.to(get_device_torch())
         self.region_model.eval()
         return self.region_model
 
@@ -307,7 +305,7 @@ class OptionsDetector(object):
                                                          map_location=torch.device('cpu'),
                                                          count_line_output_size=len(self.count_lines),
                                                          batch_size=self.batch_size,)
-        self.line_model = self.line_model.to(device_torch)
+        self.line_model = self.line_model.to(get_device_torch())
         self.line_model.eval()
         return self.line_model
 
@@ -443,7 +441,7 @@ class OptionsDetector(object):
 
     def _predict(self, xs):
         x = torch.tensor(np.moveaxis(np.array(xs), 3, 1))
-        x = x.to(device_torch)
+        x = x.to(get_device_torch())
         predicted = [p.cpu().numpy() for p in self.model(x)]
         return predicted
 
@@ -467,7 +465,7 @@ class OptionsDetector(object):
 
     def forward(self, inputs):
         x = torch.tensor(inputs)
-        x = x.to(device_torch)
+        x = x.to(get_device_torch())
         model_output = self.model(x)
         return model_output
 
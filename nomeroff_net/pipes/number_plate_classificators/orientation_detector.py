@@ -17,8 +17,6 @@ from nomeroff_net.data_modules.numberplate_orientation_data_module import Orient
 from nomeroff_net.nnmodels.numberplate_orientation_model import NPOrientationNet
 from nomeroff_net.tools.image_processing import normalize_img
 
-device_torch = get_device_torch()
-
 
 def prettify_orientation(photo_orientation):
     pretty_orientation = 0
@@ -83,7 +81,7 @@ class OrientationDetector(object):
                                       width=self.width,
                                       output_size=self.output_size,
                                       batch_size=self.batch_size)
-        self.model = self.model.to(device_torch)
+        self.model = self.model.to(get_device_torch())
         return self.model
 
     def prepare(self,
@@ -110,7 +108,7 @@ class OrientationDetector(object):
             output_size=self.output_size,
             backbone=self.backbone,
         )
-        self.model = self.model.to(device_torch)
+        self.model = self.model.to(get_device_torch())
         self.model.eval()
         return self.model
 
@@ -209,7 +207,7 @@ class OrientationDetector(object):
 
     def _predict(self, xs):
         x = torch.tensor(np.moveaxis(np.array(xs), 3, 1))
-        x = x.to(device_torch)
+        x = x.to(get_device_torch())
         predicted = [p.cpu().numpy() for p in self.model(x)]
         return predicted
 
@@ -5,6 +5,8 @@ import os
 import io
 import cv2
 import json
+import pickle
+import warnings
 import numpy as np
 import torch
 import pytorch_lightning as pl
@@ -22,13 +24,11 @@ from nomeroff_net.nnmodels.ocr_model import NPOcrNet, weights_init
 from nomeroff_net.tools.image_processing import normalize_img
 from nomeroff_net.tools.errors import OCRError
 from nomeroff_net.tools.mcm import modelhub, get_device_torch
-from nomeroff_net.tools.augmentations import aug_seed
+from nomeroff_net.tools.checkpoint_tools import load_checkpoint, load_state_dict_from_checkpoint
 from nomeroff_net.tools.ocr_tools import (StrLabelConverter,
                                           decode_prediction,
                                           decode_batch)
 
-device_torch = get_device_torch()
-
 
 class OCR(object):
 
@@ -62,6 +62,7 @@ class OCR(object):
 
         self.label_converter = None
         self.path_to_model = None
+        self.backbone_shape = None
 
     def init_label_converter(self):
         self.label_converter = StrLabelConverter("".join(self.letters), self.max_text_len)
@@ -166,7 +167,7 @@ class OCR(object):
                               max_text_len=self.max_text_len)
         if 'resnet' in str(self.backbone):
             self.model.apply(weights_init)
-        self.model = self.model.to(device_torch)
+        self.model = self.model.to(get_device_torch())
         return self.model
 
     def train(self,
@@ -178,6 +179,7 @@ class OCR(object):
         TODO: describe method
         """
         if seed is not None:
+            from nomeroff_net.tools.augmentations import aug_seed
             aug_seed(seed)
             pl.seed_everything(seed)
         if self.model is None:
@@ -250,7 +252,7 @@ class OCR(object):
         else:
             xs = np.array(imgs)
         xs = torch.tensor(xs)
-        xs = xs.to(device_torch)
+        xs = xs.to(get_device_torch())
         return xs
 
     def forward(self, xs):
@@ -324,8 +326,9 @@ class OCR(object):
                                                    width=self.width,
                                                    color_channels=self.color_channels,
                                                    max_text_len=self.max_text_len,
+                                                   pretrained_backbone=False,
                                                    **{'pytorch_lightning_version': '0.0.0'})
-        self.model = self.model.to(device_torch)
+        self.model = self.model.to(get_device_torch())
         self.model.eval()
         return self.model
 
@@ -353,14 +356,44 @@ class OCR(object):
         self.width = model_info.get("width", self.width)
         self.color_channels = model_info.get("color_channels", self.color_channels)
         self.linear_size = model_info.get("linear_size", self.linear_size)
+        self.backbone_shape = model_info.get("backbone_shape", self.backbone_shape)
         return path_to_model
 
-    def load(self, path_to_model: str = "latest", nn_class=NPOcrNet) -> NPOcrNet:
+    def load_model_fast(self, path_to_model, nn_class=NPOcrNet):
+        """
+        Build the model without pretrained backbone weights and load the state dict directly
+        """
+        self.path_to_model = path_to_model
+        # checkpoints of the trainer keep the backbone and the label converter in hyper_parameters
+        checkpoint = load_checkpoint(path_to_model, safe_globals=[self.backbone, StrLabelConverter])
+        hyper_parameters = checkpoint.get("hyper_parameters", {})
+        self.model = nn_class(self.letters,
+                              linear_size=self.linear_size,
+                              hidden_size=self.hidden_size,
+                              backbone=self.backbone,
+                              letters_max=len(self.letters) + 1,
+                              label_converter=self.label_converter,
+                              height=self.height,
+                              width=self.width,
+                              color_channels=self.color_channels,
+                              max_text_len=self.max_text_len,
+                              pretrained_backbone=False,
+                              backbone_shape=hyper_parameters.get("backbone_shape", self.backbone_shape))
+        load_state_dict_from_checkpoint(self.model, checkpoint)
+        self.model = self.model.to(get_device_torch())
+        self.model.eval()
+        return self.model
+
+    def load(self, path_to_model: str = "latest", nn_class=NPOcrNet, fast_load: bool = True) -> NPOcrNet:
         """
         TODO: describe method
         """
         path_to_model = self.load_meta(path_to_model)
-        self.create_model()
+        if fast_load:
+            try:
+                return self.load_model_fast(path_to_model, nn_class=nn_class)
+            except (RuntimeError, KeyError, pickle.UnpicklingError) as e:
+                warnings.warn(f"Fast loading of {path_to_model} failed ({e}), loading with pytorch-lightning")
         return self.load_model(path_to_model, nn_class=nn_class)
 
     @torch.no_grad()
@@ -392,11 +425,11 @@ class OCR(object):
     @torch.no_grad()
     def acc_calc(self, dataset, verbose: bool = False, save_test_result = False) -> float:
         acc = 0
-        self.model = self.model.to(device_torch)
+        self.model = self.model.to(get_device_torch())
         self.model.eval()
         for idx in range(len(dataset)):
             img, text = dataset[idx]
-            img = img.unsqueeze(0).to(device_torch)
+            img = img.unsqueeze(0).to(get_device_torch())
             logits = self.model(img)
             pred_text = decode_prediction(logits.cpu(), self.label_converter)
 
@@ -438,6 +471,24 @@ class OCR(object):
 
 
 if __name__ == "__main__":
+    import tempfile
+
+    # a checkpoint of the trainer (backbone and label converter in hyper_parameters) is loaded by the fast path
+    ocr = OCR(letters=list("0123456789ABC"), max_text_len=8)
+    ocr.init_label_converter()
+    net = NPOcrNet(ocr.letters, letters_max=len(ocr.letters) + 1, max_text_len=ocr.max_text_len,
+                   label_converter=ocr.label_converter, backbone=ocr.backbone, pretrained_backbone=False)
+    trainer = pl.Trainer(logger=False, enable_checkpointing=False, accelerator="cpu")
+    trainer.strategy.connect(net)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint_path = os.path.join(tmp_dir, "ocr.ckpt")
+        trainer.save_checkpoint(checkpoint_path, weights_only=True)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            loaded = ocr.load(checkpoint_path)
+        assert not [w for w in caught if "Fast loading" in str(w.message)], [str(w.message) for w in caught]
+        assert all(torch.equal(value, loaded.state_dict()[key]) for key, value in net.state_dict().items())
+
     det = OCR()
     det.get_classname = lambda: "Eu"
     det.letters = ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9", "A", "B", "C", "D", "E", "F", "G", "H", "I",
@@ -1,13 +1,20 @@
+import time
 import numpy as np
 import warnings
 import copy
 import torch
+import threading
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import Executor, Future
 from typing import List, Dict, Tuple
 from torch import no_grad
-from .base.ocr import OCR, device_torch
+from .base.ocr import OCR
 from .multiple_postprocessing import multiple_postprocessing_mapping
-from nomeroff_net.tools.mcm import modelhub
+from nomeroff_net.tools.mcm import modelhub, get_device_torch
 from nomeroff_net.tools.errors import TextDetectorError
+from nomeroff_net.tools.profiler import profile
+from nomeroff_net.tools.model_registry import model_registry
+from nomeroff_net.tools.zone_cache import ZoneCache
 from nomeroff_net.pipes.number_plate_keypoints_detectors.bbox_np_points_tools import split_numberplate
 from nomeroff_net.tools.image_processing import convert_cv_zones_rgb_to_bgr
 
@@ -25,7 +32,22 @@ class TextDetector(object):
                  option_detector_width=0,
                  option_detector_height=0,
                  multiline_splitter="",
-                 off_number_plate_classification=True) -> None:
+                 off_number_plate_classification=True,
+                 lazy_load: bool = False,
+                 memory_budget_mb: float = None,
+                 preload: List[str] = None,
+                 load_executor: Executor = None,
+                 zone_cache: ZoneCache = None) -> None:
+        """
+        Args:
+            lazy_load (): load OCR model the first time a zone is routed to it
+            memory_budget_mb (): with lazy_load, least recently used models are evicted
+                                 when resident models take more memory
+            preload (): preset names or regions which models are loaded at init with lazy_load
+            load_executor (): load presets in this executor (for example thread pool) and return at once,
+                              see load_futures, is_ready and wait_ready
+            zone_cache (): texts of recently seen zones by their hash, hits skip OCR forward and postprocess
+        """
         if presets is None:
             presets = {}
         self.presets = presets
@@ -42,6 +64,29 @@ class TextDetector(object):
         self.default_lines_count = int(default_lines_count)
         self.off_number_plate_classification = off_number_plate_classification
 
+        # StageProfiler for per preset timings
+        self.profiler = None
+
+        # lazy loading with LRU of resident models
+        self.lazy_load = lazy_load
+        self.memory_budget = None if memory_budget_mb is None else memory_budget_mb * 1024 * 1024
+        self.resident = OrderedDict()
+        self.stat = Counter()
+        self.events = deque(maxlen=100)
+        self._load_lock = threading.RLock()
+        # futures of models loaded by get_detector now, by detector id
+        self.loading = {}
+
+        # parallel loading
+        self.load_executor = load_executor
+        self.load_futures = {}
+
+        # hot reload swaps shared OCR models, versions of presets are counted for result caches
+        self.model_versions = Counter()
+        model_registry.subscribe(self.on_model_swap)
+
+        self.zone_cache = zone_cache
+
         for preset_name in self.presets:
             if preset_name in self.detectors_names:
                 detector_id = self.detectors_names.index(preset_name)
@@ -56,25 +101,317 @@ class TextDetector(object):
             if modelhub.models.get(preset_name, None) is None:
                 raise TextDetectorError("Text detector {} not exists.".format(preset_name))
 
-        if load_models:
+        if lazy_load:
+            self.detectors = [None for _ in self.detectors_names]
+            self.preload(preload or [])
+        elif load_models:
             self.load()
 
+    def load_detector(self, detector_name: str) -> OCR:
+        """
+        Shared OCR model of the preset, release it with model_registry.release
+        """
+        return model_registry.acquire(self.make_model_key(detector_name),
+                                      lambda: self.create_detector(detector_name))
+
+    def get_model_conf(self, detector_name: str) -> Dict:
+        """
+        modelhub config of the preset with the preset overrides (letters, max_text_len, sizes, ...)
+        """
+        model_conf = copy.deepcopy(modelhub.models[detector_name])
+        model_conf.update(self.presets[detector_name])
+        return model_conf
+
+    def make_model_key(self, detector_name: str, model_path: str = None) -> Tuple:
+        """
+        Registry key of the OCR model: presets with the same name but other overrides get their own models
+        """
+        model_conf = self.get_model_conf(detector_name)
+        if model_path is None:
+            model_path = model_conf["model_path"]
+        # routing options do not change the model
+        config = tuple(sorted((key, value) for key, value in model_conf.items()
+                              if key not in ("model_path", "for_regions", "for_count_lines")))
+        return model_registry.make_key(detector_name, model_path, config=config)
+
+    def create_detector(self, detector_name: str, model_path: str = None) -> OCR:
+        model_conf = self.get_model_conf(detector_name)
+        detector = OCR(model_name=detector_name, letters=model_conf["letters"],
+                       linear_size=model_conf["linear_size"], max_text_len=model_conf["max_text_len"],
+                       height=model_conf["height"], width=model_conf["width"],
+                       color_channels=model_conf["color_channels"],
+                       hidden_size=model_conf["hidden_size"], backbone=model_conf["backbone"])
+        detector.load(model_path or self.presets[detector_name]['model_path'])
+        detector.init_label_converter()
+        return detector
+
+    @staticmethod
+    def validate_detector(detector: OCR,
+                          zones: List[np.ndarray] = None,
+                          texts: List[str] = None,
+                          min_accuracy: float = 1.) -> None:
+        """
+        Reload canary: the new OCR model reads zones (random zones if None),
+        with texts at least min_accuracy of them must be read exactly
+        """
+        if zones is None:
+            rng = np.random.default_rng(0)
+            zones = [rng.integers(0, 256, (detector.height, detector.width, 3), dtype=np.uint8) for _ in range(2)]
+        with no_grad():
+            predicted = detector.postprocess(detector.forward(detector.preprocess(zones)))
+        if len(predicted) != len(zones):
+            raise TextDetectorError(f"Canary failed: {len(predicted)} texts for {len(zones)} zones")
+        if texts is not None:
+            accuracy = sum(p == t for p, t in zip(predicted, texts)) / max(len(texts), 1)
+            if accuracy < min_accuracy:
+                raise TextDetectorError(f"Canary failed: accuracy {accuracy:.3f} < {min_accuracy}, "
+                                        f"predicted {predicted}, expected {texts}")
+
+    def reload(self,
+               detector_name: str,
+               model_path: str = None,
+               canary_zones: List[np.ndarray] = None,
+               canary_texts: List[str] = None,
+               min_accuracy: float = 1.) -> None:
+        """
+        Hot reload of one preset: the new model is loaded and checked with validate_detector
+        while zones are still read by the old one, then it is swapped for all TextDetectors
+        that share it (model_registry.reload). Batches that already took the old model finish on it.
+        Args:
+            detector_name (): preset name
+            model_path (): new model path, current (for "latest" the model is downloaded again) if None
+            canary_zones (): zones for the canary batch
+            canary_texts (): expected texts of canary_zones
+            min_accuracy (): min share of canary_texts that must be read exactly
+        """
+        if detector_name not in self.detectors_names:
+            raise TextDetectorError(f"Text detector {detector_name} not in presets {self.detectors_names}")
+        old_path = self.presets[detector_name]['model_path']
+        model_path = model_path or old_path
+        old_key = self.make_model_key(detector_name, old_path)
+        new_key = self.make_model_key(detector_name, model_path)
+        # presets may be shared (DEFAULT_PRESETS), so they are copied before the change
+        presets = dict(self.presets)
+        presets[detector_name] = dict(presets[detector_name], model_path=model_path)
+
+        detector_id = self.detectors_names.index(detector_name)
+        future = self.load_futures.get(detector_id)
+        if future is not None:
+            future.result()
+        try:
+            model_registry.reload(old_key,
+                                  lambda: self.create_detector(detector_name, model_path),
+                                  validate=lambda detector: self.validate_detector(detector,
+                                                                                   canary_zones,
+                                                                                   canary_texts,
+                                                                                   min_accuracy),
+                                  new_key=new_key)
+        except KeyError:
+            # not loaded (lazy_load), the next load takes the new path
+            if self.detectors[detector_id] is not None:
+                raise
+            self.model_versions[detector_name] += 1
+        self.presets = presets
+        self.stat["reloads"] += 1
+        self.events.append({"event": "reload", "name": detector_name, "time": time.time(),
+                            "version": model_registry.get_version(self.detectors[detector_id])})
+
+    def on_model_swap(self, old: OCR, new: OCR) -> None:
+        """
+        Take the new shared OCR model after model_registry.reload
+        """
+        key = model_registry.get_key(new)
+        with self._load_lock:
+            for detector_id, detector in enumerate(self.detectors):
+                if detector is old:
+                    self.detectors[detector_id] = new
+                    if detector_id in self.resident:
+                        self.resident[detector_id] = self.get_detector_size(new)
+                    name = self.detectors_names[detector_id]
+                    self.model_versions[name] += 1
+                    if key is not None:
+                        # the model path of the preset follows the shared model
+                        self.presets = {**self.presets, name: {**self.presets[name], "model_path": key[1]}}
+
+    def get_model_versions(self) -> Tuple:
+        """
+        (preset name, model path, reloads count) of all presets, it is not changed by lazy loads and evictions
+        """
+        return tuple((name, self.presets[name]['model_path'], self.model_versions[name])
+                     for name in self.detectors_names)
+
     def load(self):
         """
-        TODO: support reloading
+        Load all detectors from scratch, see reload() to replace one preset without stopping
         """
-        self.detectors = []
-        for i, detector_name in enumerate(self.detectors_names):
-            model_conf = copy.deepcopy(modelhub.models[detector_name])
-            model_conf.update(self.presets[detector_name])
-            detector = OCR(model_name=detector_name, letters=model_conf["letters"],
-                           linear_size=model_conf["linear_size"], max_text_len=model_conf["max_text_len"],
-                           height=model_conf["height"], width=model_conf["width"],
-                           color_channels=model_conf["color_channels"],
-                           hidden_size=model_conf["hidden_size"], backbone=model_conf["backbone"])
-            detector.load(self.presets[detector_name]['model_path'])
-            detector.init_label_converter()
-            self.detectors.append(detector)
+        self.close()
+        self.detectors = [None for _ in self.detectors_names]
+        for detector_id, detector_name in enumerate(self.detectors_names):
+            if self.load_executor is None:
+                self.detectors[detector_id] = self.load_detector(detector_name)
+            else:
+                self.load_futures[detector_id] = self.load_executor.submit(self._load_detector_in_background,
+                                                                           detector_id, detector_name)
+
+    def _load_detector_in_background(self, detector_id: int, detector_name: str) -> OCR:
+        detector = self.load_detector(detector_name)
+        self.detectors[detector_id] = detector
+        return detector
+
+    def get_load_futures(self) -> Dict[str, Future]:
+        """
+        Preset name -> future of its OCR model (loaded with load_executor)
+        """
+        return {self.detectors_names[detector_id]: future for detector_id, future in self.load_futures.items()}
+
+    def is_ready(self, region: str = None, count_lines: int = 1) -> bool:
+        """
+        All OCR models or model of the region are loaded
+        """
+        if region is None:
+            return all(future.done() for future in self.load_futures.values())
+        detector_id = self.detectors_map.get((int(count_lines), region.replace("-", "_")))
+        if detector_id is None:
+            return True
+        future = self.load_futures.get(detector_id)
+        return future is None or future.done()
+
+    def wait_ready(self, timeout: float = None) -> None:
+        """
+        Wait for all OCR models loaded with load_executor, loading errors are raised here
+        """
+        for future in list(self.load_futures.values()):
+            future.result(timeout)
+
+    def preload(self, names: List[str]) -> None:
+        """
+        Load models for preset names or regions (for example "eu_ua_2015")
+        """
+        for name in names:
+            if name in self.detectors_names:
+                detector_ids = [self.detectors_names.index(name)]
+            else:
+                detector_ids = sorted({detector_id for (_, region), detector_id in self.detectors_map.items()
+                                       if region == name.replace("-", "_")})
+                if not len(detector_ids):
+                    raise TextDetectorError(f"Preload '{name}' is not a preset or region of presets")
+            for detector_id in detector_ids:
+                self.get_detector(detector_id, count_stat=False)
+
+    @staticmethod
+    def get_detector_size(detector: OCR) -> int:
+        if detector.model is None:
+            return 0
+        return sum(tensor.numel() * tensor.element_size()
+                   for tensor in list(detector.model.parameters()) + list(detector.model.buffers()))
+
+    def get_detector(self, detector_id: int, keep=(), count_stat: bool = True) -> OCR:
+        """
+        Return OCR model, with lazy_load load it if it is not resident and evict least recently used models
+        (except keep ids) over memory budget. The model is loaded out of the lock, so zones of resident presets
+        are read meanwhile, concurrent callers of the same preset wait for one load.
+        """
+        future = self.load_futures.get(detector_id)
+        if future is not None:
+            # loading in load_executor, wait for it out of the lock
+            future.result()
+        with self._load_lock:
+            if len(self.detectors) <= detector_id:
+                self.detectors.extend([None] * (detector_id + 1 - len(self.detectors)))
+            detector = self.detectors[detector_id]
+            if detector is not None:
+                if count_stat:
+                    self.stat["hits"] += 1
+                if detector_id in self.resident:
+                    self.resident.move_to_end(detector_id)
+                return detector
+            if count_stat:
+                self.stat["misses"] += 1
+            loading = self.loading.get(detector_id)
+            if loading is None:
+                loading = self.loading[detector_id] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return loading.result()
+
+        detector_name = self.detectors_names[detector_id]
+        start_time = time.perf_counter()
+        try:
+            detector = self.load_detector(detector_name)
+        except BaseException as e:
+            with self._load_lock:
+                self.loading.pop(detector_id, None)
+            loading.set_exception(e)
+            raise
+        with self._load_lock:
+            self.loading.pop(detector_id, None)
+            self.detectors[detector_id] = detector
+            self.resident[detector_id] = self.get_detector_size(detector)
+            self.stat["loads"] += 1
+            self.events.append({"event": "load", "name": detector_name, "time": time.time(),
+                                "load_time": time.perf_counter() - start_time,
+                                "size": self.resident[detector_id]})
+        loading.set_result(detector)
+        self.evict(keep=set(keep) | {detector_id})
+        return detector
+
+    def evict(self, keep=()) -> None:
+        """
+        Unload least recently used models while resident models are over memory budget
+        """
+        if self.memory_budget is None:
+            return
+        evicted = False
+        with self._load_lock:
+            for detector_id in list(self.resident.keys()):
+                if sum(self.resident.values()) <= self.memory_budget:
+                    break
+                if detector_id in keep:
+                    continue
+                size = self.resident.pop(detector_id)
+                model_registry.release(self.detectors[detector_id])
+                self.detectors[detector_id] = None
+                evicted = True
+                self.stat["evictions"] += 1
+                self.events.append({"event": "evict", "name": self.detectors_names[detector_id],
+                                    "time": time.time(), "size": size})
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def close(self) -> None:
+        """
+        Release OCR models of the presets
+        """
+        for future in list(self.load_futures.values()):
+            future.exception()
+        self.load_futures = {}
+        with self._load_lock:
+            for detector in self.detectors:
+                if detector is not None:
+                    model_registry.release(detector)
+            self.detectors = [None for _ in self.detectors]
+            self.resident.clear()
+
+    def get_stat(self) -> Dict:
+        """
+        Lazy loading counters: loads, evictions, hits, misses, hit rate, resident models and recent events
+        """
+        with self._load_lock:
+            lookups = self.stat["hits"] + self.stat["misses"]
+            return {
+                "loads": self.stat["loads"],
+                "reloads": self.stat["reloads"],
+                "evictions": self.stat["evictions"],
+                "hits": self.stat["hits"],
+                "misses": self.stat["misses"],
+                "hit_rate": self.stat["hits"] / lookups if lookups else 0.,
+                "resident": [self.detectors_names[detector_id] for detector_id in self.resident],
+                "resident_bytes": sum(self.resident.values()),
+                "memory_budget_bytes": self.memory_budget,
+                "events": list(self.events),
+            }
 
     def define_predict_classes(self,
                                zones: List[np.ndarray],
@@ -114,6 +451,7 @@ class TextDetector(object):
             detector = self.detectors_map[(count_line, label)]
             if detector not in predicted.keys():
                 predicted[detector] = {
+                    "detector": self.get_detector(detector, keep=predicted.keys()),
                     "zones": [],
                     "order": [],
                     "xs": [],
@@ -124,12 +462,13 @@ class TextDetector(object):
                 parts = split_numberplate(zone, count_line)
             else:
                 parts = [zone]
-            if (self.option_detector_width != self.detectors[detector].width or
-                self.option_detector_height != self.detectors[detector].height or
+            ocr = predicted[detector]["detector"]
+            if (self.option_detector_width != ocr.width or
+                self.option_detector_height != ocr.height or
                 count_line == 2 or self.off_number_plate_classification):
 
                 parts = convert_cv_zones_rgb_to_bgr(parts)
-                xs = self.detectors[detector].normalize(parts)
+                xs = ocr.normalize(parts)
                 xs = np.moveaxis(np.array(xs), 3, 1)
             else:
                 xs = [p_zone]
@@ -154,23 +493,58 @@ class TextDetector(object):
         predicted = self.define_order_detector(orig_zones, labels, lines, zones)
         return predicted
 
+    def lookup_zone_cache(self, key: int, item: Dict) -> List:
+        """
+        Read zones of the preset from zone_cache, return normalized zones that are not in the cache
+        """
+        name = self.detectors_names[int(key)]
+        item["zone_cache_namespace"] = (name, self.model_versions[name])
+        item["zone_hashes"] = [self.zone_cache.hash_zone(x) for x in item["xs"]]
+        item["cached_texts"] = [self.zone_cache.get(item["zone_cache_namespace"], zone_hash)
+                                for zone_hash in item["zone_hashes"]]
+        return [x for x, text in zip(item["xs"], item["cached_texts"]) if text is None]
+
+    def merge_zone_cache(self, item: Dict, texts: List[str]) -> List[str]:
+        """
+        Texts of all zones of the preset in order, new texts are remembered in zone_cache
+        """
+        texts = iter(texts)
+        merged = []
+        for zone_hash, text in zip(item["zone_hashes"], item["cached_texts"]):
+            if text is None:
+                text = next(texts)
+                self.zone_cache.set(item["zone_cache_namespace"], zone_hash, text)
+            merged.append(text)
+        return merged
+
     @no_grad()
     def forward(self, predicted):
         for key in predicted.keys():
             xs = predicted[key]["xs"]
+            if self.zone_cache is not None:
+                xs = self.lookup_zone_cache(key, predicted[key])
+                if not len(xs):
+                    predicted[key]["ys"] = None
+                    continue
 
             # to tensor
             xs = np.array(xs)
             xs = torch.tensor(xs)
-            xs = xs.to(device_torch)
+            xs = xs.to(get_device_torch())
 
-            predicted[key]["ys"] = self.detectors[int(key)].forward(xs)
+            with profile(self.profiler, f"ocr.{self.detectors_names[int(key)]}", len(xs)):
+                predicted[key]["ys"] = predicted[key]["detector"].forward(xs)
         return predicted
 
     def postprocess(self, predicted):
         mapping = {}
         for key in predicted.keys():
-            predicted[key]["ys"] = self.detectors[int(key)].postprocess(predicted[key]["ys"])
+            if predicted[key]["ys"] is not None:
+                with profile(self.profiler, f"ocr_decode.{self.detectors_names[int(key)]}",
+                             len(predicted[key]["ys"])):
+                    predicted[key]["ys"] = predicted[key]["detector"].postprocess(predicted[key]["ys"])
+            if "cached_texts" in predicted[key]:
+                predicted[key]["ys"] = self.merge_zone_cache(predicted[key], predicted[key]["ys"] or [])
             for text, zone_id, count_line, label in zip(predicted[key]["ys"],
                                                         predicted[key]["order"],
                                                         predicted[key]["count_line"],
@@ -185,10 +559,11 @@ class TextDetector(object):
                         "label": label,
                     }
         res_all = []
-        for item in mapping.values():
-            post = multiple_postprocessing_mapping.get(item["label"], multiple_postprocessing_mapping["default"])
-            text = post.postprocess_multiline_text(item["text"], item["count_line"])
-            res_all.append(text)
+        with profile(self.profiler, "text_postprocessing", len(mapping)):
+            for item in mapping.values():
+                post = multiple_postprocessing_mapping.get(item["label"], multiple_postprocessing_mapping["default"])
+                text = post.postprocess_multiline_text(item["text"], item["count_line"])
+                res_all.append(text)
         order_all = [item["order"] for item in mapping.values()]
 
         return [x for _, x in sorted(zip(order_all, res_all), key=lambda pair: pair[0])]
@@ -205,11 +580,12 @@ class TextDetector(object):
         res_all, scores, order_all = [], [], []
         for key in predicted.keys():
             if return_acc:
-                buff_res, acc = self.detectors[int(key)].predict(predicted[key]["zones"], return_acc=return_acc)
+                buff_res, acc = predicted[key]["detector"].predict(predicted[key]["zones"], return_acc=return_acc)
                 res_all = res_all + buff_res
                 scores = scores + list(acc)
             else:
-                res_all = res_all + self.detectors[int(key)].predict(predicted[key]["zones"], return_acc=return_acc)
+                res_all = res_all + predicted[key]["detector"].predict(predicted[key]["zones"],
+                                                                       return_acc=return_acc)
             order_all = order_all + predicted[key]["order"]
 
         if return_acc:
@@ -237,11 +613,11 @@ class TextDetector(object):
             if self.detectors_map.get(region, None) is None or len(decode[i]) == 0:
                 acc.append([0.])
             else:
-                detector = self.detectors[int(self.detectors_map[region])]
+                detector = self.get_detector(int(self.detectors_map[region]))
                 _acc = detector.get_acc([predicted[i]], [decode[i]])
                 acc.append([float(_acc)])
         return acc
 
     def get_module(self, name: str) -> object:
         ind = self.detectors_names.index(name)
-        return self.detectors[ind]
+        return self.get_detector(ind)
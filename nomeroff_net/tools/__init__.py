@@ -1,27 +1,63 @@
-from .splitter import np_split
-from .mcm import (modelhub,
-                  get_mode_torch,
-                  get_device_name)
-from .pipeline_tools import chunked_iterable
-from .pipeline_tools import unzip
-from .pipeline_tools import promise_all
-from .image_processing import (fline,
-                               distance,
-                               normalize_color,
-                               normalize,
-                               linear_line_matrix,
-                               get_y_by_matrix,
-                               find_distances,
-                               rotate,
-                               build_perspective,
-                               get_cv_zone_rgb,
-                               fix_clockwise2,
-                               minimum_bounding_rectangle,
-                               detect_intersection,
-                               find_min_x_idx,
-                               get_mean_distance,
-                               reshape_points,
-                               generate_image_rotation_variants,
-                               get_cv_zones_rgb,
-                               convert_cv_zones_rgb_to_bgr,
-                               get_cv_zones_bgr)
+"""
+Tools are imported lazily on the first attribute access (PEP 562),
+so `from nomeroff_net.tools import unzip` does not import torch, scipy, cv2 etc.
+"""
+import importlib
+
+_lazy_attributes = {
+    "np_split": "splitter",
+    "modelhub": "mcm",
+    "get_mode_torch": "mcm",
+    "get_device_name": "mcm",
+    "chunked_iterable": "pipeline_tools",
+    "achunked_iterable": "pipeline_tools",
+    "unzip": "pipeline_tools",
+    "promise_all": "pipeline_tools",
+    "run_stages": "pipeline_tools",
+    "executor_all": "pipeline_tools",
+    "get_executor": "pipeline_tools",
+    "SyncExecutor": "pipeline_tools",
+    "split_iterable": "pipeline_tools",
+    "DynamicBatcher": "dynamic_batcher",
+    "ResultCache": "result_cache",
+    "ZoneCache": "zone_cache",
+    "ImageSource": "image_source",
+    "VideoSource": "video_source",
+    "FrameInfo": "video_source",
+    "fline": "image_processing",
+    "distance": "image_processing",
+    "normalize_color": "image_processing",
+    "normalize": "image_processing",
+    "linear_line_matrix": "image_processing",
+    "get_y_by_matrix": "image_processing",
+    "find_distances": "image_processing",
+    "rotate": "image_processing",
+    "build_perspective": "image_processing",
+    "get_cv_zone_rgb": "image_processing",
+    "fix_clockwise2": "image_processing",
+    "minimum_bounding_rectangle": "image_processing",
+    "detect_intersection": "image_processing",
+    "find_min_x_idx": "image_processing",
+    "get_mean_distance": "image_processing",
+    "reshape_points": "image_processing",
+    "generate_image_rotation_variants": "image_processing",
+    "get_cv_zones_rgb": "image_processing",
+    "convert_cv_zones_rgb_to_bgr": "image_processing",
+    "get_cv_zones_bgr": "image_processing",
+    "unscale_points": "image_processing",
+}
+
+__all__ = list(_lazy_attributes)
+
+
+def __getattr__(name):
+    module_name = _lazy_attributes.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module_name}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
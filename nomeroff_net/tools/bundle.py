@@ -0,0 +1,261 @@
+"""
+Single-file model bundle for offline deployment
+
+The bundle packs the number plate detector, the options classifier and OCR presets
+with their metadata (letters, max_text_len, sizes, class_region, ...) into one torch archive.
+It is loaded with torch.load(mmap=True, weights_only=True): tensors are read from the page cache on use
+and shared by all processes on the host, no network, no remote configs.
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> from nomeroff_net.tools.bundle import build_bundle
+    >>> build_bundle("./data/nomeroff_net.bundle", ocr_presets=["eu_ua_2004_2015_efficientnet_b2", "eu_efficientnet_b2"])
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv",
+    ...                                               bundle="./data/nomeroff_net.bundle")
+
+    $ python3 -m nomeroff_net bundle build ./data/nomeroff_net.bundle
+    $ python3 -m nomeroff_net bundle load ./data/nomeroff_net.bundle
+
+python3 -m nomeroff_net.tools.bundle -f nomeroff_net/tools/bundle.py
+"""
+import os
+import copy
+import hashlib
+import tempfile
+import threading
+from typing import List, Dict
+
+import torch
+
+from nomeroff_net.tools.mcm import modelhub
+from nomeroff_net.tools.checkpoint_tools import load_checkpoint
+
+BUNDLE_FORMAT = "nomeroff_net_bundle"
+BUNDLE_VERSION = 1
+BUNDLE_SCHEME = "bundle://"
+
+DEFAULT_DETECTOR = "yolov11x"
+DEFAULT_OPTIONS = "numberplate_options"
+
+_bundles = {}
+_bundles_lock = threading.Lock()
+
+
+def _plain(value):
+    """
+    Keep only values that torch.load(weights_only=True) can read
+    """
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    return None
+
+
+def _get_model_info(name: str) -> Dict:
+    model_info = copy.deepcopy(modelhub.models.get(name, {}))
+    model_info.update(modelhub.download_model_by_name(name))
+    return model_info
+
+
+def _pack_state_dict(name: str) -> Dict:
+    model_info = _get_model_info(name)
+    # lightning checkpoints of modelhub keep classes in hyper_parameters (e.g. the OCR backbone),
+    # models are loaded from the same files with full unpickling anyway, only the state dict is packed
+    checkpoint = load_checkpoint(model_info.pop("path"), weights_only=False)
+    hyper_parameters = checkpoint.get("hyper_parameters", {})
+    item = {
+        "kind": "state_dict",
+        "info": _plain(model_info),
+        "state_dict": {key: value.contiguous() for key, value in checkpoint.get("state_dict", checkpoint).items()},
+        "hyper_parameters": {},
+    }
+    if hyper_parameters.get("backbone_shape") is not None:
+        item["hyper_parameters"]["backbone_shape"] = tuple(hyper_parameters["backbone_shape"])
+    return item
+
+
+def _pack_file(name: str) -> Dict:
+    model_info = _get_model_info(name)
+    path = model_info.pop("path")
+    with open(path, "rb") as f:
+        data = f.read()
+    return {
+        "kind": "file",
+        "info": _plain(model_info),
+        "file_name": os.path.basename(path),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "data": torch.frombuffer(bytearray(data), dtype=torch.uint8),
+    }
+
+
+def build_bundle(path: str,
+                 detector: str = DEFAULT_DETECTOR,
+                 options: str or None = DEFAULT_OPTIONS,
+                 ocr_presets: List[str] = None,
+                 presets: Dict = None) -> str:
+    """
+    Download the models through modelhub and pack them into one file
+    Args:
+        path (): bundle path
+        detector (): detector model name, ultralytics loads it from a file, so it is packed as raw bytes
+        options (): options classifier model name or None
+        ocr_presets (): OCR preset names, all presets of presets if None
+        presets (): text reading presets (for_regions, for_count_lines) saved to the bundle,
+                    DEFAULT_PRESETS of number_plate_text_reading if None
+    """
+    if presets is None:
+        from nomeroff_net.pipelines.number_plate_text_reading import DEFAULT_PRESETS
+        presets = DEFAULT_PRESETS
+    if ocr_presets is None:
+        ocr_presets = list(presets)
+    presets = {name: dict(presets.get(name, {"for_regions": [name], "for_count_lines": [1]}), model_path="latest")
+               for name in ocr_presets}
+
+    models = {}
+    if detector is not None:
+        models[detector] = _pack_file(detector)
+    if options is not None:
+        models[options] = _pack_state_dict(options)
+    for name in ocr_presets:
+        models[name] = _pack_state_dict(name)
+
+    from nomeroff_net import __version__
+    bundle = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "nomeroff_net_version": __version__,
+        "presets": presets,
+        "models": models,
+    }
+    tmp_path = f"{path}.tmp"
+    torch.save(bundle, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ModelBundle(object):
+    """
+    Loaded bundle, serves download_model_by_name and models like modelhub
+    """
+
+    def __init__(self, path: str, cache_dir: str = None):
+        """
+        Args:
+            path (): bundle path
+            cache_dir (): directory for packed files (detector weights), they are written once per content hash
+        """
+        self.path = os.path.abspath(path)
+        self.cache_dir = cache_dir or os.environ.get("NOMEROFF_NET_BUNDLE_CACHE",
+                                                     os.path.join(tempfile.gettempdir(), "nomeroff_net_bundle"))
+        self.data = load_checkpoint(self.path)
+        if self.data.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"{path} is not a nomeroff_net bundle")
+        if self.data.get("version", 0) > BUNDLE_VERSION:
+            raise ValueError(f"{path} bundle version {self.data['version']} is not supported, "
+                             f"update nomeroff_net")
+        self.presets = self.data["presets"]
+        self.models = {name: item["info"] for name, item in self.data["models"].items()}
+        self._lock = threading.Lock()
+
+    def get_model_path(self, name: str) -> str:
+        item = self.data["models"][name]
+        if item["kind"] != "file":
+            return f"{BUNDLE_SCHEME}{self.path}#{name}"
+        path = os.path.join(self.cache_dir, f"{item['sha256'][:16]}-{item['file_name']}")
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(item["data"].numpy().tobytes())
+                os.replace(tmp_path, path)
+        return path
+
+    def get_checkpoint(self, name: str) -> Dict:
+        item = self.data["models"][name]
+        if item["kind"] != "state_dict":
+            raise KeyError(f"{name} is packed as a file, use get_model_path")
+        return {"state_dict": item["state_dict"], "hyper_parameters": item["hyper_parameters"]}
+
+    def download_model_by_name(self, name: str) -> Dict:
+        if name not in self.models:
+            raise KeyError(f"Model {name} is not in the bundle {self.path}, available models: {list(self.models)}")
+        model_info = copy.deepcopy(self.models[name])
+        model_info["path"] = self.get_model_path(name)
+        return model_info
+
+    def get_stat(self) -> Dict:
+        return {
+            "path": self.path,
+            "size_mb": os.path.getsize(self.path) / 2 ** 20,
+            "nomeroff_net_version": self.data.get("nomeroff_net_version"),
+            "presets": list(self.presets),
+            "models": {name: item["kind"] for name, item in self.data["models"].items()},
+        }
+
+
+def load_bundle(path: str, cache_dir: str = None) -> ModelBundle:
+    """
+    Open the bundle once per process
+    """
+    key = os.path.abspath(path)
+    with _bundles_lock:
+        if key not in _bundles:
+            _bundles[key] = ModelBundle(path, cache_dir=cache_dir)
+        return _bundles[key]
+
+
+def load_bundle_checkpoint(path: str) -> Dict:
+    """
+    Checkpoint of bundle://<bundle path>#<model name>
+    """
+    bundle_path, name = path[len(BUNDLE_SCHEME):].rsplit("#", 1)
+    return load_bundle(bundle_path).get_checkpoint(name)
+
+
+def use_bundle(path: str or None, cache_dir: str = None) -> ModelBundle or None:
+    """
+    Serve "latest" and "modelhub://" models of the process from the bundle, None switches back to modelhub
+    """
+    bundle = None if path is None else load_bundle(path, cache_dir=cache_dir)
+    modelhub.use_bundle(bundle)
+    return bundle
+
+
+if __name__ == "__main__":
+    import torch.nn as nn
+
+    net = nn.Linear(4, 2)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint_path = os.path.join(tmp_dir, "model.ckpt")
+        detector_path = os.path.join(tmp_dir, "detector.pt")
+        torch.save({"state_dict": net.state_dict()}, checkpoint_path)
+        with open(detector_path, "wb") as detector_file:
+            detector_file.write(b"detector weights")
+
+        class FakeModelHub(object):
+            models = {"ocr": {"letters": ["A", "B"], "max_text_len": 8}, "detector": {}}
+
+            @staticmethod
+            def download_model_by_name(name):
+                return {"path": checkpoint_path if name == "ocr" else detector_path}
+
+        modelhub.use_bundle(FakeModelHub())
+        bundle_path = build_bundle(os.path.join(tmp_dir, "test.bundle"), detector="detector", options=None,
+                                   ocr_presets=["ocr"], presets={})
+        use_bundle(bundle_path, cache_dir=tmp_dir)
+        ocr_info = modelhub.download_model_by_name("ocr")
+        assert ocr_info["letters"] == ["A", "B"] and ocr_info["path"].startswith(BUNDLE_SCHEME)
+        # "latest" models of the bundle and of modelhub do not share registry entries
+        from nomeroff_net.tools.model_registry import model_registry
+        bundle_key = model_registry.make_key("ocr", "latest", device="cpu")
+        assert ("source", repr(f"{BUNDLE_SCHEME}{os.path.abspath(bundle_path)}")) in bundle_key
+        assert torch.equal(load_checkpoint(ocr_info["path"])["state_dict"]["weight"], net.weight)
+        with open(modelhub.download_model_by_name("detector")["path"], "rb") as detector_file:
+            assert detector_file.read() == b"detector weights"
+        print(load_bundle(bundle_path).get_stat())
+        use_bundle(None)
+        assert model_registry.make_key("ocr", "latest", device="cpu") != bundle_key
@@ -0,0 +1,74 @@
+"""
+Checkpoint loading tools
+
+python3 -m nomeroff_net.tools.checkpoint_tools -f nomeroff_net/tools/checkpoint_tools.py
+"""
+import pickle
+import contextlib
+import torch
+import torch.nn as nn
+from typing import Dict, List
+
+
+def load_checkpoint(path_to_model: str, map_location="cpu", weights_only: bool = True,
+                    safe_globals: List = ()) -> Dict:
+    """
+    torch.load with mmap (no copy of the whole file to memory), falls back for old (not zip) checkpoints
+    and old torch versions, bundle://<bundle path>#<model name> paths are read from the model bundle
+    Args:
+        path_to_model (): checkpoint path
+        map_location (): torch.load map_location
+        weights_only (): only tensors and plain containers are unpickled, pickle.UnpicklingError otherwise,
+                         False (only for trusted files) unpickles arbitrary objects
+        safe_globals (): with weights_only, classes and functions that are unpickled too,
+                         e.g. the backbone and the label converter in OCR hyper_parameters
+    """
+    if isinstance(path_to_model, str) and path_to_model.startswith("bundle://"):
+        from nomeroff_net.tools.bundle import load_bundle_checkpoint
+        return load_bundle_checkpoint(path_to_model)
+    use_safe_globals = weights_only and safe_globals and hasattr(torch.serialization, "safe_globals")
+    error = None
+    for kwargs in [{"mmap": True}, {}]:
+        try:
+            with (torch.serialization.safe_globals(list(safe_globals)) if use_safe_globals
+                  else contextlib.nullcontext()):
+                return torch.load(path_to_model, map_location=map_location, weights_only=weights_only, **kwargs)
+        except (RuntimeError, TypeError, pickle.UnpicklingError) as e:
+            error = e
+    if weights_only and isinstance(error, pickle.UnpicklingError):
+        raise pickle.UnpicklingError(f"{path_to_model} has pickled objects besides weights, "
+                                     f"pass weights_only=False if the file is trusted: {error}") from error
+    raise error
+
+
+def load_state_dict_from_checkpoint(model: nn.Module, checkpoint: Dict, strict: bool = True) -> nn.Module:
+    """
+    Load pytorch-lightning (with "state_dict" key) or plain state dict checkpoint to the model
+    """
+    state_dict = checkpoint.get("state_dict", checkpoint)
+    model.load_state_dict(state_dict, strict=strict)
+    return model
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    net = nn.Linear(4, 2)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint_path = os.path.join(tmp_dir, "model.ckpt")
+        torch.save({"state_dict": net.state_dict(), "hyper_parameters": {"backbone_shape": (1, 2, 3)}},
+                   checkpoint_path)
+        loaded_net = load_state_dict_from_checkpoint(nn.Linear(4, 2), load_checkpoint(checkpoint_path))
+        assert torch.equal(loaded_net.weight, net.weight)
+
+        torch.save({"state_dict": net.state_dict(), "net": net}, checkpoint_path)
+        try:
+            load_checkpoint(checkpoint_path)
+            raise AssertionError("pickled module is loaded with weights_only=True")
+        except pickle.UnpicklingError:
+            pass
+        assert isinstance(load_checkpoint(checkpoint_path, weights_only=False)["net"], nn.Linear)
+        # allowed classes and functions are unpickled with weights_only
+        torch.save({"state_dict": net.state_dict(), "hyper_parameters": {"backbone": nn.Linear}}, checkpoint_path)
+        assert load_checkpoint(checkpoint_path, safe_globals=[nn.Linear])["hyper_parameters"]["backbone"] is nn.Linear
@@ -6,11 +6,11 @@ import os
 import glob
 import shutil
 import pandas as pd
-import imghdr
 import multiprocessing
 import matplotlib.image as mpimg
 from collections import Counter
 from nomeroff_net.tools import modelhub
+from nomeroff_net.tools.image_source import ImageSource
 from nomeroff_net import pipeline
 from nomeroff_net.pipes.number_plate_text_readers.text_detector import TextDetector
 from nomeroff_net.pipes.number_plate_classificators.options_detector import OptionsDetector
@@ -142,12 +142,31 @@ def chunks(lst, n):
 
 
 def auto_number_grab(root_dir, res_dir, replace_template=None, csv_dataset_path=None, image_loader="opencv",
-                     chunk_size=10, **kwargs):
+                     chunk_size=10, prefetch=None, offset=0, **kwargs):
+    """
+    Images of root_dir (directory, glob or tar/zip archive, see ImageSource) are decoded prefetch items ahead
+    in the background, offset resumes an interrupted run (ImageSource.offset is reported on the interruption).
+    offset=0 starts from scratch (res_dir is removed), offset > 0 appends to res_dir of the interrupted run
+    of the same root_dir (it is checked by res_dir/auto_number_grab.json), ValueError for other res_dir
+    """
     if replace_template is None:
         replace_template = {'moderation': {'isModerated': 0, 'moderatedBy': 'Default User'}, 'state_id': 2}
 
     res_ann_dir = os.path.join(res_dir, "ann")
     res_img_dir = os.path.join(res_dir, "img")
+    run_info_path = os.path.join(res_dir, "auto_number_grab.json")
+    sources = root_dir if isinstance(root_dir, (list, tuple)) else [root_dir]
+    run_info = {"root_dir": [os.path.abspath(os.fspath(source)) for source in sources]}
+
+    if offset != 0:
+        try:
+            with open(run_info_path) as f:
+                prev_run_info = json.load(f)
+        except (OSError, ValueError):
+            prev_run_info = {}
+        if prev_run_info.get("root_dir") != run_info["root_dir"]:
+            raise ValueError(f"{res_dir} is not the result of an interrupted auto_number_grab of {root_dir}, "
+                             f"run with offset=0 or another res_dir")
 
     number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader=image_loader,
                                                   **kwargs)
@@ -161,27 +180,26 @@ def auto_number_grab(root_dir, res_dir, replace_template=None, csv_dataset_path=
         )
         photos = photos.set_index(['photoId'])
 
-    if os.path.exists(res_dir):
-        shutil.rmtree(res_dir)
-    os.makedirs(res_ann_dir, exist_ok=False)
-    os.makedirs(res_img_dir, exist_ok=False)
-
-    images_paths = [img_path for img_path in glob.glob(os.path.join(root_dir, "*"))
-                    if imghdr.what(img_path)]
-    images_paths_chunked = chunks(images_paths, chunk_size)
-    for images_paths in tqdm.tqdm(images_paths_chunked):
-        result = number_plate_detection_and_reading(images_paths, **kwargs)
-
-        for i, (image, image_bboxs,
-                image_points, image_zones, region_ids,
-                region_names, count_lines,
-                confidences, texts) in enumerate(result):
+    if offset == 0:
+        if os.path.exists(res_dir):
+            shutil.rmtree(res_dir)
+        os.makedirs(res_ann_dir)
+        os.makedirs(res_img_dir)
+        with open(run_info_path, "w") as f:
+            json.dump(run_info, f)
+
+    source = ImageSource(root_dir, image_loader=image_loader, prefetch=prefetch or chunk_size * 2, offset=offset)
+    try:
+        for image_path, (image, image_bboxs,
+                         image_points, image_zones, region_ids,
+                         region_names, count_lines,
+                         confidences, texts) in tqdm.tqdm(source.stream(number_plate_detection_and_reading,
+                                                                        batch_size=chunk_size, **kwargs)):
 
             for j, (image_zone, region_id,
                     region_name, count_line,
                     confidence, text) in enumerate(zip(image_zones, region_ids, region_names,
                                                        count_lines, confidences, texts)):
-                image_path = images_paths[i]
                 base_name = os.path.splitext(os.path.basename(image_path))[0]
                 if csv_dataset_path is not None:
                     desc = photos.loc[base_name]['npText']
@@ -191,6 +209,9 @@ def auto_number_grab(root_dir, res_dir, replace_template=None, csv_dataset_path=
                 fname = f"{base_name}_{j}"
                 add_np(fname, image_zone, region_id, count_line, desc, predicted_text,
                        res_img_dir, res_ann_dir, replace_template)
+    except (KeyboardInterrupt, Exception):
+        tqdm.tqdm.write(f"[INFO] auto_number_grab interrupted, resume with offset={source.offset}")
+        raise
 
 
 def delete_not_used_images_from_via_dataset(
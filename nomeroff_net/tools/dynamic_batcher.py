@@ -0,0 +1,175 @@
+"""
+Dynamic micro-batching in front of a pipeline
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> from nomeroff_net.tools import DynamicBatcher
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv")
+    >>> batcher = DynamicBatcher(number_plate_detection_and_reading, max_batch_size=8, max_wait_ms=5)
+    >>> result = batcher('./data/examples/oneline_images/example1.jpeg')
+    >>> # in asyncio code
+    >>> result = await batcher.asubmit('./data/examples/oneline_images/example1.jpeg')
+    >>> print(batcher.get_stat())
+
+python3 -m nomeroff_net.tools.dynamic_batcher -f nomeroff_net/tools/dynamic_batcher.py
+"""
+import time
+import asyncio
+import threading
+from queue import Queue, Empty
+from collections import Counter
+from concurrent.futures import Future
+
+
+class DynamicBatcher(object):
+    """
+    Collects concurrent single-input calls into batches bounded by max_batch_size and max_wait_ms,
+    runs one pipeline call per batch and scatters results back to each caller's future.
+    """
+
+    def __init__(self, pipeline, max_batch_size: int = 8, max_wait_ms: float = 5,
+                 num_workers: int = 1, **call_kwargs):
+        """
+        Args:
+            pipeline (): any callable pipeline, pipeline(inputs, batch_size=..., num_workers=..., **call_kwargs)
+            max_batch_size (): max count of inputs in one pipeline call
+            max_wait_ms (): max time the first input of a batch waits for other inputs
+            num_workers (): num_workers for pipeline call
+            call_kwargs (): other kwargs for pipeline call
+        """
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.num_workers = num_workers
+        self.call_kwargs = call_kwargs
+
+        self.stat = Counter()
+        self._stat_lock = threading.Lock()
+        self._queue = Queue()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        """
+        Put one input to the queue, return concurrent.futures.Future with its result
+        """
+        if self._stop_event.is_set():
+            raise RuntimeError("DynamicBatcher is closed")
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item, timeout: float = None):
+        return self.submit(item).result(timeout=timeout)
+
+    async def asubmit(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _collect_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except Empty:
+                break
+        # skip cancelled by callers
+        return [(item, future, ts) for item, future, ts in batch if future.set_running_or_notify_cancel()]
+
+    def _worker(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            items, futures, timestamps = zip(*batch)
+            start = time.perf_counter()
+            self._update_stat(len(items), [start - ts for ts in timestamps])
+            try:
+                outputs = self.pipeline(list(items),
+                                        batch_size=len(items),
+                                        num_workers=min(self.num_workers, len(items)),
+                                        **self.call_kwargs)
+                outputs = list(outputs)
+                if len(outputs) != len(items):
+                    raise RuntimeError(f"Pipeline returned {len(outputs)} outputs for a batch of {len(items)} inputs")
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+            with self._stat_lock:
+                self.stat["batch_time"] += time.perf_counter() - start
+
+    def _update_stat(self, batch_size, queue_waits):
+        with self._stat_lock:
+            self.stat["batches"] += 1
+            self.stat["items"] += batch_size
+            self.stat["queue_wait_time"] += sum(queue_waits)
+            self.stat["max_queue_wait_time"] = max(self.stat["max_queue_wait_time"], *queue_waits)
+
+    def get_stat(self):
+        """
+        batch fill ratio (mean batch size / max_batch_size) and queue wait time metrics
+        """
+        with self._stat_lock:
+            stat = Counter(self.stat)
+        batches = stat["batches"] or 1
+        items = stat["items"] or 1
+        return {
+            "batches": stat["batches"],
+            "items": stat["items"],
+            "queue_size": self._queue.qsize(),
+            "mean_batch_size": stat["items"] / batches,
+            "batch_fill_ratio": stat["items"] / batches / self.max_batch_size,
+            "mean_queue_wait_ms": stat["queue_wait_time"] / items * 1000,
+            "max_queue_wait_ms": stat["max_queue_wait_time"] * 1000,
+            "mean_batch_time_ms": stat["batch_time"] / batches * 1000,
+        }
+
+    def clear_stat(self):
+        with self._stat_lock:
+            self.stat = Counter()
+
+    def close(self):
+        """
+        Stop the worker thread, inputs that are still in the queue get RuntimeError
+        """
+        self._stop_event.set()
+        self._thread.join()
+        while True:
+            try:
+                _, future, _ = self._queue.get_nowait()
+            except Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("DynamicBatcher is closed"))
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    def dummy_pipeline(inputs, **_):
+        time.sleep(0.01)
+        return [x * 2 for x in inputs]
+
+    batcher = DynamicBatcher(dummy_pipeline, max_batch_size=4, max_wait_ms=5)
+    with ThreadPoolExecutor(16) as pool:
+        res = list(pool.map(batcher, range(64)))
+    assert res == [x * 2 for x in range(64)]
+    print(batcher.get_stat())
+    batcher.close()
+
+    # every caller of a batch with lost outputs gets the error instead of waiting forever
+    batcher = DynamicBatcher(lambda inputs, **_: inputs[:-1], max_batch_size=4, max_wait_ms=50)
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(batcher, x, 5) for x in range(4)]
+    assert all(isinstance(future.exception(), RuntimeError) for future in futures)
+    batcher.close()
@@ -9,3 +9,7 @@ class TextDetectorError(Exception):
 
 class NPOptionsNetError(Exception):
     ...
+
+
+class ImageLoaderError(Exception):
+    ...
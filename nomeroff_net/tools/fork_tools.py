@@ -0,0 +1,126 @@
+"""
+Fork-safe preloading for pre-fork servers (gunicorn --preload, uwsgi, multiprocessing "fork")
+
+Models are loaded once in the master, then prepare_fork() before fork:
+    - moves CPU weights of all shared models (see nomeroff_net.tools.model_registry) to shared memory,
+      so they are never copied by workers, even when refcounts or inplace ops touch the pages
+    - collects and freezes the gc heap (gc.freeze), so the gc of workers does not write to master objects
+    - registers an after-fork hook that reinitializes torch intra-op threads of every child
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> from nomeroff_net.tools.fork_tools import prepare_fork
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv")
+    >>> prepare_fork(num_threads=1)
+    >>> # fork workers here, for gunicorn see tutorials/py/rest_examples/simple_flask/gunicorn.conf.py
+
+python3 -m nomeroff_net.tools.fork_tools -f nomeroff_net/tools/fork_tools.py
+"""
+import gc
+import os
+from typing import Dict, Iterator, List
+
+from nomeroff_net.tools.model_registry import model_registry
+
+_fork_options = {"num_threads": None}
+_fork_hook_registered = False
+
+
+def iter_modules(instances: List = None) -> Iterator:
+    """
+    torch modules of the given instances (model wrappers or modules), of all shared models if None
+    """
+    import torch.nn as nn
+
+    if instances is None:
+        instances = model_registry.get_instances()
+    seen = set()
+    for instance in instances:
+        for module in (instance, getattr(instance, "model", None)):
+            if isinstance(module, nn.Module) and id(module) not in seen:
+                seen.add(id(module))
+                yield module
+
+
+def share_models_memory(instances: List = None) -> int:
+    """
+    Move CPU parameters and buffers to shared memory, return count of shared bytes
+    """
+    shared = 0
+    for module in iter_modules(instances):
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if tensor.device.type != "cpu":
+                continue
+            tensor.share_memory_()
+            shared += tensor.numel() * tensor.element_size()
+    return shared
+
+
+def after_fork_in_child() -> None:
+    """
+    Reinitialize torch thread pool of the child, the pool of the master is not usable after fork
+    """
+    import torch
+
+    num_threads = _fork_options["num_threads"]
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+
+def prepare_fork(num_threads: int = 1, instances: List = None, freeze_gc: bool = True) -> Dict:
+    """
+    Call in the master after models are loaded and right before workers are forked
+    Args:
+        num_threads (): torch intra-op threads of every child, None keeps torch default
+        instances (): model wrappers or modules to share, all models of model_registry if None
+        freeze_gc (): gc.collect() and gc.freeze() so the master heap pages stay shared
+    """
+    global _fork_hook_registered
+
+    _fork_options["num_threads"] = num_threads
+    shared = share_models_memory(instances)
+    if not _fork_hook_registered:
+        os.register_at_fork(after_in_child=after_fork_in_child)
+        _fork_hook_registered = True
+    if freeze_gc:
+        gc.collect()
+        gc.freeze()
+    return {"shared_bytes": shared, "frozen_objects": gc.get_freeze_count()}
+
+
+def get_memory_stat(pid: int = None) -> Dict:
+    """
+    rss, pss (proportional: shared pages are divided between processes) and uss (private) in bytes,
+    Linux only (/proc/<pid>/smaps_rollup)
+    """
+    stat = {}
+    with open(f"/proc/{pid or 'self'}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                stat[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": stat.get("Rss", 0),
+        "pss": stat.get("Pss", 0),
+        "uss": stat.get("Private_Clean", 0) + stat.get("Private_Dirty", 0),
+    }
+
+
+if __name__ == "__main__":
+    import torch
+    import torch.nn as nn
+
+    model = nn.Linear(256, 256)
+    info = prepare_fork(num_threads=1, instances=[model])
+    assert model.weight.is_shared() and info["shared_bytes"] == (256 * 256 + 256) * 4
+    pid = os.fork()
+    if pid == 0:
+        with torch.no_grad():
+            model.weight.add_(1)
+        os._exit(0 if torch.get_num_threads() == 1 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    # shared memory: the change of the child is visible in the master
+    assert float(model.weight.detach().min()) > 0
+    gc.unfreeze()
+    print(info, get_memory_stat())
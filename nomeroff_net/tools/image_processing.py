@@ -2,7 +2,6 @@ import math
 import numpy as np
 import cv2
 from typing import List, Union
-from scipy.spatial import ConvexHull
 
 
 def fline(p0: List, p1: List, debug: bool = False) -> List:
@@ -274,6 +273,8 @@ def minimum_bounding_rectangle(points: np.ndarray) -> np.ndarray:
     :param points: an nx2 matrix of coordinates
     :rval: an nx2 matrix of coordinates
     """
+    from scipy.spatial import ConvexHull
+
     pi2 = np.pi / 2.
 
     # get the convex hull for the points
@@ -584,7 +585,34 @@ def crop_number_plate_zones_from_images(images, image_ids, images_points):
     return zones, image_ids
 
 
+def scale_bboxes(bboxes, scale):
+    """
+    Map detector outputs [[x1, y1, x2, y2, conf, cls, keypoints], ...] of a reduced image
+    to the full resolution image, scale is (sx, sy) (see nomeroff_net.image_loaders.base.ScaledImage)
+    """
+    if scale is None:
+        return bboxes
+    sx, sy = scale
+    return [[bbox[0] * sx, bbox[1] * sy, bbox[2] * sx, bbox[3] * sy, *bbox[4:-1],
+             np.asarray(bbox[-1]) * np.array([sx, sy], dtype=np.float32)]
+            for bbox in bboxes]
+
+
+def unscale_points(points, scale):
+    """
+    Map full resolution points (keypoints or [[x1, y1], [x2, y2]] of bboxes in results)
+    to the image of the result, which is reduced for images decoded with TurboImageLoader(decode_size=...):
+    scale is image.scale of ScaledImage, points are returned as is if it is None
+    """
+    if scale is None:
+        return points
+    return np.asarray(points, dtype=np.float32) / np.array(scale, dtype=np.float32)
+
+
 def crop_number_plate_roi_zones_from_images(images, images_bboxes):
+    """
+    Plate ROI crops, full resolution regions are re-decoded for images decoded at reduced resolution
+    """
     zones = []
     image_ids = []
     images_points = []
@@ -596,7 +624,10 @@ def crop_number_plate_roi_zones_from_images(images, images_bboxes):
             max_y = int(max(bbox[1], bbox[3]))
             points = bbox[-1] - np.array([min_x, min_y])
             images_points.append(points)
-            zone = image[min_y:max_y, min_x:max_x]
+            if getattr(image, "scale", None) is not None:
+                zone = image.crop(min_x, min_y, max_x, max_y)
+            else:
+                zone = image[min_y:max_y, min_x:max_x]
             zones.append(zone)
             image_ids.append(i)
     return zones, image_ids, images_points
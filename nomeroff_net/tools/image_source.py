@@ -0,0 +1,276 @@
+"""
+Prefetching image source for bulk jobs
+
+ImageSource lists directories, globs, tar/zip archives and path lists lazily (sorted, so the order is stable),
+sniffs file types by their first bytes, reads and decodes prefetch items ahead in a background thread pool
+and feeds the streaming pipeline. offset is the position of the next item to process in the listing,
+pass it to a new ImageSource to resume an interrupted run.
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> from nomeroff_net.tools.image_source import ImageSource
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv")
+    >>> source = ImageSource(["./data/examples/oneline_images", "./data/examples/multiline_images/*.jpg"],
+    ...                      image_loader="opencv", prefetch=32, max_workers=4)
+    >>> for name, result in source.stream(number_plate_detection_and_reading, batch_size=8):
+    ...     print(name, result[-1])
+    >>> # resume from the first not processed item
+    >>> source = ImageSource("./data/examples/oneline_images", offset=source.offset)
+
+python3 -m nomeroff_net.tools.image_source -f nomeroff_net/tools/image_source.py
+"""
+import os
+import glob
+import tarfile
+import zipfile
+import itertools
+import threading
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
+
+from nomeroff_net.tools.errors import ImageLoaderError
+from nomeroff_net.tools.pipeline_tools import get_executor
+
+ARCHIVE_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+
+
+def sniff_image_type(data: bytes) -> str or None:
+    """
+    Image type by the signature of the first bytes, None for other files
+    """
+    for signature, image_type in IMAGE_SIGNATURES:
+        if data[:len(signature)] == signature:
+            return image_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def iter_archive(path: str) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    """
+    (name, read) of archive members in the archive order, read() must be called before the next member
+    """
+    if path.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield f"{path}!{info.filename}", lambda info=info: archive.read(info)
+        return
+    # stream mode: members of compressed archives are read in order without seeking back
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if member.isfile():
+                yield f"{path}!{member.name}", lambda member=member: archive.extractfile(member).read()
+
+
+class ImageSource(object):
+    """
+    Lazy iterator of decoded images (or raw bytes with image_loader=None)
+    """
+
+    def __init__(self,
+                 sources: Union[str, os.PathLike, List],
+                 image_loader: Any = "opencv",
+                 prefetch: int = 16,
+                 max_workers: int = 4,
+                 offset: int = 0,
+                 recursive: bool = False,
+                 on_error: str = "skip"):
+        """
+        Args:
+            sources (): directory, glob, tar/zip archive, file path or list of them
+            image_loader (): image loader name or instance, None yields raw bytes (decoded by the pipeline loader)
+            prefetch (): count of items read and decoded ahead
+            max_workers (): threads of the background pool
+            offset (): skip the first items of the listing, see offset after an interrupted run
+            recursive (): walk subdirectories, "**" in globs
+            on_error (): "skip" unreadable or corrupted images (see get_stat) or "raise" ImageLoaderError
+        """
+        if on_error not in ("skip", "raise"):
+            raise ValueError(f"on_error must by in ['skip', 'raise'], got {on_error}")
+        if isinstance(sources, (str, os.PathLike)):
+            sources = [sources]
+        self.sources = list(sources)
+        if isinstance(image_loader, str):
+            from nomeroff_net.image_loaders import image_loaders_map
+            image_loader = image_loaders_map[image_loader]()
+        self.image_loader = image_loader
+        self.prefetch = max(prefetch, 1)
+        self.max_workers = max_workers
+        self.offset = offset
+        # listing position after the last listed item
+        self.end_offset = offset
+        self.recursive = recursive
+        self.on_error = on_error
+        self.stat = Counter()
+        self.last_errors = deque(maxlen=10)
+        self._stat_lock = threading.Lock()
+
+    def iter_source(self, source: Union[str, os.PathLike]) -> Iterator[Tuple[str, Any]]:
+        source = os.fspath(source)
+        if os.path.isdir(source):
+            if self.recursive:
+                for root, dirs, files in os.walk(source):
+                    dirs.sort()
+                    for file_name in sorted(files):
+                        path = os.path.join(root, file_name)
+                        yield path, path
+            else:
+                for file_name in sorted(os.listdir(source)):
+                    path = os.path.join(source, file_name)
+                    if os.path.isfile(path):
+                        yield path, path
+        elif source.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(source):
+            yield from iter_archive(source)
+        elif any(char in source for char in "*?["):
+            for path in sorted(glob.iglob(source, recursive=self.recursive)):
+                if os.path.isfile(path):
+                    yield path, path
+        else:
+            yield source, source
+
+    def iter_entries(self) -> Iterator[Tuple[str, Any]]:
+        """
+        (name, path or read function of the archive member) of all sources
+        """
+        for source in self.sources:
+            yield from self.iter_source(source)
+
+    def load(self, data: Union[str, bytes]) -> Any:
+        """
+        Read (path) and decode the item in the background pool, None if it is not an image
+        """
+        if isinstance(data, str):
+            with open(data, "rb") as f:
+                data = f.read()
+        if sniff_image_type(data) is None:
+            return None
+        if self.image_loader is None:
+            return data
+        return self.image_loader.load_bytes(data)
+
+    def iter_items(self) -> Iterator[Tuple[int, str, Any]]:
+        """
+        (listing index, name, image) starting from offset, prefetch items are loaded ahead
+        """
+        pool = get_executor("thread", self.max_workers, name="image_source")
+        entries = itertools.islice(enumerate(self.iter_entries()), self.offset, None)
+        pending = deque()
+        self.end_offset = self.offset
+
+        def submit():
+            for index, (name, data) in entries:
+                self.end_offset = index + 1
+                if callable(data):
+                    # archive members are read in the listing order
+                    data = data()
+                pending.append((index, name, pool.submit(self.load, data)))
+                return True
+            return False
+
+        while len(pending) < self.prefetch and submit():
+            pass
+        while pending:
+            index, name, future = pending.popleft()
+            submit()
+            try:
+                image = future.result()
+            except Exception as e:
+                with self._stat_lock:
+                    self.stat["errors"] += 1
+                    self.last_errors.append((name, repr(e)))
+                if self.on_error == "raise":
+                    raise ImageLoaderError(f"Can not load {name}: {e!r}") from e
+                continue
+            if image is None:
+                with self._stat_lock:
+                    self.stat["skipped"] += 1
+                continue
+            with self._stat_lock:
+                self.stat["images"] += 1
+            yield index, name, image
+
+    def __iter__(self) -> Iterator[Any]:
+        for index, name, image in self.iter_items():
+            yield image
+            # the item is processed when the next one is requested
+            self.offset = index + 1
+        self.offset = self.end_offset
+
+    def stream(self, pipeline: Callable, batch_size: int = 1, **kwargs) -> Iterator[Tuple[str, Any]]:
+        """
+        (name, result) of pipeline.stream over the source, offset follows the results
+        """
+        names = deque()
+
+        def images():
+            for index, name, image in self.iter_items():
+                names.append((index, name))
+                yield image
+
+        for result in pipeline.stream(images(), batch_size=batch_size, **kwargs):
+            index, name = names.popleft()
+            self.offset = index + 1
+            yield name, result
+        self.offset = self.end_offset
+
+    def get_stat(self) -> Dict:
+        with self._stat_lock:
+            return {
+                "images": self.stat["images"],
+                "skipped": self.stat["skipped"],
+                "errors": self.stat["errors"],
+                "offset": self.offset,
+                "last_errors": list(self.last_errors),
+            }
+
+
+if __name__ == "__main__":
+    import io
+    import tempfile
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    images_dir = os.path.join(current_dir, "../../data/examples/oneline_images")
+    image_names = sorted(name for name in os.listdir(images_dir)
+                         if os.path.isfile(os.path.join(images_dir, name)))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tar_path = os.path.join(tmp_dir, "images.tar.gz")
+        with tarfile.open(tar_path, "w:gz") as tar:
+            tar.add(os.path.join(images_dir, image_names[0]), arcname="0.jpeg")
+            readme = tarfile.TarInfo("readme.txt")
+            readme.size = 5
+            tar.addfile(readme, io.BytesIO(b"hello"))
+        source = ImageSource([images_dir, tar_path], prefetch=4, max_workers=2)
+        images = list(source)
+        assert source.get_stat()["images"] == len(images) and source.get_stat()["skipped"] >= 1
+        assert all(image.ndim == 3 for image in images)
+
+        # resume after the first image
+        source = ImageSource([images_dir, tar_path], image_loader=None, offset=1)
+        resumed = list(source)
+        assert len(resumed) == len(images) - 1 and isinstance(resumed[0], bytes)
+        assert source.offset == len(image_names) + 2
+
+        class EchoPipeline(object):
+            @staticmethod
+            def stream(inputs, batch_size=1):
+                for item in inputs:
+                    yield item.shape
+
+        source = ImageSource(images_dir)
+        names = [name for name, _ in source.stream(EchoPipeline(), batch_size=2)]
+        assert [os.path.basename(name) for name in names] == [name for name in image_names
+                                                             if sniff_image_type(open(os.path.join(images_dir, name),
+                                                                                      "rb").read(16))]
+    print(source.get_stat())
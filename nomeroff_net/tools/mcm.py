@@ -1,6 +1,6 @@
 import os
-
-from modelhub_client import ModelHub
+import threading
+from functools import lru_cache
 
 model_config_urls = [
     # numberplate classification
@@ -73,12 +73,65 @@ additional_urls = os.environ.get("ADDITIONAL_MODEL_CONFIG_URLS", "")
 if additional_urls:
     model_config_urls.extend(additional_urls.split(","))
 
+
+class LazyModelHub(object):
+    """
+    ModelHub proxy, modelhub_client is imported and ModelHub is created on the first attribute access
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._modelhub = None
+        self._bundle = None
+        self._lock = threading.Lock()
+
+    def get_modelhub(self):
+        if self._modelhub is None:
+            with self._lock:
+                if self._modelhub is None:
+                    from modelhub_client import ModelHub
+                    self._modelhub = ModelHub(**self._kwargs)
+        return self._modelhub
+
+    def use_bundle(self, bundle):
+        """
+        Serve models and download_model_by_name from the ModelBundle (no network), None switches back to ModelHub
+        """
+        self._bundle = bundle
+
+    def get_source(self) -> str:
+        """
+        Where "latest" models come from now: bundle://<bundle path> or modelhub
+        """
+        if self._bundle is not None:
+            # bundle-like objects without a path are told apart by identity
+            return f"bundle://{getattr(self._bundle, 'path', id(self._bundle))}"
+        return "modelhub"
+
+    @property
+    def models(self):
+        if self._bundle is not None:
+            return self._bundle.models
+        return self.get_modelhub().models
+
+    def download_model_by_name(self, name, *args, **kwargs):
+        if self._bundle is not None:
+            return self._bundle.download_model_by_name(name)
+        return self.get_modelhub().download_model_by_name(name, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get_modelhub(), name)
+
+
 # initial
 local_storage = os.environ.get('LOCAL_STORAGE', os.path.join(os.path.dirname(__file__), "../../data"))
-modelhub = ModelHub(model_config_urls=model_config_urls,
-                    local_storage=local_storage)
+modelhub = LazyModelHub(model_config_urls=model_config_urls,
+                        local_storage=local_storage)
 
 
+@lru_cache(maxsize=None)
 def get_mode_torch() -> str:
     import torch
     if torch.cuda.is_available():
@@ -86,6 +139,7 @@ def get_mode_torch() -> str:
     return "cpu"
 
 
+@lru_cache(maxsize=None)
 def get_device_torch() -> str:
     import torch
     if torch.cuda.is_available():
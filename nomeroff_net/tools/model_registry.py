@@ -0,0 +1,256 @@
+"""
+Process-wide registry of loaded models
+
+Pipelines built with the same models share one read-only (eval, requires_grad=False) instance
+with reference counting, the instance is dropped when the last pipeline releases it.
+reload() loads and validates new weights, then swaps the instance for all holders (see subscribe),
+calls that already took the old instance finish on it.
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> from nomeroff_net.tools.model_registry import model_registry
+    >>> number_plate_filling = pipeline("number_plate_filling", image_loader="opencv")
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv")
+    >>> # the same yolo detector is used by both pipelines
+    >>> print(model_registry.get_stat())
+    >>> number_plate_filling.close()
+
+python3 -m nomeroff_net.tools.model_registry -f nomeroff_net/tools/model_registry.py
+"""
+import uuid
+import weakref
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def freeze_model(instance: Any) -> Any:
+    """
+    Make shared torch modules read-only: eval mode and no gradients
+    """
+    import torch.nn as nn
+
+    for module in (instance, getattr(instance, "model", None)):
+        if isinstance(module, nn.Module):
+            module.eval()
+            module.requires_grad_(False)
+    return instance
+
+
+class ModelRegistry(object):
+    """
+    Shared model instances keyed by (model name, path, device, precision, *extra)
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.keys = {}
+        self.stat = Counter()
+        # incremented on every load and reload, entries keep the version they were loaded with,
+        # versions are unique only within the registry instance (inherited by forked workers)
+        self.version = 0
+        self.instance_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._listeners = []
+
+    @staticmethod
+    def make_key(name: str, path: str, device: str = None, precision: str = "fp32", **extra) -> Tuple:
+        """
+        Args:
+            name (): model name or class of the model wrapper
+            path (): path_to_model ("latest", modelhub://..., local path)
+            device (): torch device, get_device_torch() if None
+            precision (): weights precision
+            extra (): other options that change the loaded model, compared by repr
+        "latest" and modelhub:// models are resolved by modelhub or by the bundle in use (see tools.bundle),
+        their key has the source, so bundle and modelhub models of the same name are not shared
+        """
+        if device is None:
+            from nomeroff_net.tools.mcm import get_device_torch
+            device = get_device_torch()
+        if str(path) == "latest" or str(path).startswith("modelhub://"):
+            from nomeroff_net.tools.mcm import modelhub
+            extra.setdefault("source", modelhub.get_source())
+        return (name, str(path), str(device), precision, *((key, repr(extra[key])) for key in sorted(extra)))
+
+    def acquire(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+        """
+        Return the shared instance for key, it is created by factory() the first time,
+        concurrent acquires of the same key wait for one load
+        """
+        while True:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                with self._lock:
+                    if self._key_locks.get(key) is not key_lock:
+                        # the last holder released the model meanwhile and dropped the lock, take the current one
+                        continue
+                    entry = self.entries.get(key)
+                    if entry is not None:
+                        entry["refcount"] += 1
+                        self.stat["hits"] += 1
+                        return entry["instance"]
+                instance = freeze_model(factory())
+                with self._lock:
+                    self.version += 1
+                    self.entries[key] = {"instance": instance, "refcount": 1, "version": self.version}
+                    self.keys[id(instance)] = key
+                    self.stat["loads"] += 1
+                return instance
+
+    def reload(self, key: Tuple, factory: Callable[[], Any], validate: Callable[[Any], None] = None,
+               new_key: Tuple = None) -> Any:
+        """
+        Load the new instance with factory() in the calling thread, validate(instance) it (must raise on failure),
+        then atomically replace the instance of key (moved to new_key if it is set) and notify subscribers,
+        so holders swap their references. Holders are not blocked while the new instance is loaded.
+        """
+        with self._lock:
+            if key not in self.entries:
+                raise KeyError(f"Model {key} is not loaded")
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                instance = freeze_model(factory())
+                if validate is not None:
+                    validate(instance)
+            except BaseException:
+                with self._lock:
+                    self.stat["reload_failures"] += 1
+                raise
+            with self._lock:
+                new_key = key if new_key is None else new_key
+                if new_key != key and new_key in self.entries:
+                    raise ValueError(f"Model {new_key} is already loaded")
+                entry = self.entries.pop(key)
+                old_instance = entry["instance"]
+                del self.keys[id(old_instance)]
+                self.version += 1
+                self.entries[new_key] = {"instance": instance, "refcount": entry["refcount"], "version": self.version}
+                self.keys[id(instance)] = new_key
+                if new_key != key:
+                    self._key_locks[new_key] = self._key_locks.pop(key)
+                self.stat["reloads"] += 1
+                listeners = list(self._listeners)
+        for listener in listeners:
+            callback = listener()
+            if callback is not None:
+                callback(old_instance, instance)
+        return instance
+
+    def subscribe(self, callback: Callable[[Any, Any], None]) -> None:
+        """
+        callback(old_instance, new_instance) is called after every reload,
+        bound methods are kept by weak reference
+        """
+        with self._lock:
+            self._listeners = [listener for listener in self._listeners if listener() is not None]
+            if hasattr(callback, "__self__"):
+                self._listeners.append(weakref.WeakMethod(callback))
+            else:
+                self._listeners.append(lambda: callback)
+
+    def get_version(self, instance: Any) -> int:
+        """
+        Version of the shared instance, 0 if it is not in the registry
+        """
+        with self._lock:
+            key = self.keys.get(id(instance))
+            return 0 if key is None else self.entries[key]["version"]
+
+    def get_key(self, instance: Any) -> Tuple or None:
+        with self._lock:
+            return self.keys.get(id(instance))
+
+    def release(self, instance: Any) -> int:
+        """
+        Decrease reference count of the shared instance, drop it when it is not used, return refcount left
+        """
+        with self._lock:
+            key = self.keys.get(id(instance))
+            if key is None:
+                return 0
+            entry = self.entries[key]
+            entry["refcount"] -= 1
+            if entry["refcount"] > 0:
+                return entry["refcount"]
+            del self.entries[key]
+            del self.keys[id(instance)]
+            self._key_locks.pop(key, None)
+            self.stat["unloads"] += 1
+            return 0
+
+    def get_instances(self) -> List:
+        with self._lock:
+            return [entry["instance"] for entry in self.entries.values()]
+
+    def get_refcount(self, instance: Any) -> int:
+        with self._lock:
+            key = self.keys.get(id(instance))
+            return 0 if key is None else self.entries[key]["refcount"]
+
+    def get_stat(self) -> Dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "loads": self.stat["loads"],
+                "hits": self.stat["hits"],
+                "unloads": self.stat["unloads"],
+                "reloads": self.stat["reloads"],
+                "reload_failures": self.stat["reload_failures"],
+                "models": [{"key": key, "refcount": entry["refcount"], "version": entry["version"]}
+                           for key, entry in self.entries.items()],
+            }
+
+
+model_registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    import torch
+    import torch.nn as nn
+
+    registry = ModelRegistry()
+    model_key = registry.make_key("linear", "latest", device="cpu")
+    assert model_key != registry.make_key("linear", "latest", device="cpu", source="bundle:///tmp/test.bundle")
+    first = registry.acquire(model_key, lambda: nn.Linear(4, 2))
+    second = registry.acquire(model_key, lambda: nn.Linear(4, 2))
+    assert first is second and not first.training and not first.weight.requires_grad
+    assert registry.release(first) == 1 and registry.release(second) == 0
+    third = registry.acquire(model_key, lambda: nn.Linear(4, 2))
+    assert third is not first
+
+    # an acquire that waited on the lock of a released model takes the model loaded meanwhile
+    waiting_lock = registry._key_locks[model_key]
+    waiting_lock.acquire()
+    waited = []
+    waiting = threading.Thread(target=lambda: waited.append(registry.acquire(model_key, lambda: nn.Linear(4, 2))))
+    waiting.start()
+    assert registry.release(third) == 0
+    fourth = registry.acquire(model_key, lambda: nn.Linear(4, 2))
+    waiting_lock.release()
+    waiting.join()
+    assert waited[0] is fourth and registry.get_refcount(fourth) == 2 and registry.stat["loads"] == 3
+    registry.release(fourth)
+    third = registry.acquire(model_key, lambda: nn.Linear(4, 2))
+
+    class Holder(object):
+        def __init__(self, model):
+            self.model = model
+
+        def on_model_swap(self, old, new):
+            if self.model is old:
+                self.model = new
+
+    holder = Holder(third)
+    registry.subscribe(holder.on_model_swap)
+    try:
+        registry.reload(model_key, lambda: nn.Linear(4, 2), validate=lambda model: model(torch.ones(1, 3)))
+    except RuntimeError:
+        pass
+    assert holder.model is third and registry.stat["reload_failures"] == 1
+    registry.reload(model_key, lambda: nn.Linear(4, 2), validate=lambda model: model(torch.ones(1, 4)))
+    assert holder.model is not third and registry.get_version(holder.model) == registry.version
+    print(registry.get_stat())
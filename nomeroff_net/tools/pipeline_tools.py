@@ -1,6 +1,10 @@
-import gevent
+import math
+import time
+import atexit
 import itertools
-from gevent import Greenlet
+import threading
+from queue import Queue, Empty, Full
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
 
 
 def chunked_iterable(iterable, size):
@@ -12,6 +16,30 @@ def chunked_iterable(iterable, size):
         yield chunk
 
 
+async def achunked_iterable(iterable, size):
+    """
+    The same as chunked_iterable, but for async iterables
+    """
+    chunk = []
+    async for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def split_iterable(iterable, parts):
+    """
+    Split sized iterable into at most `parts` contiguous chunks of nearly equal size
+    """
+    items = list(iterable)
+    if not items:
+        return []
+    return list(chunked_iterable(items, math.ceil(len(items) / parts)))
+
+
 def unzip(zipped):
     return list(zip(*zipped))
 
@@ -32,7 +60,160 @@ def promise_all(function_list):
     ]
     :return: List response
     """
+    import gevent
+    from gevent import Greenlet
+
     jobs = [Greenlet.spawn(process_job, item) for item in function_list]
     gevent.joinall(jobs)
     res = [job.value for job in jobs]
     return res
+
+
+class SyncExecutor(Executor):
+    """
+    Executor that runs the function in the calling thread, submit returns the done future
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+EXECUTORS_CLASSES = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor,
+}
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(executor="thread", max_workers=1, name="default"):
+    """
+    Return persistent pool for executor name ("thread" or "process") and max_workers,
+    the pool is created once and reused by all next calls.
+    Use different name to get separate pool (for example to avoid waiting on the tasks of the same pool).
+    Instance of concurrent.futures.Executor is returned as is.
+    """
+    if isinstance(executor, Executor):
+        return executor
+    if executor not in EXECUTORS_CLASSES:
+        raise ValueError(f"executor must by in {list(EXECUTORS_CLASSES.keys())}, 'gevent' "
+                         f"or concurrent.futures.Executor instance, got {executor}")
+    key = (name, executor, max_workers)
+    with _executors_lock:
+        if key not in _executors:
+            _executors[key] = EXECUTORS_CLASSES[executor](max_workers=max_workers)
+        return _executors[key]
+
+
+@atexit.register
+def shutdown_executors(wait=True):
+    """
+    Shutdown all persistent pools created by get_executor
+    """
+    with _executors_lock:
+        for pool in _executors.values():
+            pool.shutdown(wait=wait)
+        _executors.clear()
+
+
+def executor_all(function_list, executor="thread", max_workers=1):
+    """
+    The same as promise_all, but runs functions in the persistent thread/process pool
+    or in the custom concurrent.futures.Executor.
+    For "process" executor functions and arguments must be picklable.
+    :return: List response
+    """
+    pool = get_executor(executor, max_workers)
+    futures = [pool.submit(item["function"], *item.get("args", []), **item.get("kwargs", {}))
+               for item in function_list]
+    return [future.result() for future in futures]
+
+
+_STAGE_END = object()
+
+
+class _StageError(object):
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _stage_put(queue, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def _stage_worker(func, in_queue, out_queue, stop_event):
+    while not stop_event.is_set():
+        try:
+            item = in_queue.get(timeout=0.1)
+        except Empty:
+            continue
+        if item is not _STAGE_END and not isinstance(item, _StageError):
+            try:
+                item = func(item)
+            except BaseException as e:
+                item = _StageError(e)
+        if not _stage_put(out_queue, item, stop_event) or item is _STAGE_END:
+            return
+
+
+def _stage_feeder(iterable, out_queue, stop_event):
+    try:
+        for item in iterable:
+            if not _stage_put(out_queue, item, stop_event):
+                return
+    except BaseException as e:
+        _stage_put(out_queue, _StageError(e), stop_event)
+        return
+    _stage_put(out_queue, _STAGE_END, stop_event)
+
+
+def run_stages(iterable, stages, queue_size=1, stop_timeout=1.):
+    """
+    Run every item of iterable through the chain of stage functions,
+    each stage works in its own thread, so the stages of the neighbouring items overlap:
+    item N+1 is in stages[0] while item N is in stages[1] and so on.
+    Stages are connected by queues with max size queue_size (backpressure),
+    output order is the same as input order.
+    After an error or an early close the feeder is not joined (it may be blocked in the input iterable)
+    and stages are joined at most stop_timeout seconds, threads that are still busy are left (daemon).
+    :return: generator of processed items
+    """
+    stop_event = threading.Event()
+    queues = [Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_stage_feeder, args=(iterable, queues[0], stop_event), daemon=True)]
+    for i, stage in enumerate(stages):
+        threads.append(threading.Thread(target=_stage_worker,
+                                        args=(stage, queues[i], queues[i + 1], stop_event),
+                                        daemon=True))
+    for thread in threads:
+        thread.start()
+    completed = False
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _STAGE_END:
+                completed = True
+                break
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
+    finally:
+        stop_event.set()
+        if completed:
+            for thread in threads:
+                thread.join()
+        else:
+            deadline = time.monotonic() + stop_timeout
+            for thread in threads[1:]:
+                thread.join(max(deadline - time.monotonic(), 0))
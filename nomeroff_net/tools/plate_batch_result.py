@@ -0,0 +1,339 @@
+"""
+Columnar batch result of number plate detection and reading
+
+All plates of a batch are kept in contiguous arrays (N plates), plates of the image i
+are plates[image_offsets[i]:image_offsets[i+1]] (CSR-style index).
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv")
+    >>> result = number_plate_detection_and_reading(['./data/examples/oneline_images/example1.jpeg',
+    ...                                              './data/examples/oneline_images/example2.jpeg'],
+    ...                                             columnar=True)
+    >>> result.bboxes.shape, result.image_offsets
+    ((3, 4), array([0, 1, 3]))
+    >>> result.get_image_texts(1)
+    ['RP70012', 'JJF509']
+    >>> # old tuple shape, values are rebuilt from the columns (see PlateBatchResult.__getitem__)
+    >>> (image, image_bboxs, image_points, image_zones, region_ids,
+    ...  region_names, count_lines, confidences, texts) = result[1]
+
+python3 -m nomeroff_net.tools.plate_batch_result -f nomeroff_net/tools/plate_batch_result.py
+"""
+import numpy as np
+from collections.abc import Sequence
+from typing import List, Dict, Tuple
+
+
+class PlateBatchResult(Sequence):
+    """
+    Columnar result, as Sequence it is the list of the old 9-tuples (one per image):
+    (image, image_bboxs, image_points, image_zones, region_ids, region_names, count_lines, confidences, texts)
+    """
+    FIELDS = ("images", "bboxs", "points", "zones", "region_ids", "region_names", "count_lines", "confidences", "texts")
+
+    def __init__(self,
+                 image_offsets: np.ndarray,
+                 bboxes: np.ndarray = None,
+                 det_confidences: np.ndarray = None,
+                 det_classes: np.ndarray = None,
+                 keypoints: np.ndarray = None,
+                 region_ids: np.ndarray = None,
+                 region_names: List[str] = None,
+                 count_lines: np.ndarray = None,
+                 confidences: np.ndarray = None,
+                 texts: List[str] = None,
+                 zones: List[np.ndarray] = None,
+                 images: List[np.ndarray] = None):
+        """
+        Args:
+            image_offsets (): (n_images + 1,) int64, plates of image i are [image_offsets[i], image_offsets[i+1])
+            bboxes (): (N, 4) float32 x1, y1, x2, y2
+            det_confidences (): (N,) float32 detector confidences
+            det_classes (): (N,) int64 detector classes
+            keypoints (): (N, 4, 2) float32 number plate key points
+            region_ids (): (N,) int64
+            region_names (): N region names
+            count_lines (): (N,) int64
+            confidences (): (N, 2) float32 region and count lines confidences, -1 if classification is off
+            texts (): N texts
+            zones (): N zone crops
+            images (): n_images source images
+        """
+        self.image_offsets = image_offsets
+        self.bboxes = bboxes
+        self.det_confidences = det_confidences
+        self.det_classes = det_classes
+        self.keypoints = keypoints
+        self.region_ids = region_ids
+        self.region_names = region_names
+        self.count_lines = count_lines
+        self.confidences = confidences
+        self.texts = texts
+        self.zones = zones
+        self.images = images
+
+    @classmethod
+    def from_detections(cls,
+                        images_bboxs: List[List],
+                        region_ids: List[int] = None,
+                        region_names: List[str] = None,
+                        count_lines: List[int] = None,
+                        confidences: List = None,
+                        texts: List[str] = None,
+                        zones: List[np.ndarray] = None,
+                        images: List[np.ndarray] = None,
+                        fields: Tuple[str] = FIELDS) -> "PlateBatchResult":
+        """
+        Build from the per image detector outputs [[x1, y1, x2, y2, conf, cls, keypoints], ...]
+        and flat per plate properties (in the same order as plates in images_bboxs),
+        columns that are not in fields are skipped
+        """
+        counts = [len(bboxs) for bboxs in images_bboxs]
+        image_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=image_offsets[1:])
+        bboxs = [bbox for image_bboxs in images_bboxs for bbox in image_bboxs]
+        res = cls(image_offsets)
+        if "bboxs" in fields:
+            res.bboxes = np.array([bbox[:4] for bbox in bboxs], dtype=np.float32).reshape(-1, 4)
+            res.det_confidences = np.array([bbox[4] for bbox in bboxs], dtype=np.float32)
+            res.det_classes = np.array([bbox[5] for bbox in bboxs], dtype=np.int64)
+        if "points" in fields:
+            res.keypoints = np.array([bbox[-1] for bbox in bboxs], dtype=np.float32).reshape(-1, 4, 2)
+        if region_ids is not None and "region_ids" in fields:
+            res.region_ids = np.array(region_ids, dtype=np.int64)
+        if region_names is not None and "region_names" in fields:
+            res.region_names = list(region_names)
+        if count_lines is not None and "count_lines" in fields:
+            res.count_lines = np.array(count_lines, dtype=np.int64)
+        if confidences is not None and "confidences" in fields:
+            res.confidences = np.array(confidences, dtype=np.float32)
+            if res.confidences.ndim < 2:
+                # -1 per plate without classification or no plates, every batch has (N, 2) for concat
+                res.confidences = np.repeat(res.confidences.reshape(-1, 1), 2, axis=1)
+        if texts is not None and "texts" in fields:
+            res.texts = list(texts)
+        if zones is not None and "zones" in fields:
+            res.zones = list(zones)
+        if images is not None and "images" in fields:
+            res.images = list(images)
+        return res
+
+    @classmethod
+    def get_fields(cls, fields: List[str] = None, return_images: bool = True) -> Tuple[str]:
+        """
+        Validate requested fields, return_images=False drops images and zones
+        """
+        fields = cls.FIELDS if fields is None else tuple(fields)
+        unknown = set(fields) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)}, available fields: {cls.FIELDS}")
+        if not return_images:
+            fields = tuple(field for field in fields if field not in ("images", "zones"))
+        return fields
+
+    @classmethod
+    def concat(cls, results: List["PlateBatchResult"]) -> "PlateBatchResult":
+        """
+        Join several batch results into one
+        """
+        if not results:
+            return cls(np.zeros(1, dtype=np.int64))
+        offsets = [np.zeros(1, dtype=np.int64)]
+        shift = 0
+        for result in results:
+            offsets.append(result.image_offsets[1:] + shift)
+            shift += result.count_plates
+
+        def join_arrays(name):
+            values = [getattr(result, name) for result in results]
+            if any(value is None for value in values):
+                return None
+            return np.concatenate(values)
+
+        def join_lists(name):
+            values = [getattr(result, name) for result in results]
+            if any(value is None for value in values):
+                return None
+            return [item for value in values for item in value]
+
+        return cls(np.concatenate(offsets),
+                   bboxes=join_arrays("bboxes"),
+                   det_confidences=join_arrays("det_confidences"),
+                   det_classes=join_arrays("det_classes"),
+                   keypoints=join_arrays("keypoints"),
+                   region_ids=join_arrays("region_ids"),
+                   region_names=join_lists("region_names"),
+                   count_lines=join_arrays("count_lines"),
+                   confidences=join_arrays("confidences"),
+                   texts=join_lists("texts"),
+                   zones=join_lists("zones"),
+                   images=join_lists("images"))
+
+    @property
+    def count_images(self) -> int:
+        return len(self.image_offsets) - 1
+
+    @property
+    def count_plates(self) -> int:
+        return int(self.image_offsets[-1])
+
+    @property
+    def image_ids(self) -> np.ndarray:
+        """
+        (N,) image index of every plate
+        """
+        return np.repeat(np.arange(self.count_images), np.diff(self.image_offsets))
+
+    def image_slice(self, index: int) -> slice:
+        return slice(int(self.image_offsets[index]), int(self.image_offsets[index + 1]))
+
+    def get_image_texts(self, index: int) -> List[str] or None:
+        if self.texts is None:
+            return None
+        return self.texts[self.image_slice(index)]
+
+    def get_image_zones(self, index: int) -> List[np.ndarray] or None:
+        if self.zones is None:
+            return None
+        return self.zones[self.image_slice(index)]
+
+    def get_image_bboxs(self, index: int) -> List[List] or None:
+        """
+        Detector outputs of the image in the old format [[x1, y1, x2, y2, conf, cls, keypoints], ...]
+        """
+        if self.bboxes is None:
+            return None
+        part = self.image_slice(index)
+        keypoints = self.keypoints[part] if self.keypoints is not None else [None] * (part.stop - part.start)
+        return [[*bbox, conf, int(cls), kps] for bbox, conf, cls, kps in zip(self.bboxes[part],
+                                                                             self.det_confidences[part],
+                                                                             self.det_classes[part],
+                                                                             keypoints)]
+
+    def get_image_result(self, index: int) -> "PlateBatchResult":
+        """
+        One image result, arrays are copied, so it does not keep the columns of the batch alive
+        """
+        part = self.image_slice(index)
+
+        def column(values):
+            if values is None:
+                return None
+            if isinstance(values, np.ndarray):
+                return values[part].copy()
+            return values[part]
+
+        return PlateBatchResult(self.image_offsets[index:index + 2] - self.image_offsets[index],
+                                bboxes=column(self.bboxes),
+                                det_confidences=column(self.det_confidences),
+                                det_classes=column(self.det_classes),
+                                keypoints=column(self.keypoints),
+                                region_ids=column(self.region_ids),
+                                region_names=column(self.region_names),
+                                count_lines=column(self.count_lines),
+                                confidences=column(self.confidences),
+                                texts=column(self.texts),
+                                zones=column(self.zones),
+                                images=None if self.images is None else self.images[index:index + 1])
+
+    def split(self) -> List["PlateBatchResult"]:
+        """
+        Per image results, concat(split()) is the same result
+        """
+        return [self.get_image_result(index) for index in range(self.count_images)]
+
+    def __len__(self) -> int:
+        return self.count_images
+
+    def __getitem__(self, index: int) -> Tuple:
+        """
+        Compatibility view: the old 9-tuple for the image index, not selected fields are None.
+        images, zones, region_names and texts are the same objects as before, other values are rebuilt
+        from the columns, so their types differ from the raw model outputs of the old tuples:
+        image_bboxs are [x1, y1, x2, y2, conf (np.float32), cls (int), keypoints ((4, 2) float32 array)],
+        image_points are (4, 2) float32 arrays, region_ids and count_lines are int,
+        confidences are [region, count lines] float lists ([-1.0, -1.0] if classification is off)
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("PlateBatchResult index out of range")
+        part = self.image_slice(index)
+
+        def column(values):
+            if values is None:
+                return None
+            if isinstance(values, np.ndarray):
+                return values[part].tolist()
+            return values[part]
+
+        return (
+            None if self.images is None else self.images[index],
+            self.get_image_bboxs(index),
+            None if self.keypoints is None else list(self.keypoints[part]),
+            self.get_image_zones(index),
+            column(self.region_ids),
+            column(self.region_names),
+            column(self.count_lines),
+            column(self.confidences),
+            self.get_image_texts(index),
+        )
+
+    def to_tuples(self) -> List[Tuple]:
+        return list(self)
+
+    def to_dict(self, with_zones: bool = False, with_images: bool = False) -> Dict:
+        """
+        Columns without python objects per plate, cheap to serialize (pickle, np.savez, ...)
+        """
+        res = {
+            "image_offsets": self.image_offsets,
+            "bboxes": self.bboxes,
+            "det_confidences": self.det_confidences,
+            "det_classes": self.det_classes,
+            "keypoints": self.keypoints,
+            "region_ids": self.region_ids,
+            "region_names": self.region_names,
+            "count_lines": self.count_lines,
+            "confidences": self.confidences,
+            "texts": self.texts,
+        }
+        if with_zones:
+            res["zones"] = self.zones
+        if with_images:
+            res["images"] = self.images
+        return {key: value for key, value in res.items() if value is not None}
+
+
+if __name__ == "__main__":
+    kps = np.array([[0, 0], [10, 0], [10, 5], [0, 5]], dtype=np.float32)
+    res = PlateBatchResult.from_detections(
+        [[[0, 0, 10, 5, 0.9, 0, kps]], [], [[1, 1, 11, 6, 0.8, 0, kps], [2, 2, 12, 7, 0.7, 0, kps]]],
+        region_ids=[1, 2, 3], region_names=["eu_ua_2015", "eu", "eu"], count_lines=[1, 1, 1],
+        confidences=[[0.9, 0.9], [0.8, 0.8], [0.7, 0.7]], texts=["AC4921CB", "RP70012", "JJF509"],
+        zones=[None, None, None], images=[None, None, None])
+    assert res.bboxes.shape == (3, 4) and res.keypoints.shape == (3, 4, 2)
+    assert res.image_offsets.tolist() == [0, 1, 1, 3]
+    assert res.image_ids.tolist() == [0, 2, 2]
+    assert [r[-1] for r in res] == [["AC4921CB"], [], ["RP70012", "JJF509"]]
+    joined = PlateBatchResult.concat([res, res])
+    assert joined.image_offsets.tolist() == [0, 1, 1, 3, 4, 4, 6] and len(joined) == 6
+    parts = res.split()
+    assert [len(part.texts) for part in parts] == [1, 0, 2] and parts[2].image_offsets.tolist() == [0, 2]
+    assert PlateBatchResult.concat(parts).to_tuples()[2][-1] == ["RP70012", "JJF509"]
+    fields = PlateBatchResult.get_fields(["bboxs", "texts", "zones"], return_images=False)
+    projected = PlateBatchResult.from_detections([[[0, 0, 10, 5, 0.9, 0, kps]]], texts=["AC4921CB"],
+                                                 zones=[None], fields=fields)
+    assert projected.keypoints is None and projected.zones is None and projected[0][-1] == ["AC4921CB"]
+    # images and chunks without plates are joined with the ones with plates
+    empty = PlateBatchResult.from_detections([[]], region_ids=[], region_names=[], count_lines=[],
+                                             confidences=[], texts=[], zones=[], images=[None])
+    assert empty.confidences.shape == (0, 2)
+    joined = PlateBatchResult.concat([empty, res, empty])
+    assert joined.image_offsets.tolist() == [0, 0, 1, 1, 3, 3] and joined.confidences.shape == (3, 2)
+    unclassified = PlateBatchResult.from_detections([[[0, 0, 10, 5, 0.9, 0, kps]]], confidences=[-1])
+    assert PlateBatchResult.concat([empty, unclassified])[1][7] == [[-1., -1.]]
+    print(res.to_dict())
@@ -0,0 +1,181 @@
+"""
+Per-stage latency profiler with HDR-style histograms
+
+Examples:
+    >>> from nomeroff_net.tools.profiler import StageProfiler
+    >>> profiler = StageProfiler()
+    >>> with profiler.timeit("decode", batch_size=8):
+    ...     pass
+    >>> profiler.get_stat()["decode"][8]["p99"]
+    >>> print(profiler.to_prometheus())
+
+python3 -m nomeroff_net.tools.profiler -f nomeroff_net/tools/profiler.py
+"""
+import math
+import time
+import ujson
+import threading
+from contextlib import contextmanager, nullcontext
+from collections import Counter
+from typing import Dict, List
+
+
+class LatencyHistogram(object):
+    """
+    Log-linear histogram (HDR-style): every power of two is split into `sub_buckets` linear buckets,
+    so the relative error of percentiles is less than 1 / sub_buckets
+    and record is O(1) with memory independent of the count of values.
+    """
+
+    def __init__(self, sub_buckets: int = 32, unit: float = 1e-6):
+        self.sub_buckets = sub_buckets
+        self.unit = unit
+        self.buckets = Counter()
+        self.count = 0
+        self.sum = 0.
+        self.min = math.inf
+        self.max = 0.
+
+    def _bucket_index(self, value: float) -> int:
+        units = int(value / self.unit)
+        if units < self.sub_buckets:
+            return units
+        exponent = units.bit_length() - 1
+        shift = exponent - int(math.log2(self.sub_buckets))
+        return (shift + 1) * self.sub_buckets + (units >> shift) - self.sub_buckets
+
+    def _bucket_upper_bound(self, index: int) -> float:
+        if index < self.sub_buckets:
+            return (index + 1) * self.unit
+        shift = index // self.sub_buckets - 1
+        sub_bucket = index % self.sub_buckets + self.sub_buckets
+        return ((sub_bucket + 1) << shift) * self.unit
+
+    def record(self, value: float) -> None:
+        self.buckets[self._bucket_index(value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, percent: float) -> float:
+        if not self.count:
+            return 0.
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self._bucket_upper_bound(index), self.max)
+        return self.max
+
+    def get_stat(self, percentiles: List[float] = (50, 95, 99)) -> Dict:
+        stat = {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.,
+            "min": self.min if self.count else 0.,
+            "max": self.max,
+        }
+        for percent in percentiles:
+            stat[f"p{percent}"] = self.percentile(percent)
+        return stat
+
+
+class StageProfiler(object):
+    """
+    Thread-safe collection of latency histograms keyed by (stage, batch_size)
+    """
+
+    def __init__(self, enabled: bool = True, sub_buckets: int = 32):
+        self.enabled = enabled
+        self.sub_buckets = sub_buckets
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, batch_size: int = None) -> None:
+        if not self.enabled:
+            return
+        key = (stage, batch_size)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram(self.sub_buckets)
+            histogram.record(seconds)
+
+    @contextmanager
+    def timeit(self, stage: str, batch_size: int = None):
+        ts = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - ts, batch_size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.histograms = {}
+
+    def get_stat(self) -> Dict:
+        """
+        {stage: {batch_size: {count, sum, mean, min, max, p50, p95, p99}}}, times in seconds
+        """
+        with self._lock:
+            items = [(key, histogram.get_stat()) for key, histogram in self.histograms.items()]
+        stat = {}
+        for (stage, batch_size), histogram_stat in sorted(items, key=lambda item: (item[0][0], item[0][1] or 0)):
+            stat.setdefault(stage, {})[batch_size] = histogram_stat
+        return stat
+
+    def to_json(self) -> str:
+        return ujson.dumps(self.get_stat())
+
+    def to_prometheus(self, name: str = "nomeroff_net_stage_latency_seconds") -> str:
+        """
+        Prometheus text exposition format (summary per stage and batch size)
+        """
+        lines = [f"# HELP {name} Nomeroff Net pipeline stage latency in seconds",
+                 f"# TYPE {name} summary"]
+        max_lines = [f"# HELP {name}_max Nomeroff Net pipeline stage max latency in seconds",
+                     f"# TYPE {name}_max gauge"]
+        for stage, batch_sizes in self.get_stat().items():
+            for batch_size, stat in batch_sizes.items():
+                labels = f'stage="{stage}"'
+                if batch_size is not None:
+                    labels += f',batch_size="{batch_size}"'
+                for quantile in ("0.5", "0.95", "0.99"):
+                    value = stat[f"p{int(float(quantile) * 100)}"]
+                    lines.append(f'{name}{{{labels},quantile="{quantile}"}} {value}')
+                lines.append(f'{name}_sum{{{labels}}} {stat["sum"]}')
+                lines.append(f'{name}_count{{{labels}}} {stat["count"]}')
+                max_lines.append(f'{name}_max{{{labels}}} {stat["max"]}')
+        lines.extend(max_lines)
+        return "\n".join(lines) + "\n"
+
+
+def profile(profiler: StageProfiler or None, stage: str, batch_size: int = None):
+    """
+    Return profiler.timeit context manager or empty context manager if profiler is None
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.timeit(stage, batch_size)
+
+
+if __name__ == "__main__":
+    import random
+
+    histogram = LatencyHistogram()
+    values = [random.uniform(0.001, 0.1) for _ in range(10000)]
+    for v in values:
+        histogram.record(v)
+    values = sorted(values)
+    for p in (50, 95, 99):
+        exact = values[math.ceil(len(values) * p / 100) - 1]
+        assert abs(histogram.percentile(p) - exact) / exact < 1 / histogram.sub_buckets, (p, exact)
+
+    stage_profiler = StageProfiler()
+    for _ in range(10):
+        with profile(stage_profiler, "decode", batch_size=2):
+            time.sleep(0.001)
+    print(stage_profiler.to_json())
+    print(stage_profiler.to_prometheus())
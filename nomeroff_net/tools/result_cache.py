@@ -0,0 +1,328 @@
+"""
+Content-hash result cache for repeated images
+
+Results are keyed by a hash of the raw encoded bytes (file paths, bytes inputs)
+or of the decoded pixels (numpy inputs), together with the model versions of the pipeline
+(see nomeroff_net.tools.model_registry), so entries made before a hot reload are never returned.
+Entries are evicted by LRU when the size bound in bytes is reached and expire after ttl seconds.
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> from nomeroff_net.tools.result_cache import ResultCache
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv",
+    ...                                               result_cache=ResultCache(max_mb=256, ttl=3600))
+    >>> results = number_plate_detection_and_reading(['./data/examples/oneline_images/example1.jpeg'] * 2,
+    ...                                              return_images=False)
+    >>> print(number_plate_detection_and_reading.result_cache.get_stat())
+    >>> # local on-disk store shared by the workers of one host
+    >>> result_cache = ResultCache(backend="disk", cache_dir="/tmp/nomeroff_net_results", max_mb=1024)
+
+python3 -m nomeroff_net.tools.result_cache -f nomeroff_net/tools/result_cache.py
+"""
+import os
+import sys
+import time
+import pickle
+import mmap
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Approximate memory of the cached value in bytes: numpy buffers, strings and containers
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class MemoryCacheBackend(object):
+    """
+    In-process LRU dict bounded by max_bytes
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.stat = Counter()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, size, value = entry
+            if expires is not None and expires < time.time():
+                del self.entries[key]
+                self.size -= size
+                self.stat["expirations"] += 1
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[key] = (expires, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, old_size, _) = self.entries.popitem(last=False)
+                self.size -= old_size
+                self.stat["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class DiskCacheBackend(object):
+    """
+    Local on-disk store: one pickle file per entry, LRU by file mtime (touched on every hit),
+    bounded by max_bytes of files. The directory may be shared by several processes of one host.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = None, cache_dir: str = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "nomeroff_net_results")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.stat = Counter()
+        self._lock = threading.Lock()
+        self.sizes = {}
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".pkl"):
+                self.sizes[file_name[:-4]] = os.path.getsize(os.path.join(self.cache_dir, file_name))
+        self.size = sum(self.sizes.values())
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key: str) -> Any:
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            with self._lock:
+                self.stat["expirations"] += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires = None if self.ttl is None else time.time() + self.ttl
+        data = pickle.dumps((expires, value), protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        path = self.get_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.size += len(data) - self.sizes.get(key, 0)
+            self.sizes[key] = len(data)
+            over = self.size > self.max_bytes
+        if over:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+        with self._lock:
+            self.size -= self.sizes.pop(key, 0)
+
+    def evict(self) -> None:
+        """
+        Remove least recently used files until the store fits into max_bytes,
+        files written by other processes are counted too
+        """
+        files = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".pkl"):
+                continue
+            try:
+                file_stat = os.stat(os.path.join(self.cache_dir, file_name))
+            except OSError:
+                continue
+            files.append((file_stat.st_mtime, file_name[:-4], file_stat.st_size))
+        files.sort()
+        with self._lock:
+            self.sizes = {key: size for _, key, size in files}
+            self.size = sum(self.sizes.values())
+        for _, key, _ in files:
+            if self.size <= self.max_bytes:
+                break
+            self.delete(key)
+            with self._lock:
+                self.stat["evictions"] += 1
+
+    def clear(self) -> None:
+        for key in list(self.sizes):
+            self.delete(key)
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+
+CACHE_BACKENDS = {
+    "memory": MemoryCacheBackend,
+    "disk": DiskCacheBackend,
+}
+
+
+class ResultCache(object):
+    """
+    Results by content hash and context (model versions, call parameters)
+    """
+
+    def __init__(self, backend: str or Any = "memory", max_mb: float = 256, ttl: float = None,
+                 cache_dir: str = None):
+        """
+        Args:
+            backend (): "memory", "disk" or an object with get(key), set(key, value), clear() and __len__
+            max_mb (): size bound of the stored results
+            ttl (): seconds an entry lives, forever if None
+            cache_dir (): directory of the "disk" backend
+        """
+        if isinstance(backend, str):
+            if backend not in CACHE_BACKENDS:
+                raise ValueError(f"backend must by in {list(CACHE_BACKENDS.keys())} or cache backend instance, "
+                                 f"got {backend}")
+            kwargs = {"cache_dir": cache_dir} if backend == "disk" else {}
+            backend = CACHE_BACKENDS[backend](int(max_mb * 2 ** 20), ttl=ttl, **kwargs)
+        self.backend = backend
+        self.stat = Counter()
+        self._stat_lock = threading.Lock()
+
+    @staticmethod
+    def hash_input(item: Any) -> Optional[str]:
+        """
+        Hash of the raw encoded bytes (path, buffer or io.BytesIO) or of the decoded pixels (numpy array),
+        None for other file-like objects (streams can be read only once, by the image loader)
+        """
+        content_hash = hashlib.blake2b(digest_size=16)
+        if isinstance(item, np.ndarray):
+            content_hash.update(f"{item.shape}{item.dtype}".encode())
+            content_hash.update(np.ascontiguousarray(item).data)
+        elif isinstance(item, (bytes, bytearray, memoryview)):
+            content_hash.update(item)
+        elif isinstance(item, mmap.mmap):
+            with memoryview(item) as data:
+                content_hash.update(data)
+        elif hasattr(item, "getbuffer"):
+            with item.getbuffer() as data:
+                content_hash.update(data)
+        elif hasattr(item, "read"):
+            return None
+        else:
+            with open(os.fspath(item), "rb") as f:
+                for block in iter(lambda: f.read(2 ** 20), b""):
+                    content_hash.update(block)
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def make_key(content_hash: str, context: Tuple) -> str:
+        return hashlib.blake2b(f"{content_hash}{context!r}".encode(), digest_size=20).hexdigest()
+
+    def get(self, key: str) -> Any:
+        value = self.backend.get(key)
+        with self._stat_lock:
+            self.stat["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self.backend.set(key, value)
+        with self._stat_lock:
+            self.stat["stores"] += 1
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def get_stat(self) -> Dict:
+        with self._stat_lock:
+            stat = Counter(self.stat)
+        lookups = stat["hits"] + stat["misses"]
+        backend_stat = getattr(self.backend, "stat", {})
+        return {
+            "hits": stat["hits"],
+            "misses": stat["misses"],
+            "hit_rate": stat["hits"] / lookups if lookups else 0.,
+            "stores": stat["stores"],
+            "evictions": backend_stat.get("evictions", 0),
+            "expirations": backend_stat.get("expirations", 0),
+            "entries": len(self.backend),
+            "size_mb": getattr(self.backend, "size", 0) / 2 ** 20,
+        }
+
+    def clear_stat(self) -> None:
+        with self._stat_lock:
+            self.stat.clear()
+
+
+if __name__ == "__main__":
+    image = np.zeros((64, 128, 3), dtype=np.uint8)
+    assert ResultCache.hash_input(image) == ResultCache.hash_input(image.copy())
+    assert ResultCache.hash_input(image) != ResultCache.hash_input(image[:32])
+    assert ResultCache.hash_input(b"jpeg") != ResultCache.hash_input(b"png")
+    # uploads: in-memory files and mmap are hashed by their bytes, streams are not cached
+    import io
+    assert ResultCache.hash_input(io.BytesIO(b"jpeg")) == ResultCache.hash_input(b"jpeg")
+    with tempfile.TemporaryFile() as f:
+        f.write(b"jpeg")
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert ResultCache.hash_input(mapped) == ResultCache.hash_input(b"jpeg")
+        f.seek(0)
+        assert ResultCache.hash_input(f) is None and f.read() == b"jpeg"
+
+    result_cache = ResultCache(max_mb=1 / 1024, ttl=60)
+    keys = [result_cache.make_key(ResultCache.hash_input(bytes([i])), ("model", 1)) for i in range(4)]
+    assert keys[0] != result_cache.make_key(ResultCache.hash_input(bytes([0])), ("model", 2))
+    for key in keys:
+        result_cache.set(key, np.zeros(100, dtype=np.float32))
+    # 1 KB bound: the oldest entries are evicted
+    assert result_cache.get(keys[0]) is None and result_cache.get(keys[-1]) is not None
+    assert result_cache.get_stat()["evictions"] > 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        disk_cache = ResultCache(backend="disk", cache_dir=tmp_dir, max_mb=1, ttl=0.5)
+        disk_cache.set(keys[0], {"texts": ["AC4921CB"]})
+        assert ResultCache(backend="disk", cache_dir=tmp_dir).get(keys[0]) == {"texts": ["AC4921CB"]}
+        time.sleep(0.6)
+        assert disk_cache.get(keys[0]) is None and disk_cache.get_stat()["expirations"] == 1
+    print(result_cache.get_stat())
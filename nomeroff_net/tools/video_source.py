@@ -0,0 +1,248 @@
+"""
+Video file and camera stream frame source
+
+Frames are decoded by a background thread (cv2.VideoCapture over files, URLs or camera indexes)
+into a bounded queue. stride and max_fps skip frames before they are decoded (grab without retrieve),
+live streams drop the oldest queued frames when the pipeline is slower than the camera,
+files block the reader instead, so no frame is lost. Frames go to the pipeline as RGB arrays,
+results come back with FrameInfo (frame index and timestamp).
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> from nomeroff_net.tools.video_source import VideoSource
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv")
+    >>> with VideoSource("rtsp://camera/stream", max_fps=5, queue_size=16) as video:
+    ...     for frame_info, result in video.stream(number_plate_detection_and_reading, batch_size=4):
+    ...         print(frame_info.index, frame_info.timestamp_ms, result[-1])
+    ...         print(video.get_stat())
+
+python3 -m nomeroff_net.tools.video_source -f nomeroff_net/tools/video_source.py
+"""
+import time
+import threading
+import cv2
+import numpy as np
+from collections import Counter, deque, namedtuple
+from typing import Any, Callable, Dict, Iterator, Tuple, Union
+
+# index: number of the frame in the stream, timestamp_ms: position in the video (files) or since start (live),
+# wall_time: time.time() when the frame was read
+FrameInfo = namedtuple("FrameInfo", ["index", "timestamp_ms", "wall_time"])
+
+
+class VideoSource(object):
+    """
+    Iterator of RGB frames decoded in the background thread
+    """
+
+    def __init__(self,
+                 source: Union[str, int],
+                 stride: int = 1,
+                 max_fps: float = None,
+                 queue_size: int = 32,
+                 drop_oldest: bool = None,
+                 api_preference: int = cv2.CAP_ANY):
+        """
+        Args:
+            source (): video file path, stream URL (rtsp://, http://, ...) or camera index
+            stride (): every stride-th frame is decoded
+            max_fps (): max rate of decoded frames by frame timestamps, None for all frames
+            queue_size (): max count of decoded frames waiting for the pipeline
+            drop_oldest (): drop the oldest queued frame when the queue is full instead of blocking the reader,
+                            by default True for live streams (URLs and cameras) and False for files
+            api_preference (): cv2.VideoCapture backend
+        """
+        self.source = source
+        self.live = isinstance(source, int) or "://" in str(source)
+        self.stride = max(int(stride), 1)
+        self.max_fps = max_fps
+        self.queue_size = max(int(queue_size), 1)
+        self.drop_oldest = self.live if drop_oldest is None else drop_oldest
+        self.api_preference = api_preference
+
+        self.fps = 0.
+        self.stat = Counter()
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._done = False
+        self._error = None
+        self._thread = None
+        self._start_time = None
+
+    def start(self) -> "VideoSource":
+        """
+        Open the capture and start the background decoding, IOError if the source can not be opened
+        """
+        if self._thread is not None:
+            return self
+        capture = cv2.VideoCapture(self.source, self.api_preference)
+        if not capture.isOpened():
+            raise IOError(f"Can not open video source {self.source}")
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or 0.
+        self._start_time = time.time()
+        self._thread = threading.Thread(target=self._reader, args=(capture,), daemon=True)
+        self._thread.start()
+        return self
+
+    def _reader(self, capture) -> None:
+        try:
+            index = -1
+            last_timestamp = None
+            min_interval = 1000 / self.max_fps if self.max_fps else 0
+            while not self._stop_event.is_set():
+                if not capture.grab():
+                    break
+                index += 1
+                self.stat["read"] += 1
+                if index % self.stride:
+                    self.stat["skipped"] += 1
+                    continue
+                wall_time = time.time()
+                if self.live or not self.fps:
+                    timestamp = (wall_time - self._start_time) * 1000
+                else:
+                    timestamp = index / self.fps * 1000
+                if last_timestamp is not None and timestamp - last_timestamp < min_interval:
+                    self.stat["skipped"] += 1
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                last_timestamp = timestamp
+                self._put((FrameInfo(index, timestamp, wall_time), frame[..., ::-1]))
+        except Exception as e:
+            self._error = e
+        finally:
+            capture.release()
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def _put(self, item: Tuple) -> None:
+        with self._condition:
+            while (len(self._queue) >= self.queue_size and not self.drop_oldest
+                   and not self._stop_event.is_set()):
+                self._condition.wait(0.1)
+            if len(self._queue) >= self.queue_size:
+                self._queue.popleft()
+                self.stat["dropped"] += 1
+            self._queue.append(item)
+            self.stat["decoded"] += 1
+            self._condition.notify_all()
+
+    def iter_frames(self) -> Iterator[Tuple[FrameInfo, np.ndarray]]:
+        """
+        (FrameInfo, RGB frame) until the end of the video or stop(), the source is stopped when iteration ends
+        """
+        self.start()
+        try:
+            while True:
+                with self._condition:
+                    while not self._queue and not self._done:
+                        self._condition.wait()
+                    if not self._queue:
+                        break
+                    item = self._queue.popleft()
+                    self._condition.notify_all()
+                self.stat["emitted"] += 1
+                yield item
+            if self._error is not None:
+                raise self._error
+        finally:
+            self.stop()
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for _, frame in self.iter_frames():
+            yield frame
+
+    def stream(self, pipeline: Callable, batch_size: int = 1, **kwargs) -> Iterator[Tuple[FrameInfo, Any]]:
+        """
+        (FrameInfo, result) of pipeline.stream over the frames
+        """
+        frame_infos = deque()
+
+        def frames():
+            for frame_info, frame in self.iter_frames():
+                frame_infos.append(frame_info)
+                yield frame
+
+        for result in pipeline.stream(frames(), batch_size=batch_size, **kwargs):
+            yield frame_infos.popleft(), result
+
+    def stop(self, timeout: float = 1.) -> None:
+        """
+        Stop the reader thread, it is left (daemon) if grab() of a dead stream does not return in timeout seconds
+        """
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def __enter__(self) -> "VideoSource":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    def get_stat(self) -> Dict:
+        """
+        read (grabbed), skipped (stride, max_fps), decoded, dropped (queue overflow), emitted frames,
+        queue size and emitted frames per second
+        """
+        with self._condition:
+            queued = len(self._queue)
+        elapsed = time.time() - self._start_time if self._start_time else 0
+        return {
+            "read": self.stat["read"],
+            "skipped": self.stat["skipped"],
+            "decoded": self.stat["decoded"],
+            "dropped": self.stat["dropped"],
+            "emitted": self.stat["emitted"],
+            "queued": queued,
+            "source_fps": self.fps,
+            "emitted_fps": self.stat["emitted"] / elapsed if elapsed else 0.,
+        }
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, "test.avi")
+        writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (64, 48))
+        for i in range(50):
+            writer.write(np.full((48, 64, 3), i * 5, dtype=np.uint8))
+        writer.release()
+
+        # file: every frame is kept, the reader waits for the consumer
+        frames = list(VideoSource(video_path, queue_size=2))
+        assert len(frames) == 50 and frames[0].shape == (48, 64, 3)
+
+        # stride 2 keeps frames 0, 2, 4, 6, ... of the 25 fps video, max_fps=5 (200 ms) drops 2 and 4
+        # (80 and 160 ms after frame 0), so every 6th frame is decoded
+        video = VideoSource(video_path, stride=2, max_fps=5)
+        frame_infos = [frame_info for frame_info, _ in video.iter_frames()]
+        assert [frame_info.index for frame_info in frame_infos] == list(range(0, 50, 6))
+        assert frame_infos[1].timestamp_ms == 240
+
+        # drop the oldest frames of a slow consumer
+        video = VideoSource(video_path, queue_size=4, drop_oldest=True)
+        slow_frames = []
+        for frame in video:
+            time.sleep(0.01)
+            slow_frames.append(frame)
+        stat = video.get_stat()
+        assert stat["dropped"] + len(slow_frames) == 50
+
+        class EchoPipeline(object):
+            @staticmethod
+            def stream(inputs, batch_size=1):
+                for item in inputs:
+                    yield int(item[0, 0, 0])
+
+        results = list(VideoSource(video_path, stride=10).stream(EchoPipeline(), batch_size=2))
+        assert [frame_info.index for frame_info, _ in results] == [0, 10, 20, 30, 40]
+    print(stat)
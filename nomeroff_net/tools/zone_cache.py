@@ -0,0 +1,233 @@
+"""
+Zone-level OCR memoization
+
+Fixed parking and barrier cameras give near-identical plate crops frame after frame.
+ZoneCache keeps recently read texts by (OCR preset, hash of the normalized zone at the OCR input resolution).
+The default hash is a 256-bit DCT hash of the zone resized with its aspect ratio (8 x 32 low frequencies),
+it is stable under pixel noise and brightness changes, while plates that differ in one character
+are 10+ bits apart. Only equal hashes are hits by default: max_distance > 0 also matches crops
+within max_distance bits, but a one pixel shift of the crop changes about as many bits as another
+character, so it may return the text of another plate. exact=True keys zones by the digest of their pixels.
+
+Examples:
+    >>> from nomeroff_net import pipeline
+    >>> from nomeroff_net.tools.zone_cache import ZoneCache
+    >>> number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv",
+    ...                                               ocr_zone_cache=ZoneCache(max_entries=4096))
+    >>> print(number_plate_detection_and_reading.number_plate_text_reading.detector.zone_cache.get_stat())
+
+python3 -m nomeroff_net.tools.zone_cache -f nomeroff_net/tools/zone_cache.py
+"""
+import hashlib
+import threading
+import cv2
+import numpy as np
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+
+def phash(zone: np.ndarray, hash_size: Tuple[int, int] = (8, 32), highfreq_factor: int = 4) -> bytes:
+    """
+    DCT perceptual hash of hash_size (height, width) bits, aspect-preserving for plate zones,
+    of the channels first (C, H, W) normalized tensor or (H, W) gray image
+    """
+    zone = np.asarray(zone, dtype=np.float32)
+    if zone.ndim == 3:
+        zone = zone.mean(axis=0)
+    hash_height, hash_width = hash_size
+    zone = cv2.resize(zone, (hash_width * highfreq_factor, hash_height * highfreq_factor),
+                      interpolation=cv2.INTER_AREA)
+    low = cv2.dct(zone)[:hash_height, :hash_width].flatten()
+    # the DC term is the mean brightness, it does not take part in the median
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).tobytes()
+
+
+def zone_digest(zone: np.ndarray) -> bytes:
+    """
+    Exact digest of the zone pixels, shape and dtype
+    """
+    zone = np.ascontiguousarray(zone)
+    digest = hashlib.blake2b(f"{zone.shape}{zone.dtype}".encode(), digest_size=16)
+    digest.update(zone.data)
+    return digest.digest()
+
+
+def hamming_distances(hashes: np.ndarray, zone_hash: bytes) -> np.ndarray:
+    """
+    Distances of (N, words) uint64 hashes to zone_hash
+    """
+    xor = hashes ^ np.frombuffer(zone_hash, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor).sum(axis=1)
+    return np.unpackbits(xor.view(np.uint8), axis=1).sum(axis=1)
+
+
+class HashIndex(object):
+    """
+    Hashes of one namespace in a preallocated array for the distance search,
+    slots of removed hashes are reused, the array grows twice when it is full
+    """
+
+    def __init__(self, hash_bytes: int, capacity: int = 64):
+        self.hashes = np.zeros((capacity, hash_bytes // 8), dtype=np.uint64)
+        self.used = np.zeros(capacity, dtype=bool)
+        self.slots = {}
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def add(self, zone_hash: bytes) -> None:
+        if zone_hash in self.slots:
+            return
+        if not self.free:
+            capacity = len(self.used)
+            self.hashes = np.concatenate([self.hashes, np.zeros_like(self.hashes)])
+            self.used = np.concatenate([self.used, np.zeros_like(self.used)])
+            self.free = list(range(2 * capacity - 1, capacity - 1, -1))
+        slot = self.free.pop()
+        self.hashes[slot] = np.frombuffer(zone_hash, dtype=np.uint64)
+        self.used[slot] = True
+        self.slots[zone_hash] = slot
+
+    def remove(self, zone_hash: bytes) -> None:
+        slot = self.slots.pop(zone_hash)
+        self.used[slot] = False
+        self.free.append(slot)
+
+    def nearest(self, zone_hash: bytes) -> Tuple[bytes, int]:
+        distances = hamming_distances(self.hashes, zone_hash)
+        distances[~self.used] = np.iinfo(distances.dtype).max
+        slot = int(np.argmin(distances))
+        return self.hashes[slot].tobytes(), int(distances[slot])
+
+
+class ZoneCache(object):
+    """
+    LRU of texts by (namespace, zone hash), namespace is the OCR preset and its model version
+    """
+
+    def __init__(self, max_entries: int = 4096, max_distance: int = 0, exact: bool = False):
+        """
+        Args:
+            max_entries (): count of remembered zones, least recently used are evicted
+            max_distance (): max Hamming distance of hashes (of 256 bits) for a hit, 0 for equal hashes only,
+                             > 0 may return texts of other plates (see the module docstring)
+            exact (): key zones by the digest of their pixels instead of the perceptual hash
+        """
+        if exact and max_distance:
+            raise ValueError("max_distance is not used with exact=True")
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.exact = exact
+        self.entries = OrderedDict()
+        # HashIndex of every namespace for the distance search (max_distance > 0)
+        self.indexes = {}
+        self.stat = Counter()
+        self._lock = threading.Lock()
+
+    def hash_zone(self, zone: np.ndarray) -> bytes:
+        """
+        Cache key of the normalized zone (OCR input)
+        """
+        return zone_digest(zone) if self.exact else phash(zone)
+
+    def get(self, namespace: Hashable, zone_hash: bytes) -> Any:
+        with self._lock:
+            key = (namespace, zone_hash)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stat["hits"] += 1
+                return self.entries[key]
+            index = self.indexes.get(namespace)
+            if self.max_distance > 0 and index:
+                nearest_hash, distance = index.nearest(zone_hash)
+                if distance <= self.max_distance:
+                    key = (namespace, nearest_hash)
+                    self.entries.move_to_end(key)
+                    self.stat["hits"] += 1
+                    self.stat["near_hits"] += 1
+                    return self.entries[key]
+            self.stat["misses"] += 1
+            return None
+
+    def set(self, namespace: Hashable, zone_hash: bytes, value: Any) -> None:
+        with self._lock:
+            key = (namespace, zone_hash)
+            if key not in self.entries and self.max_distance > 0:
+                if namespace not in self.indexes:
+                    self.indexes[namespace] = HashIndex(len(zone_hash))
+                self.indexes[namespace].add(zone_hash)
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                (old_namespace, old_hash), _ = self.entries.popitem(last=False)
+                if old_namespace in self.indexes:
+                    self.indexes[old_namespace].remove(old_hash)
+                self.stat["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.indexes.clear()
+
+    def get_stat(self) -> Dict:
+        with self._lock:
+            lookups = self.stat["hits"] + self.stat["misses"]
+            return {
+                "hits": self.stat["hits"],
+                "near_hits": self.stat["near_hits"],
+                "misses": self.stat["misses"],
+                "hit_rate": self.stat["hits"] / lookups if lookups else 0.,
+                "evictions": self.stat["evictions"],
+                "entries": len(self.entries),
+                "max_distance": self.max_distance,
+            }
+
+    def clear_stat(self) -> None:
+        with self._lock:
+            self.stat.clear()
+
+
+if __name__ == "__main__":
+    def make_zone(text):
+        image = np.full((50, 200), 255, dtype=np.uint8)
+        cv2.putText(image, text, (6, 38), cv2.FONT_HERSHEY_SIMPLEX, 1.05, 0, 3)
+        return (image.astype(np.float32) / 255 - 0.5)[None].repeat(3, axis=0)
+
+    rng = np.random.default_rng(0)
+    zone = make_zone("AC4921CB")
+    noisy_zone = zone + rng.normal(0, 0.01, zone.shape).astype(np.float32)
+    zone_hash, noisy_hash = phash(zone), phash(noisy_zone)
+    assert len(zone_hash) == 32 and noisy_hash == zone_hash
+    # plates that differ in one character do not share the hash
+    for text, other_text in [("AC4921CB", "AC4927CB"), ("AC4921CB", "AC4321CB"), ("BC0001KE", "BC0081KE")]:
+        distance = hamming_distances(np.frombuffer(phash(make_zone(text)), dtype=np.uint64)[None],
+                                     phash(make_zone(other_text)))[0]
+        assert distance >= 8, (text, other_text, distance)
+    other_hash = phash(make_zone("BC0081KE"))
+
+    zone_cache = ZoneCache(max_entries=2)
+    zone_cache.set(("eu", 1), zone_cache.hash_zone(zone), "AC4921CB")
+    assert zone_cache.get(("eu", 1), zone_cache.hash_zone(noisy_zone)) == "AC4921CB"
+    assert zone_cache.get(("eu", 1), phash(make_zone("AC4927CB"))) is None
+    assert zone_cache.get(("eu", 2), zone_hash) is None and zone_cache.get(("eu", 1), other_hash) is None
+    zone_cache.set(("eu", 1), other_hash, "BC0081KE")
+    zone_cache.set(("kz", 1), other_hash, "123ABC02")
+    assert zone_cache.get(("eu", 1), zone_hash) is None and zone_cache.get_stat()["evictions"] == 1
+
+    # near matching: hashes are kept in the preallocated index, slots of evicted hashes are reused
+    near_cache = ZoneCache(max_entries=100, max_distance=4)
+    hashes = [phash(rng.random((3, 50, 200), dtype=np.float32)) for _ in range(150)]
+    for i, near_hash in enumerate(hashes):
+        near_cache.set("eu", near_hash, i)
+    assert len(near_cache.indexes["eu"]) == 100 and len(near_cache.indexes["eu"].used) == 128
+    flipped = bytes([hashes[-1][0] ^ 1]) + hashes[-1][1:]
+    assert near_cache.get("eu", flipped) == 149 and near_cache.get("eu", hashes[0]) is None
+
+    exact_cache = ZoneCache(exact=True)
+    exact_cache.set("eu", exact_cache.hash_zone(zone), "AC4921CB")
+    assert exact_cache.get("eu", exact_cache.hash_zone(zone.copy())) == "AC4921CB"
+    assert exact_cache.get("eu", exact_cache.hash_zone(noisy_zone)) is None
+    print(zone_cache.get_stat(), near_cache.get_stat())
@@ -0,0 +1,111 @@
+"""
+Memory of pre-fork workers: every worker loads its own models ("load-in-worker")
+vs models are loaded in the master and shared after fork ("preload", see nomeroff_net.tools.fork_tools).
+Total PSS (shared pages are divided between processes) of the master and workers is reported, Linux only.
+
+python3 tutorials/py/benchmark/fork-rss-test.py -w 4
+python3 tutorials/py/benchmark/fork-rss-test.py -w 4 --dummy_model resnet50  # no model downloads
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+import multiprocessing
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+nomeroff_net_dir = os.path.join(current_dir, "../../../")
+sys.path.append(nomeroff_net_dir)
+
+from nomeroff_net.tools.fork_tools import prepare_fork, get_memory_stat
+from nomeroff_net.tools.model_registry import model_registry
+
+warnings.filterwarnings("ignore")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-w", "--num_workers", default=4,
+                    required=False, type=int, help="Number of forked workers")
+    ap.add_argument("-p", "--pipeline_name", default="number_plate_detection_and_reading",
+                    required=False, type=str, help="Pipeline name")
+    ap.add_argument("-i", "--image_path", default="./data/examples/oneline_images/example1.jpeg",
+                    required=False, type=str, help="Image for one inference in every worker")
+    ap.add_argument("--dummy_model", default=None,
+                    required=False, type=str, help="torchvision model with random weights instead of the pipeline")
+    kwargs = vars(ap.parse_args())
+    return kwargs
+
+
+def load(pipeline_name, dummy_model):
+    if dummy_model is not None:
+        import torch
+        from torchvision import models
+
+        model = model_registry.acquire(model_registry.make_key(dummy_model, "random"),
+                                       lambda: getattr(models, dummy_model)())
+        return lambda _: model(torch.rand(1, 3, 224, 224))
+    from nomeroff_net import pipeline
+    return pipeline(pipeline_name, image_loader="opencv")
+
+
+def worker(preloaded, pipeline_name, dummy_model, image_path, started, results):
+    import torch
+
+    with torch.no_grad():
+        start_time = time.perf_counter()
+        runner = preloaded or load(pipeline_name, dummy_model)
+        load_time = time.perf_counter() - start_time
+        runner([image_path])
+    started.wait()
+    results.put({"pid": os.getpid(), "load_time": load_time, "threads": torch.get_num_threads(),
+                 **get_memory_stat()})
+    # keep the process alive until the master reads the memory of all workers
+    started.wait()
+
+
+def run(mode, num_workers, pipeline_name, dummy_model, image_path):
+    context = multiprocessing.get_context("fork")
+    preloaded = None
+    master_load_time = 0
+    if mode == "preload":
+        start_time = time.perf_counter()
+        preloaded = load(pipeline_name, dummy_model)
+        master_load_time = time.perf_counter() - start_time
+        prepare_fork(num_threads=1)
+    started = context.Barrier(num_workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=worker,
+                                 args=(preloaded, pipeline_name, dummy_model, image_path, started, results))
+                 for _ in range(num_workers)]
+    for process in processes:
+        process.start()
+    started.wait()
+    workers = [results.get() for _ in processes]
+    master = get_memory_stat()
+    started.wait()
+    for process in processes:
+        process.join()
+    mb = 2 ** 20
+    total_pss = (master["pss"] + sum(w["pss"] for w in workers)) / mb
+    print(f"{mode}: {num_workers} workers, "
+          f"total PSS {total_pss:.0f} MB, "
+          f"master RSS {master['rss'] / mb:.0f} MB, "
+          f"worker RSS {sum(w['rss'] for w in workers) / num_workers / mb:.0f} MB, "
+          f"worker USS {sum(w['uss'] for w in workers) / num_workers / mb:.0f} MB, "
+          f"load time master {master_load_time:.2f}s / worker {max(w['load_time'] for w in workers):.2f}s")
+
+
+def main(num_workers, pipeline_name, image_path, dummy_model=None, **_):
+    if not os.path.isabs(image_path):
+        image_path = os.path.join(nomeroff_net_dir, image_path)
+    # preload changes the master, so every mode is measured in a fresh master process
+    for mode in ["load-in-worker", "preload"]:
+        master = multiprocessing.get_context("fork").Process(
+            target=run, args=(mode, num_workers, pipeline_name, dummy_model, image_path))
+        master.start()
+        master.join()
+
+
+if __name__ == '__main__':
+    main(**parse_args())
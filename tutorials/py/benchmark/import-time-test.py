@@ -0,0 +1,77 @@
+"""
+Import time regression test: `import nomeroff_net` must not import heavy modules
+and must take less than --max_seconds (median of --num_run fresh interpreters).
+
+python3 tutorials/py/benchmark/import-time-test.py -n 5 -m 1.0
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+nomeroff_net_dir = os.path.abspath(os.path.join(current_dir, "../../../"))
+
+HEAVY_MODULES = [
+    "torch",
+    "torchvision",
+    "pytorch_lightning",
+    "ultralytics",
+    "albumentations",
+    "scipy",
+    "matplotlib",
+    "cv2",
+    "gevent",
+    "modelhub_client",
+]
+
+IMPORT_CODE = """
+import sys, time, json
+start_time = time.perf_counter()
+import {module}
+{extra}
+print(json.dumps({{"time": time.perf_counter() - start_time, "modules": sorted(sys.modules)}}))
+"""
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--num_run", default=5,
+                    required=False, type=int, help="Number of fresh interpreters")
+    ap.add_argument("-m", "--max_seconds", default=1.0,
+                    required=False, type=float, help="Max median import time")
+    kwargs = vars(ap.parse_args())
+    return kwargs
+
+
+def measure(module, extra=""):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([nomeroff_net_dir, os.environ.get("PYTHONPATH", "")]))
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_CODE.format(module=module, extra=extra)],
+                                     env=env, cwd=nomeroff_net_dir)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main(num_run, max_seconds, **_):
+    checks = [
+        ("nomeroff_net", ""),
+        ("nomeroff_net", "from nomeroff_net import pipeline"),
+        ("nomeroff_net.tools", "from nomeroff_net.tools import unzip, modelhub"),
+    ]
+    failed = False
+    for module, extra in checks:
+        results = [measure(module, extra) for _ in range(num_run)]
+        median_time = statistics.median(result["time"] for result in results)
+        heavy = [name for name in HEAVY_MODULES if name in results[0]["modules"]]
+        print(f"import {module}; {extra or 'pass'}: {median_time:.3f}s (median of {num_run})"
+              f"{', heavy modules: ' + ', '.join(heavy) if heavy else ''}")
+        if heavy or median_time > max_seconds:
+            failed = True
+    if failed:
+        print(f"FAILED: import must be lazy and take less than {max_seconds}s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(**parse_args())
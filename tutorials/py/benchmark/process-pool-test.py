@@ -0,0 +1,63 @@
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+nomeroff_net_dir = os.path.join(current_dir, "../../../")
+sys.path.append(nomeroff_net_dir)
+
+import time
+import warnings
+import argparse
+from glob import glob
+
+from nomeroff_net.pipelines.process_pool import ProcessPoolPipeline
+
+
+warnings.filterwarnings("ignore")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-p", "--pipeline_name", default="number_plate_detection_and_reading",
+                    required=False, type=str, help="Pipeline name")
+    ap.add_argument("-l", "--image_loader_name", default="opencv",
+                    required=False, type=str, help="Image loader name")
+    ap.add_argument("-g", "--images_glob", default="./data/examples/benchmark_oneline_np_images/*",
+                    required=False, type=str, help="Images glob path")
+    ap.add_argument("-n", "--num_run", default=1,
+                    required=False, type=int, help="Number loops")
+    ap.add_argument("-b", "--batch_size", default=1,
+                    required=False, type=int, help="Batch size")
+    ap.add_argument("-w", "--num_processes", default="1,2,4",
+                    required=False, type=str, help="Comma separated list of worker processes counts")
+    kwargs = vars(ap.parse_args())
+    return kwargs
+
+
+def main(pipeline_name, image_loader_name, images_glob, num_run, batch_size, num_processes, **_):
+    if os.path.isabs(images_glob):
+        images = glob(images_glob)
+    else:
+        images = glob(os.path.join(nomeroff_net_dir, images_glob))
+
+    for processes in [int(p) for p in str(num_processes).split(",")]:
+        with ProcessPoolPipeline(pipeline_name, image_loader=image_loader_name,
+                                 num_processes=processes) as number_plate_detection_and_reading:
+            start_time = time.perf_counter()
+            for _ in range(num_run):
+                number_plate_detection_and_reading(images, batch_size=batch_size,
+                                                   fields=["bboxs", "confidences", "texts"])
+            total_time = time.perf_counter() - start_time
+
+            print(f"num_processes={processes}")
+            print(f"Processed {len(images) * num_run} photos, {len(images) * num_run / total_time:.2f} photos/s")
+            for worker_id, stat in number_plate_detection_and_reading.get_stat().items():
+                print(f"worker {worker_id} pid={stat['pid']} state={stat['state']} "
+                      f"load_time={stat['load_time']:.2f}s images={stat['images']} "
+                      f"busy_images_per_second={stat['busy_images_per_second']:.2f} "
+                      f"utilization={stat['utilization']:.2f}")
+            print()
+
+
+if __name__ == '__main__':
+    main(**parse_args())
@@ -29,16 +29,23 @@ def parse_args():
     ap.add_argument("-n", "--num_run", default=1,
                     required=False, type=int, help="Number loops")
     ap.add_argument("-b", "--batch_size", default=1,
-                    required=False, type=int, help="Batch size")
-    ap.add_argument("-w", "--num_workers", default=1,
-                    required=False, type=int, help="Number worker for parallel processing "
-                                                   "preprocess and postprocess functions")
+                    required=False, type=int, help="Batch size, the same for all num_workers, "
+                                                   "raised to the max of num_workers")
+    ap.add_argument("-w", "--num_workers", default="1",
+                    required=False, type=str, help="Number worker for parallel processing "
+                                                   "preprocess and postprocess functions, "
+                                                   "comma separated list (for example 1,2,4,8) "
+                                                   "to show scaling with num_workers")
+    ap.add_argument("-e", "--executor", default="thread",
+                    required=False, type=str, help="Executor for parallel processing "
+                                                   "preprocess and postprocess functions: "
+                                                   "thread or gevent")
     kwargs = vars(ap.parse_args())
     return kwargs
 
 
 def main(pipeline_name, image_loader_name, images_glob,
-         num_run, batch_size, num_workers,  **_):
+         num_run, batch_size, num_workers, executor="thread", **_):
     number_plate_detection_and_reading = pipeline(
         pipeline_name,
         image_loader=image_loader_name
@@ -49,21 +56,34 @@ def main(pipeline_name, image_loader_name, images_glob,
     else:
         images = glob(os.path.join(nomeroff_net_dir, images_glob))
 
-    number_plate_detection_and_reading.clear_stat()
-    for i in range(num_run):
-        number_plate_detection_and_reading(images,
-                                           batch_size=batch_size,
-                                           num_workers=num_workers)
-    timer_stat = number_plate_detection_and_reading.get_timer_stat(len(images) * num_run)
-    timer_stat["count_photos"] = len(images)
+    workers_list = [int(w) for w in str(num_workers).split(",")]
+    # the same batch size for every num_workers (it must be >= num_workers), so only parallelism changes
+    batch_size = max(batch_size, *workers_list)
+    for workers in workers_list:
+        number_plate_detection_and_reading.clear_stat()
+        for i in range(num_run):
+            number_plate_detection_and_reading(images,
+                                               batch_size=batch_size,
+                                               num_workers=workers,
+                                               executor=executor)
+        timer_stat = number_plate_detection_and_reading.get_timer_stat(len(images) * num_run)
+        timer_stat["count_photos"] = len(images)
 
-    # print timer stat result
-    print(f"Processed {timer_stat['count_photos']} photos")
-    print(f"One photo process {timer_stat['NumberPlateDetectionAndReadingRuntime.call']} seconds")
-    print()
-    print(f"detect_bbox_time_all {timer_stat['NumberPlateLocalization.call']} per one photo")
-    print(f"classification_time_all {timer_stat['NumberPlateClassification.call']} per one photo")
-    print(f"ocr_time_all {timer_stat['NumberPlateTextReading.call']} per one photo")
+        # print timer stat result
+        print(f"num_workers={workers} batch_size={batch_size} executor={executor}")
+        print(f"Processed {timer_stat['count_photos']} photos")
+        print(f"One photo process {timer_stat['NumberPlateDetectionAndReadingRuntime.call']} seconds")
+        print()
+        print(f"detect_bbox_time_all {timer_stat['NumberPlateLocalization.call']} per one photo")
+        print(f"classification_time_all {timer_stat['NumberPlateClassification.call']} per one photo")
+        print(f"ocr_time_all {timer_stat['NumberPlateTextReading.call']} per one photo")
+        print()
+        print("stage latency (seconds): p50 / p95 / p99 / max")
+        for stage, batch_sizes in number_plate_detection_and_reading.get_latency_stat().items():
+            for stage_batch_size, stat in batch_sizes.items():
+                print(f"{stage} batch_size={stage_batch_size} "
+                      f"{stat['p50']:.4f} / {stat['p95']:.4f} / {stat['p99']:.4f} / {stat['max']:.4f}")
+        print()
 
 
 if __name__ == '__main__':
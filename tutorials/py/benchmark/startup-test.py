@@ -0,0 +1,80 @@
+"""
+Startup time of OCR and options models: pytorch-lightning load_from_checkpoint (fast_load=False)
+vs state dict load without pretrained backbone init (fast_load=True)
+
+python3 tutorials/py/benchmark/startup-test.py -n 3
+"""
+import os
+import sys
+import copy
+import time
+import argparse
+import statistics
+import warnings
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+nomeroff_net_dir = os.path.join(current_dir, "../../../")
+sys.path.append(nomeroff_net_dir)
+
+from nomeroff_net.tools.mcm import modelhub
+from nomeroff_net.pipelines.number_plate_text_reading import DEFAULT_PRESETS
+from nomeroff_net.pipes.number_plate_text_readers.base.ocr import OCR
+from nomeroff_net.pipes.number_plate_classificators.options_detector import OptionsDetector
+
+warnings.filterwarnings("ignore")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--num_run", default=3,
+                    required=False, type=int, help="Number loads of every model")
+    ap.add_argument("-p", "--presets", default=",".join(DEFAULT_PRESETS),
+                    required=False, type=str, help="Comma separated OCR presets")
+    kwargs = vars(ap.parse_args())
+    return kwargs
+
+
+def load_ocr(preset_name, fast_load):
+    model_conf = copy.deepcopy(modelhub.models[preset_name])
+    detector = OCR(model_name=preset_name, letters=model_conf["letters"],
+                   linear_size=model_conf["linear_size"], max_text_len=model_conf["max_text_len"],
+                   height=model_conf["height"], width=model_conf["width"],
+                   color_channels=model_conf["color_channels"],
+                   hidden_size=model_conf["hidden_size"], backbone=model_conf["backbone"])
+    detector.load("latest", fast_load=fast_load)
+    return detector
+
+
+def load_options(fast_load):
+    detector = OptionsDetector()
+    detector.load("latest", fast_load=fast_load)
+    return detector
+
+
+def measure(load, num_run):
+    times = []
+    for _ in range(num_run):
+        start_time = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+
+def main(num_run, presets, **_):
+    loaders = [(name, lambda fast_load, name=name: load_ocr(name, fast_load)) for name in presets.split(",")]
+    loaders.append(("numberplate_options", load_options))
+    # download models before timing
+    for _, load in loaders:
+        load(True)
+    total_slow = total_fast = 0
+    for name, load in loaders:
+        slow = measure(lambda: load(False), num_run)
+        fast = measure(lambda: load(True), num_run)
+        total_slow += slow
+        total_fast += fast
+        print(f"{name}: load_from_checkpoint {slow:.3f}s, fast load {fast:.3f}s")
+    print(f"total: load_from_checkpoint {total_slow:.3f}s, fast load {total_fast:.3f}s")
+
+
+if __name__ == '__main__':
+    main(**parse_args())
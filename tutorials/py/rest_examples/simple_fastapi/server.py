@@ -11,10 +11,10 @@ REQUEST '/detect' location: curl --header "Content-Type: application/json" \
 import os
 import cv2
 import sys
+import asyncio
 import traceback
 import uvicorn
 import ujson
-import numpy as np
 from fastapi import FastAPI, File, UploadFile
 from starlette_prometheus import PrometheusMiddleware
 from starlette_prometheus import metrics
@@ -43,18 +43,18 @@ def version():
 
 
 @app.post('/detect_from_bytes')
-def detect_from_bytes(files: List[UploadFile] = File(...)):
+async def detect_from_bytes(files: List[UploadFile] = File(...)):
     images = []
     for file in files:
         try:
-            img = cv2.imdecode(np.frombuffer(file.file.read(), dtype=np.uint8), 1)
-            images.append(img[:, :, ::-1])
+            # encoded bytes are decoded once by the image loader of the pipeline
+            images.append(await file.read())
         except Exception:
             return ujson.dumps({"error": "There was an error uploading the file(s)"})
         finally:
-            file.file.close()
+            await file.close()
     try:
-        result = number_plate_detection_and_reading(images)
+        result = await number_plate_detection_and_reading.acall(images)
         (images, images_bboxs,
          images_points, images_zones, region_ids,
          region_names, count_lines,
@@ -67,11 +67,13 @@ def detect_from_bytes(files: List[UploadFile] = File(...)):
 
 
 @app.post('/detect')
-def detect(data: Dict):
+async def detect(data: Dict):
     img_path = data['path']
     try:
-        img = cv2.imread(img_path)[:, :, ::-1]
-        result = number_plate_detection_and_reading([img])
+        # file reading and decoding are blocking, they run in the default executor of the loop
+        img = await asyncio.get_running_loop().run_in_executor(None, cv2.imread, img_path)
+        img = img[:, :, ::-1]
+        result = await number_plate_detection_and_reading.acall([img])
         (images, images_bboxs,
          images_points, images_zones, region_ids,
          region_names, count_lines,
@@ -0,0 +1,18 @@
+"""
+Gunicorn pre-fork config: models are loaded once in the master and shared by all workers
+
+EXAMPLE RUN:
+gunicorn -c gunicorn.conf.py server:app
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8888)}"
+workers = int(os.environ.get("WORKERS", 16))
+# import server.py (and load models) in the master before fork
+preload_app = True
+
+
+def when_ready(server):
+    from nomeroff_net.tools.fork_tools import prepare_fork
+    info = prepare_fork(num_threads=int(os.environ.get("TORCH_NUM_THREADS", 1)))
+    server.log.info(f"nomeroff_net models are shared with workers: {info}")
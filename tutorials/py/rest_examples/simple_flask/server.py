@@ -4,7 +4,11 @@ Flask REST API
 EXAMPLE RUN:
 CUDA_DEVICE_ORDER=PCI_BUS_ID CUDA_VISIBLE_DEVICES=0 python3 ./server.py
 
+PRE-FORK RUN (models are loaded once and shared by all workers):
+gunicorn -c gunicorn.conf.py server:app
+
 REQUEST '/version' location: curl 127.0.0.1:8888/version
+REQUEST '/ready' location: curl 127.0.0.1:8888/ready
 REQUEST '/detect' location: curl --header "Content-Type: application/json" \
                                  --request GET --data \
                                  '{"path": "../../../examples/images/example1.jpeg"}' 127.0.0.1:8888/detect
@@ -27,6 +31,7 @@ from nomeroff_net.tools import unzip
 
 print("[INFO], nomeroff net root dir", nomeroff_net_dir)
 number_plate_detection_and_reading = pipeline("number_plate_detection_and_reading", image_loader="opencv")
+print("[INFO], warm-up", number_plate_detection_and_reading.warmup(image_sizes=[(1080, 1920)], batch_sizes=[1]))
 
 csrf = CSRFProtect()
 app = Flask(__name__)
@@ -37,6 +42,13 @@ def version():
     return __version__
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    if number_plate_detection_and_reading.warmed_up:
+        return "ok"
+    return "warming up", 503
+
+
 @app.route('/detect', methods=['GET'])
 def detect():
     data = request.get_json()